@@ -4,11 +4,20 @@ Catch standard and error outputs with custom functions.
 import os
 import sys
 import time
+import queue
+import atexit
+import threading
 
 _SOUT = None
 _SERR = None
 LOG_STD_NAME = 'a2.log'
 SEP = ' - '
+# Messages are collected and written in batches by a background thread.
+FLUSH_INTERVAL = 0.5
+MAX_QUEUED = 10000
+# Rotate the log file when it gets bigger than this. Keeping a few old ones.
+MAX_LOG_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
 
 
 def connect(write_func):
@@ -65,8 +74,25 @@ class _OutputWrangler(object):
         pass
 
 
+def _report(msg):
+    """Tell the original stderr. Not the wrapped one, that would loop back into the log."""
+    stream = sys.__stderr__
+    if stream is None:
+        return
+    try:
+        stream.write(msg)
+    except (OSError, ValueError):
+        pass
+
+
 class A2Logger:
-    """Handles all output to be written to one log with timestamps."""
+    """
+    Handles all output to be written to one log with timestamps.
+
+    Writing happens in batches on a background thread. If more than
+    `MAX_QUEUED` messages pile up newer ones are dropped and counted.
+    Messages that could not be written count as dropped as well.
+    """
 
     _instance = None
 
@@ -91,8 +117,15 @@ class A2Logger:
         self._reuse = reuse
         self._data_path = None
         self._path = None
+        self._queue = queue.Queue(MAX_QUEUED)
+        self._dropped = 0
+        self._write_lock = threading.Lock()
+        self._failing = False
+        self._thread = threading.Thread(target=self._write_loop, name='A2Logger', daemon=True)
+        self._thread.start()
         connect(self._write_msg)
         connect_error(self._write_msg)
+        atexit.register(self._try_flush)
 
     @staticmethod
     def _now():
@@ -105,13 +138,80 @@ class A2Logger:
         if not msg.endswith('\n'):
             msg += '\n'
 
-        with open(self.path, 'a', encoding='utf8') as file_obj:
-            file_obj.write(f'{self._now()}{SEP}{msg}')
+        try:
+            self._queue.put_nowait(f'{self._now()}{SEP}{msg}')
+        except queue.Full:
+            with self._write_lock:
+                self._dropped += 1
+
+    def _write_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self._try_flush()
+
+    def _try_flush(self):
+        """`flush` but keep going if the log can't be written. Tell stderr once."""
+        try:
+            self.flush()
+        except OSError as error:
+            if not self._failing:
+                _report(f'Could not write the log: {error}\n')
+                self._failing = True
+            return
+        if self._failing:
+            _report(f'Writing the log to "{self.path}" again.\n')
+            self._failing = False
+
+    def flush(self):
+        """Write all queued messages to the log file now."""
+        with self._write_lock:
+            lines = []
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            dropped, written = self._dropped, len(lines)
+            if dropped:
+                lines.append(f'{self._now()}{SEP}... {dropped} messages dropped!\n')
+                self._dropped = 0
+            if not lines:
+                return
+
+            try:
+                path = self.path
+                self._rotate(path)
+                with open(path, 'a', encoding='utf8') as file_obj:
+                    file_obj.write(''.join(lines))
+            except OSError:
+                # Lost. Mentioned with the next lines that make it.
+                self._dropped += dropped + written
+                raise
+
+    @staticmethod
+    def _rotate(path):
+        """Shift `log` to `log.1`, `log.1` to `log.2` ... if it got too big."""
+        try:
+            if os.path.getsize(path) < MAX_LOG_BYTES:
+                return
+        except OSError:
+            return
+
+        try:
+            for i in range(LOG_BACKUPS - 1, 0, -1):
+                older = f'{path}.{i}'
+                if os.path.isfile(older):
+                    os.replace(older, f'{path}.{i + 1}')
+            os.replace(path, f'{path}.1')
+        except OSError:
+            # Held open elsewhere, as Windows won't let go. Keep appending, try again later.
+            return
 
     def set_data_path(self, data_path):
         """
         Route the logging to a given directory.
         """
+        self.flush()
         self._data_path = data_path
         self._path = os.path.join(self._data_path, self.log_name)
         if not self._reuse:
@@ -0,0 +1,413 @@
+"""
+Turn a recorded video into an animated GIF, APNG or WebP.
+
+GIF & APNG: The video is decoded twice through ffmpeg. The first pass
+collects a color histogram for one palette shared by all frames, the second
+maps every frame onto it. Each frame only keeps the rectangle that changed
+since the one before, with unchanged pixels in there set transparent.
+Unchanged frames just lengthen the one before. Frames are then compressed in
+chunks on a process pool and written in order.
+
+The palette work needs NumPy. Without it ffmpeg's palettegen/paletteuse and
+apng encoder do the job. Animated WebP always goes through ffmpeg.
+
+No Qt in here so the pool workers stay lean. Pool workers are spawned and
+import the main module again. So from the Qt app this runs in its own
+process with this as the main module, see `command`:
+
+    python anim_export.py ffmpeg video.mp4 out.gif --size 640x480 [--fps 10]
+"""
+import os
+import sys
+import time
+import argparse
+import zlib
+import struct
+import subprocess
+import multiprocessing
+from concurrent import futures
+
+import common
+import video_backends
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = common.get_logger(f'{common.NAME}.anim_export')
+GIF = 'GIF'
+APNG = 'APNG'
+WEBP = 'WebP'
+# Format name: file suffix.
+FORMATS = {GIF: 'gif', APNG: 'png', WEBP: 'webp'}
+MAX_FPS = 20
+MIN_COLORS = 8
+# Palette bins are 5 bits per channel.
+BIN_BITS = 5
+# Only every n-th pixel per axis goes into the histogram.
+HISTOGRAM_STEP = 2
+# Frames per job on the process pool.
+CHUNK_FRAMES = 8
+POOL_SIZE = max(1, (os.cpu_count() or 2) - 1)
+
+
+def format_from_path(file_path, default=GIF):
+    # type: (str, str | None) -> str | None
+    """Format by file suffix. `default` if there's no known one."""
+    suffix = os.path.splitext(file_path)[1].lower().lstrip('.')
+    for name, fmt_suffix in FORMATS.items():
+        if suffix == fmt_suffix or (name == APNG and suffix == 'apng'):
+            return name
+    return default
+
+
+def command(ffmpeg, video_path, file_path, size, fmt=None, quality=80, fps=10):
+    # type: (str, str, str, tuple[int, int], str | None, int, int) -> list[str]
+    """Arguments to run `export` in a process of its own."""
+    args = [sys.executable, os.path.abspath(__file__), ffmpeg, video_path, file_path]
+    args += ['--size', '%ix%i' % size, '--quality', str(quality), '--fps', str(fps)]
+    if fmt:
+        args += ['--format', fmt]
+    return args
+
+
+def colors_for_quality(quality):
+    """Palette size for a quality of 1 to 100. One index stays free for transparency."""
+    quality = max(1, min(int(quality), 100))
+    return max(MIN_COLORS, min(255, round(255 * quality / 100)))
+
+
+def export(ffmpeg, video_path, file_path, size, fmt=None, quality=80, fps=10):
+    # type: (str, str, str, tuple[int, int], str | None, int, int) -> float
+    """Write `video_path` as animation to `file_path`. Returns the seconds it took."""
+    t0 = time.perf_counter()
+    fmt = fmt or format_from_path(file_path)
+    fps = max(1, min(int(fps), MAX_FPS))
+    if fmt == WEBP or numpy is None:
+        _export_ffmpeg(ffmpeg, video_path, file_path, fmt, quality, fps)
+    else:
+        _export_numpy(ffmpeg, video_path, file_path, size, fmt, quality, fps)
+    seconds = time.perf_counter() - t0
+    log.info('%s written in %.2f s: "%s"', fmt, seconds, file_path)
+    return seconds
+
+
+def _export_ffmpeg(ffmpeg, video_path, file_path, fmt, quality, fps):
+    args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', video_path]
+    if fmt == WEBP:
+        args += ['-vf', f'fps={fps}', '-c:v', 'libwebp_anim', '-lossless', '0']
+        args += ['-q:v', str(max(1, min(int(quality), 100))), '-loop', '0']
+    elif fmt == APNG:
+        args += ['-vf', f'fps={fps}', '-f', 'apng', '-plays', '0']
+    else:
+        colors = colors_for_quality(quality)
+        graph = (
+            f'fps={fps},split[a][b];[a]palettegen=max_colors={colors}:stats_mode=diff[p];'
+            '[b][p]paletteuse=dither=none:diff_mode=rectangle'
+        )
+        args += ['-filter_complex', graph, '-loop', '0']
+    subprocess.run(
+        args + [file_path], stdin=subprocess.DEVNULL, check=True, **video_backends.hidden_window()
+    )
+
+
+def _export_numpy(ffmpeg, video_path, file_path, size, fmt, quality, fps):
+    width, height = size
+    palette = _build_palette(_decode(ffmpeg, video_path, size, fps), colors_for_quality(quality))
+    lut = _palette_lut(palette)
+    transparent = len(palette)
+    writer = _GifWriter if fmt == GIF else _ApngWriter
+
+    with open(file_path, 'wb') as file_obj:
+        out = writer(file_obj, width, height, palette, transparent)
+        frames = _delta_frames(_decode(ffmpeg, video_path, size, fps), lut, transparent, fps)
+        context = multiprocessing.get_context('spawn')
+        with futures.ProcessPoolExecutor(POOL_SIZE, mp_context=context) as pool:
+            pending = []
+            for chunk in _chunks(frames, CHUNK_FRAMES):
+                crops = [(crop.tobytes(), crop.shape[1], crop.shape[0]) for _, _, crop, _ in chunk]
+                pending.append((chunk, pool.submit(_encode_chunk, fmt, crops)))
+                # Keep memory in check: only a few chunks in flight.
+                while len(pending) > POOL_SIZE * 2:
+                    _write_chunk(out, *pending.pop(0))
+            for chunk, job in pending:
+                _write_chunk(out, chunk, job)
+        out.close()
+
+
+def _write_chunk(out, chunk, job):
+    for (x, y, crop, delay), data in zip(chunk, job.result()):
+        out.add_frame(x, y, crop.shape[1], crop.shape[0], delay, data)
+
+
+def _decode(ffmpeg, video_path, size, fps):
+    """Yield the video frames at `fps` as height x width x 3 uint8 arrays."""
+    width, height = size
+    frame_size = width * height * 3
+    args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', video_path]
+    args += ['-vf', f'fps={fps}', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+    process = subprocess.Popen(
+        args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, **video_backends.hidden_window()
+    )
+    try:
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            yield numpy.frombuffer(data, numpy.uint8).reshape(height, width, 3)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+def _bin_keys(rgb):
+    shift = 8 - BIN_BITS
+    rgb = (rgb >> shift).astype(numpy.uint16)
+    return (rgb[..., 0] << (2 * BIN_BITS)) | (rgb[..., 1] << BIN_BITS) | rgb[..., 2]
+
+
+def _build_palette(frames, colors):
+    """Most used color bins over all frames, each as the mean color that fell in."""
+    bins = 1 << (3 * BIN_BITS)
+    counts = numpy.zeros(bins, numpy.int64)
+    sums = numpy.zeros((bins, 3), numpy.float64)
+    for rgb in frames:
+        sample = rgb[::HISTOGRAM_STEP, ::HISTOGRAM_STEP].reshape(-1, 3)
+        keys = _bin_keys(sample)
+        counts += numpy.bincount(keys, minlength=bins)
+        for channel in range(3):
+            sums[:, channel] += numpy.bincount(keys, sample[:, channel], minlength=bins)
+
+    used = numpy.flatnonzero(counts)
+    top = used[numpy.argsort(counts[used])[::-1][:colors]]
+    if not len(top):
+        return numpy.zeros((1, 3), numpy.uint8)
+    return numpy.round(sums[top] / counts[top, None]).astype(numpy.uint8)
+
+
+def _palette_lut(palette):
+    """Nearest palette index for every color bin."""
+    shift = 8 - BIN_BITS
+    keys = numpy.arange(1 << (3 * BIN_BITS))
+    mask = (1 << BIN_BITS) - 1
+    centers = numpy.stack(
+        [(keys >> (2 * BIN_BITS)) & mask, (keys >> BIN_BITS) & mask, keys & mask], axis=1
+    )
+    centers = (centers << shift) + (1 << shift) // 2
+    colors = palette.astype(numpy.int32)
+    lut = numpy.empty(len(keys), numpy.uint8)
+    # In blocks to not build one huge bins x colors x 3 array.
+    step = 4096
+    for start in range(0, len(keys), step):
+        block = centers[start : start + step, None, :] - colors[None, :, :]
+        lut[start : start + step] = numpy.argmin((block * block).sum(axis=2), axis=1)
+    return lut
+
+
+def _delta_frames(frames, lut, transparent, fps):
+    """
+    Yield (x, y, indexed crop, delay in seconds) for frames that changed.
+    The first frame is always complete.
+    """
+    previous = None
+    pending = None
+    for rgb in frames:
+        indexed = lut[_bin_keys(rgb)]
+        if previous is None:
+            pending = [0, 0, indexed, 1.0 / fps]
+            previous = indexed
+            continue
+
+        changed = indexed != previous
+        rows = numpy.flatnonzero(changed.any(axis=1))
+        if not len(rows):
+            pending[3] += 1.0 / fps
+            continue
+        cols = numpy.flatnonzero(changed.any(axis=0))
+        y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        crop = indexed[y0:y1, x0:x1].copy()
+        crop[~changed[y0:y1, x0:x1]] = transparent
+        yield tuple(pending)
+        pending = [int(x0), int(y0), crop, 1.0 / fps]
+        previous = indexed
+    if pending is not None:
+        yield tuple(pending)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _encode_chunk(fmt, crops):
+    # type: (str, list[tuple[bytes, int, int]]) -> list[bytes]
+    """Runs on the pool: compress indexed frames."""
+    if fmt == GIF:
+        return [_lzw(data) for data, _, _ in crops]
+    result = []
+    for data, width, _ in crops:
+        # Each PNG scanline starts with its filter type. 0 = None.
+        rows = bytearray()
+        for start in range(0, len(data), width):
+            rows.append(0)
+            rows += data[start : start + width]
+        result.append(zlib.compress(bytes(rows), 6))
+    return result
+
+
+def _lzw(data, min_size=8):
+    # type: (bytes, int) -> bytes
+    """GIF flavored LZW with codes packed LSB first."""
+    clear = 1 << min_size
+    end = clear + 1
+    out = bytearray()
+    buffer = bits = 0
+    size = min_size + 1
+    next_code = end + 1
+    codes = {}
+
+    def emit(code):
+        nonlocal buffer, bits
+        buffer |= code << bits
+        bits += size
+        while bits >= 8:
+            out.append(buffer & 0xFF)
+            buffer >>= 8
+            bits -= 8
+
+    emit(clear)
+    if data:
+        prefix = data[0]
+        for value in data[1:]:
+            key = (prefix << 8) | value
+            code = codes.get(key)
+            if code is not None:
+                prefix = code
+                continue
+            emit(prefix)
+            if next_code < 4096:
+                codes[key] = next_code
+                next_code += 1
+                # The decoder widens codes one entry behind us.
+                if next_code - 1 == 1 << size and size < 12:
+                    size += 1
+            else:
+                emit(clear)
+                codes.clear()
+                next_code = end + 1
+                size = min_size + 1
+            prefix = value
+        emit(prefix)
+    emit(end)
+    if bits:
+        out.append(buffer & 0xFF)
+    return bytes(out)
+
+
+class _GifWriter:
+    def __init__(self, file_obj, width, height, palette, transparent):
+        self.file_obj = file_obj
+        self.transparent = transparent
+        # Color table size has to be a power of 2. Plus one for transparency.
+        table_bits = max(1, (len(palette)).bit_length())
+        table = bytearray(palette.tobytes())
+        table += bytes(3 * (1 << table_bits) - len(table))
+        file_obj.write(b'GIF89a')
+        file_obj.write(struct.pack('<HHBBB', width, height, 0xF0 | (table_bits - 1), 0, 0))
+        file_obj.write(table)
+        # Loop forever.
+        file_obj.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+        self._time = 0.0
+
+    def add_frame(self, x, y, width, height, delay, data):
+        # Delays are in centiseconds. Rounding the running time keeps it in sync.
+        start = round(self._time * 100)
+        self._time += delay
+        centiseconds = max(2, round(self._time * 100) - start)
+        # Graphic control: keep the frame (disposal 1), transparent index set.
+        self.file_obj.write(
+            struct.pack('<BBBBHBB', 0x21, 0xF9, 4, 0b0101, centiseconds, self.transparent, 0)
+        )
+        self.file_obj.write(struct.pack('<BHHHHB', 0x2C, x, y, width, height, 0))
+        self.file_obj.write(b'\x08')
+        for start in range(0, len(data), 255):
+            block = data[start : start + 255]
+            self.file_obj.write(bytes((len(block),)) + block)
+        self.file_obj.write(b'\x00')
+
+    def close(self):
+        self.file_obj.write(b'\x3b')
+
+
+class _ApngWriter:
+    def __init__(self, file_obj, width, height, palette, transparent):
+        self.file_obj = file_obj
+        self._sequence = 0
+        self._frames = 0
+        file_obj.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+        # Frame count isn't known yet. Patched in `close`.
+        self._actl_pos = file_obj.tell()
+        self._chunk(b'acTL', struct.pack('>II', 0, 0))
+        table = bytearray(palette.tobytes())
+        # The transparent index right after the colors.
+        table += bytes(3)
+        self._chunk(b'PLTE', bytes(table))
+        self._chunk(b'tRNS', b'\xff' * transparent + b'\x00')
+
+    def add_frame(self, x, y, width, height, delay, data):
+        first = self._frames == 0
+        numerator, denominator = round(delay * 100), 100
+        if numerator > 0xFFFF:
+            numerator, denominator = round(delay), 1
+        # dispose: none, blend: source for the first one, over for the rest.
+        blend = 0 if first else 1
+        fctl = struct.pack('>IIIII', self._next(), width, height, x, y)
+        fctl += struct.pack('>HHBB', numerator, denominator, 0, blend)
+        self._chunk(b'fcTL', fctl)
+        if first:
+            self._chunk(b'IDAT', data)
+        else:
+            self._chunk(b'fdAT', struct.pack('>I', self._next()) + data)
+        self._frames += 1
+
+    def close(self):
+        self._chunk(b'IEND', b'')
+        self.file_obj.seek(self._actl_pos)
+        self._chunk(b'acTL', struct.pack('>II', self._frames, 0))
+        self.file_obj.seek(0, os.SEEK_END)
+
+    def _next(self):
+        self._sequence += 1
+        return self._sequence - 1
+
+    def _chunk(self, name, data):
+        self.file_obj.write(struct.pack('>I', len(data)) + name + data)
+        self.file_obj.write(struct.pack('>I', zlib.crc32(name + data)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('ffmpeg')
+    parser.add_argument('video_path')
+    parser.add_argument('file_path')
+    parser.add_argument('--size', required=True, help='Video width x height.')
+    parser.add_argument('--format', default=None, choices=list(FORMATS))
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--fps', type=int, default=10)
+    args = parser.parse_args(argv)
+    width, _, height = args.size.partition('x')
+    size = (int(width), int(height))
+    export(args.ffmpeg, args.video_path, args.file_path, size, args.format, args.quality, args.fps)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Run any number of animations on one frame clock.
+
+Each animation is known by a key. Starting one with a key that's already
+running replaces just that one. All running animations are stepped on the
+same timer tick, after which `Animator.frame` fires once so the whole
+frame can be repainted in one go.
+"""
+import time
+
+import common
+from pyside import QtCore
+
+log = common.get_logger(f'{common.NAME}.animation')
+# Used if the screen doesn't tell its refresh rate.
+FALLBACK_FPS = 60
+# A tick coming later than this many frame intervals counts as dropped frames.
+DROP_TOLERANCE = 1.5
+
+
+def frame_interval(widget=None):
+    """Milliseconds per frame of the screen the widget is on."""
+    screen = widget.screen() if widget is not None else None
+    fps = screen.refreshRate() if screen is not None else 0
+    return int(1000 / (fps or FALLBACK_FPS))
+
+
+class _Animation:
+    def __init__(self, start, end, duration, setter, on_finished):
+        self.start = start
+        self.end = end
+        self.duration = duration / 1000.0
+        self.setter = setter
+        self.on_finished = on_finished
+        self.t0 = time.perf_counter()
+
+    def step(self, now):
+        """Set the value for the given time. Return True when done."""
+        progress = 1.0
+        if self.duration > 0:
+            progress = min((now - self.t0) / self.duration, 1.0)
+        self.setter(self.start + (self.end - self.start) * progress)
+        return progress >= 1.0
+
+
+class Animator(QtCore.QObject):
+    frame = QtCore.Signal()
+
+    def __init__(self, parent=None, widget=None):
+        super().__init__(parent)
+        self._widget = widget
+        self._animations = {}  # type: dict[str, _Animation]
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._tick)
+        self._last_tick = 0.0
+        self._frames = 0
+        self._dropped = 0
+        self._worst = 0.0
+
+    def animate(self, key, start, end, duration, setter, on_finished=None):
+        """
+        Animate from `start` to `end` in `duration` milliseconds feeding `setter`.
+
+        `on_finished` is called once when the animation ran through.
+        Not if it's replaced or stopped before.
+        """
+        self._animations[key] = _Animation(start, end, duration, setter, on_finished)
+        if not self._timer.isActive():
+            self._timer.start(frame_interval(self._widget))
+            self._last_tick = time.perf_counter()
+            self._frames = self._dropped = 0
+            self._worst = 0.0
+
+    def stop(self, key=None):
+        """Stop one animation or all of them. Without calling back."""
+        if key is None:
+            self._animations.clear()
+        else:
+            self._animations.pop(key, None)
+        if not self._animations:
+            self._timer.stop()
+
+    def is_running(self, key=None):
+        if key is None:
+            return bool(self._animations)
+        return key in self._animations
+
+    def _tick(self):
+        now = time.perf_counter()
+        self._record_frame(now)
+
+        done = []
+        for key, animation in list(self._animations.items()):
+            if animation.step(now):
+                done.append((key, animation))
+        self.frame.emit()
+
+        for key, animation in done:
+            # A finish callback before might have replaced it already.
+            if self._animations.get(key) is animation:
+                del self._animations[key]
+            if animation.on_finished is not None:
+                animation.on_finished()
+
+        if not self._animations:
+            self._timer.stop()
+            log.debug(
+                'ran %i frames, %i dropped, worst frame %.1f ms',
+                self._frames,
+                self._dropped,
+                self._worst * 1000,
+            )
+
+    def _record_frame(self, now):
+        delta = now - self._last_tick
+        self._last_tick = now
+        self._frames += 1
+        self._worst = max(self._worst, delta)
+        interval = self._timer.interval() / 1000.0
+        if interval and delta > interval * DROP_TOLERANCE:
+            self._dropped += round(delta / interval) - 1
@@ -0,0 +1,438 @@
+"""
+Pen strokes, arrows, rectangles, text & redactions drawn on the screenshot.
+
+Annotations are kept as vectors in a display list, in screenshot pixels.
+Nothing is rasterized up front: The scene item paints only the annotations
+in the exposed area and exporting paints only the ones overlapping the
+cutout. Undo & redo keep the commands that changed the list. These just
+reference the annotations inserted or deleted, no pixels.
+
+Redactions are the exception. Once drawn they keep their blurred or
+pixelated pixels, so exports get exactly what was shown.
+"""
+from collections import namedtuple
+
+import redact
+from pyside import QtCore, QtGui, QtWidgets
+
+PEN = 'pen'
+ARROW = 'arrow'
+RECT = 'rect'
+TEXT = 'text'
+BLUR = redact.BLUR
+PIXELATE = redact.PIXELATE
+KINDS = (PEN, ARROW, RECT, TEXT, BLUR, PIXELATE)
+REDACTIONS = (BLUR, PIXELATE)
+# Most commands kept to undo.
+UNDO_LIMIT = 100
+# Arrow head length per line width.
+ARROW_HEAD = 4.0
+# Text pixel size per line width.
+TEXT_SCALE = 6.0
+# Screenshot pixels per side of a tile of redacted pixels.
+REDACT_TILE = 128
+# Image formats `redact.view` takes as they are.
+_REDACT_FORMATS = (
+    QtGui.QImage.Format_RGB32,
+    QtGui.QImage.Format_ARGB32,
+    QtGui.QImage.Format_ARGB32_Premultiplied,
+)
+INSERT = 'insert'
+DELETE = 'delete'
+Command = namedtuple('Command', ['action', 'index', 'annotations'])
+
+
+class Annotation:
+    """One thing drawn on the screenshot. Not changed anymore once in a `DisplayList`."""
+
+    def __init__(self, kind, points, color, width, text=''):
+        # type: (str, list[QtCore.QPointF], QtGui.QColor | str, float, str) -> None
+        self.kind = kind
+        self.points = [QtCore.QPointF(point) for point in points]
+        self.color = QtGui.QColor(color)
+        self.width = float(width)
+        self.text = text
+        # Everything painted is within, in screenshot pixels.
+        self.bounds = self._bounds()
+
+    def extend(self, point):
+        # type: (QtCore.QPointF) -> QtCore.QRectF
+        """
+        Add a point to a pen stroke or move the end of anything else.
+        Gives the area that changed.
+        """
+        if self.kind == PEN:
+            last = self.points[-1]
+            self.points.append(QtCore.QPointF(point))
+            changed = _margin(QtCore.QRectF(last, point).normalized(), self.width)
+            self.bounds = self.bounds.united(changed)
+            return changed
+        old = self.bounds
+        self.points[-1] = QtCore.QPointF(point)
+        self.bounds = self._bounds()
+        return old.united(self.bounds)
+
+    def finish(self):
+        """Done drawing it. About to go into a display list."""
+
+    def is_empty(self):
+        """Nothing to see, like an arrow without length."""
+        if self.kind == TEXT:
+            return not self.text
+        if self.kind == PEN:
+            return False
+        return self.points[0] == self.points[-1]
+
+    def paint(self, painter):
+        # type: (QtGui.QPainter) -> None
+        if self.kind == TEXT:
+            painter.setPen(self.color)
+            painter.setFont(self._font())
+            painter.drawText(self.bounds, QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop, self.text)
+            return
+
+        pen = QtGui.QPen(self.color, self.width, QtCore.Qt.SolidLine)
+        pen.setCapStyle(QtCore.Qt.RoundCap)
+        pen.setJoinStyle(QtCore.Qt.RoundJoin)
+        painter.setPen(pen)
+        painter.setBrush(QtCore.Qt.NoBrush)
+        start, end = self.points[0], self.points[-1]
+        if self.kind == PEN:
+            if len(self.points) == 1:
+                painter.drawPoint(start)
+            else:
+                painter.drawPolyline(QtGui.QPolygonF(self.points))
+        elif self.kind == RECT:
+            painter.drawRect(QtCore.QRectF(start, end).normalized())
+        elif self.kind == ARROW:
+            head = self._arrow_head()
+            if head is None:
+                return
+            # Stop the line at the base of the head so its round cap doesn't poke out the tip.
+            painter.drawLine(start, (head[1] + head[2]) / 2)
+            painter.setPen(QtCore.Qt.NoPen)
+            painter.setBrush(self.color)
+            painter.drawPolygon(QtGui.QPolygonF(head))
+
+    def _bounds(self):
+        if self.kind == TEXT:
+            flags = QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop
+            size = QtGui.QFontMetricsF(self._font()).boundingRect(
+                QtCore.QRectF(), flags, self.text
+            )
+            return QtCore.QRectF(self.points[0], size.size())
+        rect = QtGui.QPolygonF(self.points).boundingRect()
+        if self.kind == ARROW:
+            return _margin(rect, self.width * ARROW_HEAD)
+        return _margin(rect, self.width)
+
+    def _arrow_head(self):
+        # type: () -> list[QtCore.QPointF] | None
+        """Tip and both back corners. None without length."""
+        start, tip = self.points[0], self.points[-1]
+        line = QtCore.QLineF(start, tip)
+        length = line.length()
+        if not length:
+            return None
+        size = min(self.width * ARROW_HEAD, length)
+        direction = (tip - start) / length
+        normal = QtCore.QPointF(-direction.y(), direction.x()) * size / 2
+        base = tip - direction * size
+        return [tip, base + normal, base - normal]
+
+    def _font(self):
+        font = QtGui.QFont()
+        font.setPixelSize(max(1, round(self.width * TEXT_SCALE)))
+        return font
+
+
+class Redaction(Annotation):
+    """
+    Rectangle of blurred or pixelated screenshot. While drawn it paints the tiles
+    of `Redacted` ready so far. When finished its pixels are kept, all of them.
+    """
+
+    def __init__(self, points, redacted):
+        # type: (list[QtCore.QPointF], Redacted) -> None
+        self.redacted = redacted
+        self.patch = None  # type: QtGui.QImage | None
+        super().__init__(redacted.mode, points, QtCore.Qt.black, 0)
+
+    def rect(self):
+        # type: () -> QtCore.QRect
+        """The whole pixels covered."""
+        return QtCore.QRectF(self.points[0], self.points[-1]).normalized().toAlignedRect()
+
+    def finish(self):
+        rect = self.rect()
+        if rect.isEmpty():
+            return
+        self.patch = QtGui.QImage(rect.size(), self.redacted.format)
+        painter = QtGui.QPainter(self.patch)
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+        painter.translate(-rect.topLeft())
+        for target, tile, source in self.redacted.pieces(rect, wait=True):
+            painter.drawImage(target.topLeft(), tile, source)
+        painter.end()
+
+    def is_empty(self):
+        return self.rect().isEmpty()
+
+    def paint(self, painter):
+        # type: (QtGui.QPainter) -> None
+        rect = self.rect()
+        if self.patch is not None:
+            painter.drawImage(rect.topLeft(), self.patch)
+        else:
+            for target, tile, source in self.redacted.pieces(rect):
+                painter.drawImage(target.topLeft(), tile, source)
+
+    def _bounds(self):
+        return QtCore.QRectF(self.rect())
+
+
+class Redacted(QtCore.QObject):
+    """
+    All of a screenshot blurred or pixelated. Computed in tiles when first
+    needed, whole runs of missing tiles in a row at once. That happens on its
+    own pool while painting, `ready` tells when a row of them can be painted.
+    """
+
+    ready = QtCore.Signal(QtCore.QRect)
+    _computed = QtCore.Signal(int, list)
+
+    def __init__(self, image, mode, size):
+        # type: (QtGui.QImage, str, int) -> None
+        super().__init__()
+        if image.format() not in _REDACT_FORMATS:
+            image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+        self.mode = mode
+        self.size = size
+        self.format = image.format()
+        # Keeps the buffer the pixels look at around.
+        self._image = image
+        self._pixels = redact.view(
+            image.constBits(), image.width(), image.height(), image.bytesPerLine()
+        )
+        self._tiles = {}  # type: dict[tuple[int, int], QtGui.QImage]
+        # Tiles a job is computing already.
+        self._pending = set()  # type: set[tuple[int, int]]
+        self.pool = QtCore.QThreadPool(self)
+        self._computed.connect(self._on_computed)
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def pieces(self, rect, wait=False):
+        # type: (QtCore.QRect, bool) -> list[tuple[QtCore.QRect, QtGui.QImage, QtCore.QRect]]
+        """
+        Parts of `rect` in image pixels with the tile covering each & the part on it.
+        Only the tiles there already, unless `wait` has the missing ones computed now.
+        """
+        rect = rect.intersected(self._image.rect())
+        if rect.isEmpty():
+            return []
+        size = REDACT_TILE
+        columns = range(rect.left() // size, rect.right() // size + 1)
+        found = []
+        for row in range(rect.top() // size, rect.bottom() // size + 1):
+            missing = [column for column in columns if (column, row) not in self._tiles]
+            if missing and wait:
+                self._store(row, self._compute(row, missing))
+            elif missing:
+                missing = [column for column in missing if (column, row) not in self._pending]
+                if missing:
+                    self._pending.update((column, row) for column in missing)
+                    self.pool.start(_RedactJob(self, row, missing))
+            for column in columns:
+                tile = self._tiles.get((column, row))
+                if tile is None:
+                    continue
+                area = QtCore.QRect(column * size, row * size, size, size)
+                part = rect.intersected(area)
+                found.append((part, tile, part.translated(-area.topLeft())))
+        return found
+
+    def _compute(self, row, columns):
+        # type: (int, list[int]) -> list[tuple[int, QtGui.QImage]]
+        size = REDACT_TILE
+        width, height = self._image.width(), self._image.height()
+        top, bottom = row * size, min((row + 1) * size, height)
+        start = 0
+        tiles = []
+        # Runs of neighbouring columns share the margin needed around them.
+        for i in range(1, len(columns) + 1):
+            if i < len(columns) and columns[i] == columns[i - 1] + 1:
+                continue
+            left, right = columns[start] * size, min((columns[i - 1] + 1) * size, width)
+            pixels = redact.redact(self._pixels, (left, top, right, bottom), self.mode, self.size)
+            for column in columns[start:i]:
+                x = column * size - left
+                part = pixels[:, x : x + size]
+                tile_width = part.shape[1]
+                image = QtGui.QImage(
+                    part.tobytes(), tile_width, bottom - top, tile_width * 4, self.format
+                )
+                tiles.append((column, image.copy()))
+            start = i
+        return tiles
+
+    def _store(self, row, tiles):
+        # type: (int, list[tuple[int, QtGui.QImage]]) -> QtCore.QRect
+        """Keep computed tiles of `row`. Returns the area they cover."""
+        area = QtCore.QRect()
+        for column, image in tiles:
+            self._pending.discard((column, row))
+            self._tiles[column, row] = image
+            corner = QtCore.QPoint(column * REDACT_TILE, row * REDACT_TILE)
+            area |= QtCore.QRect(corner, image.size())
+        return area
+
+    def _on_computed(self, row, tiles):
+        # type: (int, list[tuple[int, QtGui.QImage]]) -> None
+        self.ready.emit(self._store(row, tiles))
+
+
+class _RedactJob(QtCore.QRunnable):
+    def __init__(self, redacted, row, columns):
+        # type: (Redacted, int, list[int]) -> None
+        super().__init__()
+        self.redacted = redacted
+        self.row = row
+        self.columns = columns
+
+    def run(self):
+        self.redacted._computed.emit(self.row, self.redacted._compute(self.row, self.columns))
+
+
+def kinds():
+    """Annotation kinds that work here. Redacting needs NumPy."""
+    return tuple(kind for kind in KINDS if kind not in REDACTIONS or redact.available())
+
+
+class DisplayList:
+    """Annotations in paint order with the commands to undo & redo changes."""
+
+    def __init__(self):
+        self._items = []  # type: list[Annotation]
+        self._undo = []  # type: list[Command]
+        self._redo = []  # type: list[Command]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, annotation):
+        # type: (Annotation) -> None
+        self._do(Command(INSERT, len(self._items), (annotation,)))
+
+    def clear(self):
+        """Delete all annotations. Can be undone."""
+        if self._items:
+            self._do(Command(DELETE, 0, tuple(self._items)))
+
+    def reset(self):
+        """Forget all annotations & commands."""
+        self._items.clear()
+        self._undo.clear()
+        self._redo.clear()
+
+    def undo(self):
+        # type: () -> tuple[Annotation, ...]
+        """Revert the last command. Gives the annotations that came or went."""
+        if not self._undo:
+            return ()
+        command = self._undo.pop()
+        self._apply(_inverse(command))
+        self._redo.append(command)
+        return command.annotations
+
+    def redo(self):
+        # type: () -> tuple[Annotation, ...]
+        if not self._redo:
+            return ()
+        command = self._redo.pop()
+        self._apply(command)
+        self._undo.append(command)
+        return command.annotations
+
+    def overlapping(self, rect):
+        # type: (QtCore.QRectF) -> list[Annotation]
+        """Annotations painting into `rect` of screenshot pixels, in paint order."""
+        return [annotation for annotation in self._items if annotation.bounds.intersects(rect)]
+
+    def _do(self, command):
+        self._apply(command)
+        self._undo.append(command)
+        del self._undo[:-UNDO_LIMIT]
+        self._redo.clear()
+
+    def _apply(self, command):
+        # type: (Command) -> None
+        if command.action == INSERT:
+            self._items[command.index : command.index] = command.annotations
+        else:
+            del self._items[command.index : command.index + len(command.annotations)]
+
+
+def _inverse(command):
+    # type: (Command) -> Command
+    action = DELETE if command.action == INSERT else INSERT
+    return command._replace(action=action)
+
+
+def _margin(rect, margin):
+    # type: (QtCore.QRectF, float) -> QtCore.QRectF
+    return rect.adjusted(-margin, -margin, margin, margin)
+
+
+class AnnotationItem(QtWidgets.QGraphicsItem):
+    """
+    Paints a display list and the annotation being drawn over the screenshot.
+    Only annotations within the exposed area are painted.
+    """
+
+    def __init__(self, display_list, bounds, ratio):
+        # type: (DisplayList, QtCore.QRectF, float) -> None
+        super().__init__()
+        self.setAcceptedMouseButtons(QtCore.Qt.NoButton)
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        self.display_list = display_list
+        # The annotation being drawn. Not in the display list yet.
+        self.live = None  # type: Annotation | None
+        self._bounds = QtCore.QRectF(bounds)
+        self._ratio = ratio
+
+    def boundingRect(self):
+        return self._bounds
+
+    def set_geometry(self, bounds, ratio):
+        # type: (QtCore.QRectF, float) -> None
+        """Take the scene rect and pixel ratio of a new screenshot."""
+        self.prepareGeometryChange()
+        self._bounds = QtCore.QRectF(bounds)
+        self._ratio = ratio
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        ratio = self._ratio
+        exposed = option.exposedRect
+        area = QtCore.QRectF(exposed.topLeft() * ratio, exposed.size() * ratio)
+        visible = self.display_list.overlapping(area)
+        if self.live is not None and self.live.bounds.intersects(area):
+            visible.append(self.live)
+        if not visible:
+            return
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
+        painter.scale(1 / ratio, 1 / ratio)
+        for annotation in visible:
+            annotation.paint(painter)
+
+    def invalidate(self, area):
+        # type: (QtCore.QRectF) -> None
+        """Repaint `area` of screenshot pixels."""
+        ratio = self._ratio
+        scene_area = QtCore.QRectF(area.topLeft() / ratio, area.size() / ratio)
+        self.update(scene_area.adjusted(-1, -1, 1, 1))
@@ -0,0 +1,348 @@
+"""
+Headless benchmarks on synthetic screenshots.
+
+    python bench.py [--resolutions 1080p 4k 8k] [--output results.json]
+
+Each resolution runs in its own process on the offscreen Qt platform so peak
+RSS is per resolution and nothing is left over from the one before. Results
+are written as JSON to stdout or `--output` to be compared between runs.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+import common
+import edges
+import export
+import kiekste
+import screens
+import windows
+from pyside import QtCore, QtGui, QtWidgets
+
+RESOLUTIONS = {'1080p': (1920, 1080), '4k': (3840, 2160), '8k': (7680, 4320)}
+# Cutout sizes for clip & save. Bigger than the screen gets the full screen, once.
+REGION_SIZES = ((320, 240), (1280, 720), (1920, 1080), (3840, 2160))
+DRAG_STEPS = 400
+RECT_STEPS = 400
+CLIP_REPEATS = 5
+SAVE_REPEATS = 3
+# Fake windows to snap to and cursor positions to look them up at.
+WINDOW_COUNT = 300
+SNAP_STEPS = 400
+LOUPE_STEPS = 400
+FIRST_PAINT_TIMEOUT = 10.0
+EDGES_TIMEOUT = 30.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--resolutions', nargs='+', choices=list(RESOLUTIONS), default=list(RESOLUTIONS)
+    )
+    parser.add_argument('--format', default='', help='Image preset for saving. Default PNG.')
+    parser.add_argument('--output', default='', help='JSON file to write. Default stdout.')
+    parser.add_argument('--child', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = _run(args.child, args.format)
+        json.dump(result, sys.stdout)
+        return
+
+    results = {}
+    for name in args.resolutions:
+        print(f'benchmarking {name} ...', file=sys.stderr)
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', name]
+        if args.format:
+            cmd += ['--format', args.format]
+        env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+        proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, check=True)
+        results[name] = json.loads(proc.stdout)
+
+    report = {'meta': _meta(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as file_obj:
+            json.dump(report, file_obj, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def _meta():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'qt': QtCore.qVersion(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def _run(resolution, format_name):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    tmp_dir = tempfile.mkdtemp(prefix=f'{common.NAME}_bench_')
+    # Keep the users settings out of it, both ways.
+    settings = common.SETTINGS
+    settings._settings_path = os.path.join(tmp_dir, settings._settings_file)
+    settings.last_rectangles = []
+    settings.draw_pointer = False
+    settings.image_format = format_name or export.DEFAULT_FORMAT
+    settings.last_save_path = tmp_dir
+
+    app = QtWidgets.QApplication([])
+    width, height = RESOLUTIONS[resolution]
+    desktop = screens.Desktop.synthetic(_synthetic_image(width, height))
+    screens.grab_desktop = lambda: desktop
+
+    class BenchKiekste(kiekste.Kiekste):
+        first_paint = None
+
+        def paintEvent(self, event):
+            result = super().paintEvent(event)
+            if self.first_paint is None:
+                self.first_paint = time.perf_counter()
+            return result
+
+    result = {'width': width, 'height': height}
+    t0 = time.perf_counter()
+    win = BenchKiekste()
+    result['construct_ms'] = _ms(time.perf_counter() - t0)
+    deadline = t0 + FIRST_PAINT_TIMEOUT
+    while win.first_paint is None and time.perf_counter() < deadline:
+        app.processEvents()
+    result['first_paint_ms'] = _ms(win.first_paint - t0) if win.first_paint else None
+    # Let the edge finding in the background finish first. It's measured on its own.
+    while win._edge_finder is not None and time.perf_counter() < deadline + EDGES_TIMEOUT:
+        app.processEvents()
+    win.overlay.stop_animations()
+    app.processEvents()
+
+    result['edges_ms'] = _bench_edges(desktop.image)
+    result['set_rect'] = _bench_set_rect(app, win)
+    result['drag'] = _bench_drag(app, win)
+    result['snap'] = _bench_snap(app, win, width, height)
+    result['loupe'] = _bench_loupe(app, win)
+    result['clip'] = _bench_clip(app, win, width, height)
+    result['save'] = _bench_save(app, win, width, height, tmp_dir)
+    result['peak_rss_mb'] = _peak_rss_mb()
+
+    win.resident = True
+    win.close()
+    win.videoman.shutdown(kiekste.TEARDOWN_TIMEOUT)
+    settings.flush()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return result
+
+
+def _synthetic_image(width, height):
+    """Something more like a desktop than noise or a flat fill. Same every run."""
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_ARGB32_Premultiplied)
+    painter = QtGui.QPainter(image)
+    gradient = QtGui.QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QtGui.QColor(30, 60, 120))
+    gradient.setColorAt(1, QtGui.QColor(200, 120, 40))
+    painter.fillRect(image.rect(), gradient)
+    step = 160
+    for y in range(0, height, step):
+        for x in range(0, width, step):
+            shade = (x * 7 + y * 13) % 255
+            color = QtGui.QColor(shade, 255 - shade, 128)
+            painter.fillRect(x + 8, y + 8, step - 16, step // 2, color)
+            painter.drawText(QtCore.QPoint(x + 12, y + step - 24), f'{x},{y}')
+    painter.end()
+    return image
+
+
+def _bench_edges(image):
+    """Finding the edges to snap to. Runs in the background normally."""
+    if not edges.available():
+        return None
+    t0 = time.perf_counter()
+    edges.find(image.constBits(), image.width(), image.height(), image.bytesPerLine())
+    return _ms(time.perf_counter() - t0)
+
+
+def _bench_set_rect(app, win):
+    geo = win.overlay.geo
+    times = []
+    for i in range(RECT_STEPS):
+        rect = QtCore.QRectF(100 + i, 100 + i, geo.width() / 3 + i, geo.height() / 3)
+        t0 = time.perf_counter()
+        win.overlay.set_rect(rect)
+        app.processEvents()
+        times.append(time.perf_counter() - t0)
+    return _stats(times)
+
+
+def _bench_drag(app, win):
+    """Draw a new rectangle across most of the screen, one move event per step."""
+    overlay = win.overlay
+    geo = overlay.geo
+    start = QtCore.QPointF(geo.width() * 0.1, geo.height() * 0.1)
+    overlay.set_rect(QtCore.QRectF(0, 0, 1, 1))
+    overlay.cursor_move(start)
+    overlay.flush()
+    overlay.mouse_press(True)
+    times = []
+    t_all = time.perf_counter()
+    for i in range(1, DRAG_STEPS + 1):
+        progress = i / DRAG_STEPS
+        pos = QtCore.QPointF(
+            start.x() + geo.width() * 0.8 * progress, start.y() + geo.height() * 0.8 * progress
+        )
+        t0 = time.perf_counter()
+        overlay.cursor_move(pos)
+        overlay.flush()
+        app.processEvents()
+        times.append(time.perf_counter() - t0)
+    total = time.perf_counter() - t_all
+    overlay.mouse_press(False)
+    result = _stats(times)
+    result['events_per_s'] = round(DRAG_STEPS / total, 1)
+    return result
+
+
+def _bench_snap(app, win, width, height):
+    """List & index lots of windows, then hover across them previewing the snap."""
+    win.window_provider = windows.FakeProvider.cascade(WINDOW_COUNT, width, height)
+    t0 = time.perf_counter()
+    index = win._list_windows(win.desktop)
+    result = {'windows': WINDOW_COUNT, 'list_ms': _ms(time.perf_counter() - t0)}
+    # Built in the background normally. Measured on its own here.
+    t0 = time.perf_counter()
+    index.build()
+    result['index_ms'] = _ms(time.perf_counter() - t0)
+    win.windows = index
+
+    overlay = win.overlay
+    geo = overlay.geo
+    overlay.snap_press(True)
+    times = []
+    for i in range(SNAP_STEPS):
+        progress = i / SNAP_STEPS
+        pos = QtCore.QPointF(geo.width() * progress, geo.height() * (1 - progress))
+        t0 = time.perf_counter()
+        overlay.cursor_move(pos)
+        overlay.flush()
+        app.processEvents()
+        times.append(time.perf_counter() - t0)
+    overlay.snap_press(False)
+    result.update(_stats(times))
+    return result
+
+
+def _bench_loupe(app, win):
+    """Move the magnifier across the screen on its own. 60 fps needs under 16.7 ms."""
+    item = win.overlay.loupe
+    geo = win.overlay.geo
+    item.tiles.clear()
+    times = []
+    for i in range(LOUPE_STEPS):
+        progress = i / LOUPE_STEPS
+        pos = QtCore.QPointF(geo.width() * progress, geo.height() * (0.2 + progress * 0.6))
+        t0 = time.perf_counter()
+        item.show_at(pos, win.image, win.desktop.ratio, geo)
+        app.processEvents()
+        times.append(time.perf_counter() - t0)
+    item.hide()
+    app.processEvents()
+    result = _stats(times)
+    result['tiles'] = len(item.tiles)
+    return result
+
+
+def _regions(width, height):
+    seen = set()
+    for w, h in REGION_SIZES:
+        w, h = min(w, width), min(h, height)
+        if (w, h) in seen:
+            continue
+        seen.add((w, h))
+        yield f'{w}x{h}', QtCore.QRect((width - w) // 2, (height - h) // 2, w, h)
+
+
+def _bench_clip(app, win, width, height):
+    result = {}
+    for name, rect in _regions(width, height):
+        win.overlay.set_output_rect(rect)
+        times = []
+        for _ in range(CLIP_REPEATS):
+            t0 = time.perf_counter()
+            win.clip()
+            times.append(time.perf_counter() - t0)
+            win.overlay.stop_animations()
+            app.processEvents()
+        result[name] = _stats(times)
+    return result
+
+
+def _bench_save(app, win, width, height, tmp_dir):
+    """`save_shot` returning to the event loop and the file being written."""
+    format_name = _format()
+    suffix = export.FORMATS[format_name][0]
+    result = {'format': format_name}
+    file_filter = export.file_filter(format_name)
+    for name, rect in _regions(width, height):
+        win.overlay.set_output_rect(rect)
+        path = os.path.join(tmp_dir, f'{name}.{suffix}')
+        # No one to click through the dialog here.
+        QtWidgets.QFileDialog.getSaveFileName = staticmethod(lambda *args: (path, file_filter))
+        calls, written = [], []
+        for _ in range(SAVE_REPEATS):
+            t0 = time.perf_counter()
+            win.save_shot()
+            calls.append(time.perf_counter() - t0)
+            win.exporter.wait()
+            written.append(time.perf_counter() - t0)
+            win.overlay.stop_animations()
+            app.processEvents()
+        result[name] = {
+            'call': _stats(calls),
+            'written': _stats(written),
+            'bytes': os.path.getsize(path) if os.path.isfile(path) else 0,
+        }
+    return result
+
+
+def _format():
+    name = common.SETTINGS.image_format
+    return name if name in export.FORMATS else export.DEFAULT_FORMAT
+
+
+def _stats(seconds):
+    ordered = sorted(seconds)
+    return {
+        'n': len(ordered),
+        'median_ms': _ms(statistics.median(ordered)),
+        'p95_ms': _ms(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]),
+        'max_ms': _ms(ordered[-1]),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows. Not worth pulling in psutil for.
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux says kilobytes, macOS bytes.
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+if __name__ == '__main__':
+    main()
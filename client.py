@@ -0,0 +1,50 @@
+"""
+Tiny client to trigger a resident kiekste daemon.
+
+Deliberately doesn't import Qt so it starts up as fast as possible.
+If no daemon is running kiekste is just started the normal way.
+
+    python client.py [capture|replay|animation|quit]
+"""
+import sys
+import time
+import socket
+
+import common
+
+CMD_CAPTURE = 'capture'
+
+
+def send(command=CMD_CAPTURE):
+    """Send a command to the daemon. Return False if there is none listening."""
+    msg = f'{command} {time.time()}\n'.encode(common.ENCODING)
+    try:
+        if sys.platform == 'win32':
+            with open(common.DAEMON_PATH, 'wb', buffering=0) as pipe:
+                pipe.write(msg)
+        else:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(common.DAEMON_PATH)
+                sock.sendall(msg)
+    except OSError:
+        return False
+    return True
+
+
+def main(args):
+    command = args[0] if args else CMD_CAPTURE
+    if send(command):
+        return 0
+    if command != CMD_CAPTURE:
+        print(f'No {common.NAME} daemon running at "{common.DAEMON_PATH}"!')
+        return 1
+
+    import kiekste
+
+    common.setup_logger()
+    kiekste.show()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,11 @@
 import os
+import sys
+import copy
 import json
+import atexit
 import logging
+import tempfile
+import threading
 
 NAME = 'kiekste'
 TMP_NAME = f'_{NAME}_tmp'
@@ -10,6 +15,18 @@ LOG_LEVEL = logging.DEBUG
 ENCODING = 'utf8'
 # logging.basicConfig()
 LOG_FMT = '%(levelname)s: [%(name)s] %(message)s'
+# Where a resident `kiekste.py --daemon` listens for capture requests.
+# On Windows this is a named pipe, elsewhere a local socket file. That goes to the
+# user's private runtime dir, or carries the uid in the shared temp dir.
+if sys.platform == 'win32':
+    DAEMON_ADDRESS = f'{NAME}_daemon'
+    DAEMON_PATH = rf'\\.\pipe\{DAEMON_ADDRESS}'
+elif os.getenv('XDG_RUNTIME_DIR'):
+    DAEMON_ADDRESS = DAEMON_PATH = os.path.join(os.environ['XDG_RUNTIME_DIR'], f'{NAME}_daemon')
+else:
+    DAEMON_ADDRESS = DAEMON_PATH = os.path.join(
+        tempfile.gettempdir(), f'{NAME}_daemon_{os.getuid()}'
+    )
 
 _stream_handler = logging.StreamHandler()
 _stream_handler.setFormatter(logging.Formatter(LOG_FMT, None))
@@ -22,6 +39,8 @@ def get_logger(name):
     return new_logger
 
 log = get_logger(f'{NAME}.common')
+# Seconds to wait for more changes before settings are written.
+SETTINGS_SAVE_DELAY = 1.0
 
 
 class _Settings:
@@ -32,16 +51,55 @@ class _Settings:
         self.draw_pointer = True
         self.video_fps = 10
         self.video_quality = 5000
+        # 1 to 100. Palette size for GIF & APNG, quality for animated WebP.
+        self.anim_quality = 80
+        # Empty picks the first one available. See `video_backends.BACKENDS`.
+        self.video_backend = ''
+        # 'ffmpeg' grabs the screen itself, 'frames' has kiekste grab & pipe frames.
+        self.video_engine = 'ffmpeg'
+        # 'fixed' encodes every frame, 'vfr' only the ones that changed.
+        self.video_mode = 'fixed'
+        # Instant replay: seconds to keep, most MB the segments may take, keep in RAM.
+        self.replay_seconds = 30
+        self.replay_quota_mb = 300
+        self.replay_in_ram = True
+        # Snap rectangle sides to edges on the screenshot while dragging.
+        self.snap_edges = True
+        # Magnify the pixels around the cursor while drawing or resizing.
+        self.show_loupe = True
+        # Color & line width in scene pixels for annotations.
+        self.annotation_color = '#ff3b30'
+        self.annotation_width = 3
+        # Scene pixels per pixelated block or blur radius when redacting.
+        self.redact_size = 10
+        # Where the windows to snap to come from. Empty picks. See `windows.PROVIDERS`.
+        self.window_provider = ''
+        # Probed [backend, width, height, fps] of what capturing keeps up with.
+        self.video_limits = []
+        # Calibrated [quality, preset, pixels per second] of how fast x264 encodes here.
+        self.encoder_speeds = []
+        self.image_format = 'PNG'
 
         self._settings_file = NAME.lower() + '.json'
         self._settings_path = os.path.join(PATH, self._settings_file)
+        # What's on disk. Changes are tracked against this per key.
+        self._stored = {}
+        self._pending = None  # type: dict | None
+        # What's being written right now.
+        self._writing = None  # type: dict | None
+        self._lock = threading.Lock()
+        # Held while writing. So an older write can't land after a newer one.
+        self._write_lock = threading.Lock()
+        self._timer = None  # type: threading.Timer | None
         self._load()
+        atexit.register(self.flush)
 
     def _load(self):
-        for key, value in self._get_json().items():
+        self._stored = self._get_json()
+        for key, value in self._stored.items():
             if key not in self.__dict__:
                 log.warning('Key "%s" not yet listed in Settings obj!1', key)
-            self.__dict__[key] = value
+            self.__dict__[key] = copy.deepcopy(value)
 
     def _get_json(self):
         if os.path.isfile(self._settings_path):
@@ -49,27 +107,79 @@ class _Settings:
                 return json.load(file_obj)
         return {}
 
+    def _values(self):
+        return {
+            name: value
+            for name, value in self.__dict__.items()
+            if not name.startswith('_') and isinstance(value, (str, int, list, bool))
+        }
+
+    def _latest(self):
+        """The newest values to go to disk, about to or already there."""
+        for data in self._pending, self._writing:
+            if data is not None:
+                return data
+        return self._stored
+
+    def _dirty_keys(self):
+        stored = self._latest()
+        return [name for name, value in self._values().items() if stored.get(name) != value]
+
     def _save(self):
-        current = self._get_json()
-        do_write = False
-        for name, value in self.__dict__.items():
-            if name.startswith('_'):
-                continue
-            if not isinstance(value, (str, int, list, bool)):
-                continue
-            if name not in current:
-                do_write = True
-                current[name] = value
-            if current[name] == value:
-                continue
-            do_write = True
-            current[name] = value
-
-        if not do_write:
-            return
-
-        with open(self._settings_path, 'w', encoding=ENCODING) as file_obj:
-            json.dump(current, file_obj, indent=2, sort_keys=True)
+        """
+        Schedule writing changed values. Cheap to call any time:
+        Nothing touches the disk here. Writes are bundled and done in the background.
+        """
+        with self._lock:
+            dirty = self._dirty_keys()
+            if not dirty:
+                return
+            pending = dict(self._latest())
+            for name in dirty:
+                pending[name] = copy.deepcopy(self.__dict__[name])
+            self._pending = pending
+
+            if self._timer is None:
+                self._timer = threading.Timer(SETTINGS_SAVE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """
+        Write pending changes right away. The disk is only touched outside of
+        `_lock`, so `_save` never waits for it.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                data, self._pending = self._pending, None
+                if data is None:
+                    return
+                self._writing = data
+
+            try:
+                _write_json_atomic(self._settings_path, data)
+            except OSError as error:
+                log.error('Could not write settings "%s": %s', self._settings_path, error)
+                data = None
+
+            with self._lock:
+                self._writing = None
+                # Failed, the changes show up as dirty again with the next save.
+                if data is not None:
+                    self._stored = data
+
+
+def _write_json_atomic(path, data):
+    """Write to a temp file next to `path` first. So it's never left half written."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding=ENCODING) as file_obj:
+        json.dump(data, file_obj, indent=2, sort_keys=True)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+    os.replace(tmp_path, path)
 
 
 SETTINGS = _Settings()
@@ -0,0 +1,93 @@
+"""
+Keep kiekste resident in the background.
+
+Started via `kiekste.py --daemon` the app, scene & toolbox are built once and
+just hidden between captures. Requests come in over a local socket (see `client.py`)
+as lines of `<command> <unix timestamp>`.
+"""
+import time
+
+import common
+from pyside import QtCore, QtNetwork
+
+log = common.get_logger(f'{common.NAME}.daemon')
+CMD_CAPTURE = 'capture'
+CMD_REPLAY = 'replay'
+CMD_ANIMATION = 'animation'
+CMD_QUIT = 'quit'
+# Milliseconds a running daemon gets to answer before its socket counts as left over.
+PROBE_TIMEOUT = 500
+
+
+class Daemon(QtCore.QObject):
+    capture_requested = QtCore.Signal(float)
+    replay_requested = QtCore.Signal(float)
+    animation_requested = QtCore.Signal(float)
+    quit_requested = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QtNetwork.QLocalServer(self)
+        # Only this user may connect, the socket must not take commands from others.
+        self.server.setSocketOptions(QtNetwork.QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self._on_connection)
+
+    def listen(self):
+        if self.server.listen(common.DAEMON_ADDRESS):
+            log.info('Listening on "%s"', self.server.fullServerName())
+            return True
+
+        if is_running():
+            log.error('Another daemon is already listening on "%s"!', common.DAEMON_ADDRESS)
+            return False
+        # Nobody answers. A crashed daemon must have left its socket file behind.
+        QtNetwork.QLocalServer.removeServer(common.DAEMON_ADDRESS)
+        if self.server.listen(common.DAEMON_ADDRESS):
+            log.info('Listening on "%s"', self.server.fullServerName())
+            return True
+
+        log.error('Could not listen on "%s": %s', common.DAEMON_ADDRESS, self.server.errorString())
+        return False
+
+    def close(self):
+        self.server.close()
+
+    def _on_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda s=socket: self._read(s))
+            socket.disconnected.connect(socket.deleteLater)
+            if socket.bytesAvailable():
+                self._read(socket)
+
+    def _read(self, socket):
+        while socket.canReadLine():
+            line = bytes(socket.readLine()).decode(common.ENCODING).strip()
+            self._handle(line)
+
+    def _handle(self, line):
+        command, _, stamp = line.partition(' ')
+        try:
+            t_request = float(stamp)
+        except ValueError:
+            t_request = time.time()
+
+        if command == CMD_CAPTURE:
+            self.capture_requested.emit(t_request)
+        elif command == CMD_REPLAY:
+            self.replay_requested.emit(t_request)
+        elif command == CMD_ANIMATION:
+            self.animation_requested.emit(t_request)
+        elif command == CMD_QUIT:
+            self.quit_requested.emit()
+        else:
+            log.warning('Unknown daemon command: "%s"', line)
+
+
+def is_running():
+    """Whether a daemon answers on `common.DAEMON_ADDRESS`."""
+    socket = QtNetwork.QLocalSocket()
+    socket.connectToServer(common.DAEMON_ADDRESS)
+    running = socket.waitForConnected(PROBE_TIMEOUT)
+    socket.abort()
+    return running
@@ -0,0 +1,145 @@
+"""
+Find the strong straight edges on a screenshot to snap rectangle sides to.
+
+Edges are where the brightness jumps between neighbouring pixels and keeps
+doing so for at least `MIN_LENGTH` pixels along the edge. That leaves the
+borders of buttons, panels & windows but drops most of the text. Vertical
+edges are indexed per row, horizontal ones per column, as sorted positions
+in one flat array with offsets per row/column. Looking up the nearest edge
+is a bisection in one row or column.
+
+Needs NumPy. Without it there's just nothing to snap to. No Qt in here,
+positions are image pixels, at the pixel boundaries.
+"""
+import sys
+import time
+
+import common
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = common.get_logger(f'{common.NAME}.edges')
+# Brightness jump of 0 to 255 that counts as an edge.
+THRESHOLD = 24
+# Pixels an edge has to run straight to count.
+MIN_LENGTH = 12
+# Luma weights for red, green & blue in 256ths.
+LUMA_WEIGHTS = (77, 150, 29)
+
+
+def available():
+    return numpy is not None
+
+
+class EdgeMap:
+    def __init__(self, width, height, rows, columns):
+        self.width = width
+        self.height = height
+        # (offsets, positions): x of vertical edges per row & y of horizontal ones per column.
+        self._rows = rows
+        self._columns = columns
+
+    def __len__(self):
+        return len(self._rows[1]) + len(self._columns[1])
+
+    def snap_x(self, x, y, distance):
+        # type: (float, float, float) -> float | None
+        """The vertical edge nearest to `x` in row `y` if within `distance`."""
+        return _nearest(self._rows, int(y), x, distance)
+
+    def snap_y(self, y, x, distance):
+        # type: (float, float, float) -> float | None
+        """The horizontal edge nearest to `y` in column `x` if within `distance`."""
+        return _nearest(self._columns, int(x), y, distance)
+
+
+def find(buffer, width, height, stride, cancelled=None):
+    # type: (memoryview | bytes, int, int, int, Callable[[], bool] | None) -> EdgeMap | None
+    """
+    Make the edge map for 32 bit 0xffRRGGBB pixels, as in `QImage.Format_RGB32`
+    and the ARGB32 formats. `stride` is the bytes per line. `cancelled` is asked
+    between the steps, None is returned once it's True.
+    """
+    if numpy is None:
+        return None
+    if cancelled is None:
+        cancelled = _never
+    t0 = time.perf_counter()
+    lines = numpy.frombuffer(buffer, numpy.uint8, count=stride * height).reshape(height, stride)
+    pixels = lines[:, : width * 4].reshape(height, width, 4)
+    # Memory order is BGRA on little endian, ARGB on big endian.
+    red, green, blue = (2, 1, 0) if sys.byteorder == 'little' else (1, 2, 3)
+    luma = numpy.zeros((height, width), numpy.int16)
+    for channel, weight in zip((red, green, blue), LUMA_WEIGHTS):
+        luma += pixels[:, :, channel].astype(numpy.uint16) * weight >> 8
+    if cancelled():
+        return None
+
+    # Jumps between x-1 & x make a vertical edge at x. Same for y.
+    vertical = numpy.abs(numpy.diff(luma, axis=1)) > THRESHOLD
+    horizontal = numpy.abs(numpy.diff(luma, axis=0)) > THRESHOLD
+    if cancelled():
+        return None
+    vertical = _long_runs(vertical, MIN_LENGTH)
+    if cancelled():
+        return None
+    horizontal = _long_runs(horizontal.T, MIN_LENGTH)
+    if cancelled():
+        return None
+
+    edges = EdgeMap(width, height, _index(vertical), _index(horizontal))
+    log.debug(
+        'found %i edge pixels on %ix%i in %.1f ms',
+        len(edges),
+        width,
+        height,
+        (time.perf_counter() - t0) * 1000,
+    )
+    return edges
+
+
+def _never():
+    return False
+
+
+def _long_runs(mask, length):
+    """Keep only what's in runs of at least `length` down the first axis."""
+    count = mask.shape[0]
+    if count < length:
+        return numpy.zeros_like(mask)
+    # Sums of every `length` long window via the running total.
+    total = numpy.zeros((count + 1,) + mask.shape[1:], numpy.uint16)
+    numpy.cumsum(mask, axis=0, dtype=numpy.uint16, out=total[1:])
+    full = (total[length:] - total[:-length]) == length
+    # A pixel is in a long run if any full window starting up to `length` before covers it.
+    starts = numpy.zeros_like(total)
+    numpy.cumsum(full, axis=0, dtype=numpy.uint16, out=starts[1 : len(full) + 1])
+    starts[len(full) + 1 :] = starts[len(full)]
+    lower = numpy.maximum(numpy.arange(count) - length + 1, 0)
+    return (starts[1:] - starts[lower]) > 0
+
+
+def _index(mask):
+    """Offsets per row of the mask & the column positions of its edges, +1 for the boundary."""
+    rows, positions = numpy.nonzero(mask)
+    offsets = numpy.searchsorted(rows, numpy.arange(mask.shape[0] + 1))
+    return offsets, (positions + 1).astype(numpy.uint16)
+
+
+def _nearest(index, line, value, distance):
+    offsets, positions = index
+    if not 0 <= line < len(offsets) - 1:
+        return None
+    found = positions[offsets[line] : offsets[line + 1]]
+    i = int(numpy.searchsorted(found, value))
+    best = None
+    for candidate in found[max(i - 1, 0) : i + 1]:
+        candidate = float(candidate)
+        if abs(candidate - value) <= distance and (
+            best is None or abs(candidate - value) < abs(best - value)
+        ):
+            best = candidate
+    return best
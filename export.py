@@ -0,0 +1,113 @@
+"""
+Encode & write images off the GUI thread.
+
+Saving a 4K PNG can take a good while. So compositing & encoding happens
+on a `QThreadPool` of the `Exporter`, which just signals back when done.
+Its own pool, so waiting for the saves doesn't wait for anything else.
+"""
+import os
+import time
+
+import common
+import tracing
+from pyside import QtCore, QtGui
+
+log = common.get_logger(f'{common.NAME}.export')
+# Output presets: name: (file suffix, Qt format name, quality).
+# For PNG Qt maps quality to zlib level: 100 = uncompressed, -1 = default.
+FORMATS = {
+    'PNG': ('png', 'PNG', -1),
+    'PNG fast': ('png', 'PNG', 80),
+    'PNG uncompressed': ('png', 'PNG', 100),
+    'BMP uncompressed': ('bmp', 'BMP', -1),
+    'WebP': ('webp', 'WEBP', 90),
+    'WebP lossless': ('webp', 'WEBP', 100),
+    'JPEG': ('jpg', 'JPG', 90),
+}
+DEFAULT_FORMAT = 'PNG'
+# Other suffixes people type for a preset suffix.
+SUFFIX_ALIASES = {'jpeg': 'jpg'}
+
+
+def available_formats():
+    """List the preset names Qt can actually write here."""
+    writable = {bytes(f).decode().upper() for f in QtGui.QImageWriter.supportedImageFormats()}
+    return [name for name, (_, fmt, _) in FORMATS.items() if fmt in writable]
+
+
+def file_filter(name):
+    suffix = FORMATS[name][0]
+    return f'{name} (*.{suffix})'
+
+
+def format_from_filter(filter_str):
+    for name in FORMATS:
+        if file_filter(name) == filter_str:
+            return name
+    return DEFAULT_FORMAT
+
+
+def format_from_path(file_path, preferred=DEFAULT_FORMAT):
+    # type: (str, str) -> str | None
+    """
+    Preset to write `file_path` with by its suffix. `preferred` if its suffix
+    fits, else the first available one that does. None for unknown suffixes.
+    """
+    suffix = os.path.splitext(file_path)[1].lower().lstrip('.')
+    suffix = SUFFIX_ALIASES.get(suffix, suffix)
+    if preferred in FORMATS and FORMATS[preferred][0] == suffix:
+        return preferred
+    for name in available_formats():
+        if FORMATS[name][0] == suffix:
+            return name
+    return None
+
+
+class Exporter(QtCore.QObject):
+    saved = QtCore.Signal(str, float)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.saved.connect(self._on_saved)
+        self.failed.connect(self._on_failed)
+
+    def save(self, region, file_path, format_name=DEFAULT_FORMAT, sprites=(), annotations=()):
+        # type: (region.Region, str, str, list[tuple[QtCore.QRectF, QtGui.QImage]], list) -> None
+        """Write a screenshot region to `file_path`. Returns right away."""
+        _, fmt, quality = FORMATS.get(format_name, FORMATS[DEFAULT_FORMAT])
+        job = _SaveJob(self, region, list(sprites), list(annotations), file_path, fmt, quality)
+        self.pool.start(job)
+        tracing.counter('export', active=self.pool.activeThreadCount())
+
+    def wait(self, msecs=-1):
+        """Block until all pending jobs are written."""
+        return self.pool.waitForDone(msecs)
+
+    def _on_saved(self, file_path, seconds):
+        log.info('saved "%s" in %.1f ms', file_path, seconds * 1000)
+
+    def _on_failed(self, file_path):
+        log.error('Could not save "%s"!', file_path)
+
+
+class _SaveJob(QtCore.QRunnable):
+    def __init__(self, exporter, region, sprites, annotations, file_path, fmt, quality):
+        super().__init__()
+        self.exporter = exporter
+        self.region = region
+        self.sprites = sprites
+        self.annotations = annotations
+        self.file_path = file_path
+        self.fmt = fmt
+        self.quality = quality
+
+    @tracing.traced('export.encode')
+    def run(self):
+        t0 = time.perf_counter()
+        cutout = self.region.composited(self.sprites, self.annotations)
+        if cutout.save(self.file_path, self.fmt, self.quality):
+            self.exporter.saved.emit(self.file_path, time.perf_counter() - t0)
+        else:
+            self.exporter.failed.emit(self.file_path)
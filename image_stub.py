@@ -18,16 +18,19 @@ class ImageStub:
 
     def __init__(self):
         self._blank = self._get_ico()
+        self.arrow = self._blank
         self.camera = self._blank
         self.check = self._blank
         self.clipboard = self._blank
         self.crop = self._blank
         self.down = self._blank
         self.edit = self._blank
+        self.eye_off = self._blank
         self.file = self._blank
         self.film = self._blank
         self.folder = self._blank
         self.github = self._blank
+        self.grid = self._blank
         self.info = self._blank
         self.link = self._blank
         self.maximize = self._blank
@@ -43,6 +46,7 @@ class ImageStub:
         self.refresh = self._blank
         self.save = self._blank
         self.settings = self._blank
+        self.square = self._blank
         self.type = self._blank
         self.update = self._blank
         self.upload = self._blank
@@ -1,12 +1,22 @@
 import os
+import sys
+import time
 import logging
 import traceback
 
+import annotations
+import anim_export
 import common
+import edges
+import export
 import image_stub
 import video_man
 import widgets
 import overlay
+import region
+import screens
+import tracing
+import windows
 from pyside import QtCore, QtGui, QtWidgets
 
 log = common.get_logger(common.NAME)
@@ -16,12 +26,41 @@ MODE_VID = 'Video'
 IMG = image_stub.IMG
 SETTINGS = common.SETTINGS
 CURSOR_KEYS = {'Left': (-1, 0), 'Up': (0, -1), 'Right': (1, 0), 'Down': (0, 1)}
+# Keys picking an annotation tool. Pressed again it's back to drawing the rectangle.
+TOOL_KEYS = {
+    'P': annotations.PEN,
+    'A': annotations.ARROW,
+    'R': annotations.RECT,
+    'T': annotations.TEXT,
+    'B': annotations.BLUR,
+    'X': annotations.PIXELATE,
+}
+# Annotation tools in the order the toolbox button goes through them.
+TOOLS = ('',) + annotations.kinds()
+# Longest we wait for pending saves & video capture when closing for good.
+TEARDOWN_TIMEOUT = 2000
+# Image formats `edges.find` takes as they are.
+_EDGE_FORMATS = (
+    QtGui.QImage.Format_RGB32,
+    QtGui.QImage.Format_ARGB32,
+    QtGui.QImage.Format_ARGB32_Premultiplied,
+)
 
 
 class Kiekste(QtWidgets.QGraphicsView):
-    def __init__(self):
+    def __init__(self, resident=False):
         super().__init__()
+        # When resident we're kept alive in the background and only hide on close.
+        self.resident = resident
+        self._t_request = None
+        self._t_close = None
         self.paint_layer = PaintLayer(self)
+        self.window_provider = windows.pick(SETTINGS.window_provider)
+        self.windows = windows.WindowIndex([])
+        self._window_indexer = None  # type: _WindowIndexer | None
+        # Edges on the screenshot to snap to. Found in the background.
+        self.edges = None  # type: edges.EdgeMap | None
+        self._edge_finder = None  # type: _EdgeFinder | None
 
         self._setup_ui()
         self._cursor_pos = None
@@ -30,6 +69,9 @@ class Kiekste(QtWidgets.QGraphicsView):
         self.overlay.cursor_change.connect(self.set_cursor)
 
         self.toolbox = None  # type: None | ToolBox
+        self.exporter = export.Exporter(self)
+        self.exporter.failed.connect(self._save_failed)
+        self._messages = []  # type: list[QtWidgets.QMessageBox]
         self.videoman = video_man.VideoMan(self)
         self.videoman.video_found.connect(self._found_video_tool)
 
@@ -41,12 +83,49 @@ class Kiekste(QtWidgets.QGraphicsView):
 
         for seq in (QtCore.Qt.ALT + QtCore.Qt.Key_V,):
             QtGui.QShortcut(QtGui.QKeySequence(seq), self, self.video_capture)
+        for seq in (QtCore.Qt.ALT + QtCore.Qt.Key_G,):
+            QtGui.QShortcut(QtGui.QKeySequence(seq), self, self.save_animation)
 
         for side in CURSOR_KEYS:
             QtGui.QShortcut(QtGui.QKeySequence.fromString(side), self, self.shift_rect)
+        for key in TOOL_KEYS:
+            QtGui.QShortcut(QtGui.QKeySequence.fromString(key), self, self.pick_tool)
+        QtGui.QShortcut(QtGui.QKeySequence.Undo, self, self.paint_layer.undo)
+        QtGui.QShortcut(QtGui.QKeySequence.Redo, self, self.paint_layer.redo)
+        QtGui.QShortcut(QtGui.QKeySequence.Delete, self, self.paint_layer.clear)
 
         self.set_cursor(QtCore.Qt.CrossCursor)
+        if not resident:
+            self.show()
+
+    def capture(self, t_request=None):
+        """Grab a new screenshot and bring up the pre-built overlay again."""
+        self._t_request = time.time() if t_request is None else t_request
+        if self.isVisible():
+            self.activateWindow()
+            return
+
+        self.set_screenshot()
+        self._draw_last_tangle()
+        if self.toolbox is not None:
+            self.toolbox.show()
         self.show()
+        self.raise_()
+        self.activateWindow()
+
+    def paintEvent(self, event):
+        result = super().paintEvent(event)
+        if self._t_request is not None:
+            log.info('time-to-overlay: %.1f ms', (time.time() - self._t_request) * 1000)
+            self._t_request = None
+        return result
+
+    def closeEvent(self, event):
+        if self.resident:
+            event.ignore()
+            self.hide()
+            return
+        return super().closeEvent(event)
 
     def showEvent(self, event):
         self.overlay.dim()
@@ -65,7 +144,28 @@ class Kiekste(QtWidgets.QGraphicsView):
         trigger_key = short_cut.key().toString()
         shift = CURSOR_KEYS.get(trigger_key)
         if shift:
-            self.overlay.shift_rect(*shift)
+            self.overlay.shift_rect(QtCore.QPointF(*shift))
+
+    def pick_tool(self):
+        short_cut = self.sender()
+        if not isinstance(short_cut, QtGui.QShortcut):
+            return
+        tool = TOOL_KEYS.get(short_cut.key().toString(), '')
+        self.set_tool('' if tool == self.paint_layer.tool else tool)
+
+    def set_tool(self, tool):
+        # type: (str) -> None
+        """Annotate with one of `annotations.KINDS`. Empty goes back to the rectangle."""
+        if self.paint_layer.drawing:
+            return
+        if tool not in TOOLS:
+            log.warning('The "%s" tool is not available here!', tool)
+            return
+        self.paint_layer.tool = tool
+        if self.toolbox is not None:
+            self.toolbox.show_tool(tool)
+        if tool:
+            self.set_cursor(QtCore.Qt.CrossCursor)
 
     def wheelEvent(self, event: QtGui.QWheelEvent) -> None:
         try:
@@ -77,6 +177,9 @@ class Kiekste(QtWidgets.QGraphicsView):
 
     def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:
         if event.buttons() & QtCore.Qt.LeftButton:
+            if self.paint_layer.tool:
+                self.paint_layer.press(event.position())
+                return
             if self.paint_layer.has_item_under_mouse():
                 pass
             else:
@@ -84,6 +187,9 @@ class Kiekste(QtWidgets.QGraphicsView):
         return super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event: QtGui.QMouseEvent) -> None:
+        if self.paint_layer.tool:
+            self.paint_layer.move(event.position())
+            return
         if self.paint_layer.has_item_under_mouse():
             self.set_cursor(QtCore.Qt.ArrowCursor)
             return
@@ -95,46 +201,165 @@ class Kiekste(QtWidgets.QGraphicsView):
             return
         if event.key() == QtCore.Qt.Key_Space:
             self.overlay.space_press(True)
+        elif event.key() == QtCore.Qt.Key_Control:
+            self.overlay.snap_press(True)
 
     def keyReleaseEvent(self, event: QtGui.QKeyEvent) -> None:
         if event.isAutoRepeat():
             return
         if event.key() == QtCore.Qt.Key_Space:
             self.overlay.space_press(False)
+        elif event.key() == QtCore.Qt.Key_Control:
+            self.overlay.snap_press(False)
 
     def mouseReleaseEvent(self, event: QtGui.QMouseEvent) -> None:
+        self.paint_layer.release(event.position())
         self.overlay.mouse_press(False)
 
     def escape(self):
-        import time
-        x = 7
-        d = 0.2
-        for i in range(1, x + 1):
-            self.setWindowOpacity(1 - ((1/x) * i))
-            time.sleep(d / x)
-        self.close()
+        """Vanish right away. Everything else is cleaned up once the event loop is back."""
+        if self._t_close is not None:
+            return
+        self._t_close = time.perf_counter()
+        if self.toolbox is not None:
+            self.toolbox.hide()
+        self.hide()
+        QtCore.QTimer.singleShot(0, self._teardown)
+
+    def _teardown(self):
+        log.info('close-to-hidden: %.1f ms', (time.perf_counter() - self._t_close) * 1000)
+        self._t_close = None
+        self.overlay.stop_animations()
 
-    def set_screenshot(self):
-        screen = QtGui.QGuiApplication.primaryScreen()
-        geo = screen.geometry()
-        self._cursor_pos = self.cursor().pos()
-        self.pixmap = screen.grabWindow(0)
-        self.setBackgroundBrush(QtGui.QBrush(self.pixmap))
+        if self.resident:
+            # Keep everything built, just let go of the screenshot and all made from it.
+            # The desktop geometry stays for replays started while hidden.
+            self._stop_edge_finder()
+            self.setBackgroundBrush(QtGui.QBrush())
+            self.resetCachedContent()
+            self.pixmap = QtGui.QPixmap()
+            self.image = QtGui.QImage()
+            self.desktop.release()
+            self.edges = None
+            self.paint_layer.reset()
+            self.overlay.loupe.tiles.clear()
+            # One trace per capture. Otherwise it'd pile up until the daemon quits.
+            if tracing.ENABLED:
+                tracing.write()
+            return
+
+        t0 = time.perf_counter()
+        self.videoman.shutdown(TEARDOWN_TIMEOUT)
+        if not self.exporter.wait(_time_left(t0, TEARDOWN_TIMEOUT)):
+            log.warning('Gave up waiting for pending saves!')
+        # Failed saves are told about before quitting. Their message keeps the app up.
+        QtCore.QCoreApplication.sendPostedEvents(self, QtCore.QEvent.MetaCall)
+        if self._window_indexer is not None:
+            if not self._window_indexer.wait(_time_left(t0, TEARDOWN_TIMEOUT)):
+                log.warning('Gave up waiting for the window index!')
+        finder = self._stop_edge_finder()
+        if finder is not None and not finder.wait(_time_left(t0, TEARDOWN_TIMEOUT)):
+            log.warning('Gave up waiting for the edge finder!')
+        self.close()
+        # Closing an already hidden window doesn't count as last window closed.
+        app = QtWidgets.QApplication.instance()
+        if app.quitOnLastWindowClosed() and not any(
+            widget.isVisible() for widget in app.topLevelWidgets()
+        ):
+            app.quit()
+
+    @tracing.traced()
+    def set_screenshot(self, desktop=None):
+        # type: (screens.Desktop | None) -> screens.Desktop
+        """Grab all screens (or take the given desktop) and show it as background."""
+        if desktop is None:
+            desktop = screens.grab_desktop()
+        self.desktop = desktop
+        self.image = desktop.image
+        self.pixmap = QtGui.QPixmap.fromImage(self.image)
+        # The composite has more pixels than the scene has units on HighDPI screens.
+        brush = QtGui.QBrush(self.pixmap)
+        brush.setTransform(QtGui.QTransform.fromScale(1 / desktop.ratio, 1 / desktop.ratio))
+        self.setBackgroundBrush(brush)
+
+        self._cursor_pos = QtCore.QPointF(self.cursor().pos() - desktop.origin)
         self.paint_layer.set_cursor_pos(self._cursor_pos)
-        return screen, geo
+        self.paint_layer.reset()
+        self._index_windows(self._list_windows(desktop))
+        self._find_edges(desktop.image)
+        if self.scene() is not None:
+            self._fit_desktop()
+        return desktop
+
+    def _find_edges(self, image):
+        # type: (QtGui.QImage) -> None
+        self.edges = None
+        self._stop_edge_finder()
+        if not SETTINGS.snap_edges or not edges.available():
+            return
+        self._edge_finder = _EdgeFinder(self, image)
+        self._edge_finder.found.connect(self._edges_found)
+        self._edge_finder.finished.connect(self._edge_finder.deleteLater)
+        self._edge_finder.start()
+
+    def _stop_edge_finder(self):
+        # type: () -> _EdgeFinder | None
+        """Tell a running edge finder to give up. It's returned to wait for."""
+        finder, self._edge_finder = self._edge_finder, None
+        if finder is not None:
+            finder.requestInterruption()
+        return finder
+
+    def _edges_found(self, edge_map):
+        # Might be for a screenshot that was replaced in the meantime.
+        if self.sender() is self._edge_finder:
+            self.edges = edge_map
+            self._edge_finder = None
+
+    def _index_windows(self, index):
+        # type: (windows.WindowIndex) -> None
+        """Build `index` in the background. Until it's done there's nothing to snap to."""
+        self.windows = windows.WindowIndex([])
+        self._window_indexer = _WindowIndexer(self, index)
+        self._window_indexer.built.connect(self._windows_indexed)
+        self._window_indexer.finished.connect(self._window_indexer.deleteLater)
+        self._window_indexer.start()
+
+    def _windows_indexed(self, index):
+        # Might be for a screenshot that was replaced in the meantime.
+        if self.sender() is self._window_indexer:
+            self.windows = index
+            self._window_indexer = None
+
+    def _list_windows(self, desktop):
+        # type: (screens.Desktop) -> windows.WindowIndex
+        """Windows to snap to, as they were when grabbing. Not indexed yet."""
+        t0 = time.perf_counter()
+        found = []
+        for window in self.window_provider.windows():
+            left, top, right, bottom = window.rect
+            rect = desktop.from_native(QtCore.QRect(left, top, right - left, bottom - top))
+            scene_rect = (rect.left(), rect.top(), rect.right(), rect.bottom())
+            found.append(window._replace(rect=scene_rect))
+        log.debug(
+            'listed %i windows via %s in %.1f ms',
+            len(found),
+            self.window_provider.name,
+            (time.perf_counter() - t0) * 1000,
+        )
+        return windows.WindowIndex(found)
 
+    @tracing.traced()
     def _setup_ui(self):
         self.setWindowTitle(common.NAME)
         self.setMouseTracking(True)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
 
-        screen, geo = self.set_screenshot()
-        # w, h = geo.width(), geo.height()
-        w, h = self.pixmap.width(), self.pixmap.height()
-        scene = QtWidgets.QGraphicsScene(0, 0, w, h)
+        desktop = self.set_screenshot()
+        scene = QtWidgets.QGraphicsScene(desktop.scene_rect)
         self.setScene(scene)
-        self.setViewportUpdateMode(QtWidgets.QGraphicsView.BoundingRectViewportUpdate)
+        self.setViewportUpdateMode(QtWidgets.QGraphicsView.MinimalViewportUpdate)
         self.setCacheMode(QtWidgets.QGraphicsView.CacheBackground)
         self.setRenderHints(QtGui.QPainter.Antialiasing | QtGui.QPainter.SmoothPixmapTransform)
 
@@ -145,31 +370,30 @@ class Kiekste(QtWidgets.QGraphicsView):
             | QtCore.Qt.FramelessWindowHint
         )
         self.setStyleSheet('QGraphicsView {background:transparent;}')
+        self.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop)
+        self._fit_desktop()
+        return desktop
 
+    def _fit_desktop(self):
+        """Span the window over the whole virtual desktop."""
+        geo = self.desktop.geometry
+        self.scene().setSceneRect(self.desktop.scene_rect)
         # Because there is a white border that I can't get rid of,
         # lets shift and size the window a little:
-        geo_hack = QtCore.QRect(-1, -1, w + 2, h + 3)
-        # geo_hack = QtCore.QRect(0,0,w,h)
+        geo_hack = geo.adjusted(-1, -1, 1, 2)
         self.setGeometry(geo_hack)
 
-        # Now we need to adjust the scaling to compensate for that.
-        # on top of the scaling we do for HighDPI scaled desktop vs pixels grabbed.
-        self.scale_factor = geo.width() / w
-        # pix_rect = self.pixmap.rect()
-        # self.scale(geo.width() * width_factor / pix_rect.width(), geo.height() / pix_rect.height())
-
-        self.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop)
-        return screen
-
     def _build_toolbox(self):
         self.toolbox = ToolBox(self)
 
         self.toolbox.close_requested.connect(self.escape)
         self.toolbox.save.connect(self.save_shot)
         self.toolbox.clip.connect(self.clip)
-        self.toolbox.coords_changed.connect(self.overlay.set_rect)
+        self.toolbox.coords_changed.connect(self.overlay.set_output_rect)
         self.toolbox.mode_switched.connect(self._change_mode)
         self.toolbox.pointer_toggled.connect(self.toggle_pointer)
+        self.toolbox.tool_switched.connect(self.set_tool)
+        self.toolbox.show_tool(self.paint_layer.tool)
         self.overlay.rect_change.connect(self.toolbox.set_spinners)
         self.activateWindow()
 
@@ -179,41 +403,72 @@ class Kiekste(QtWidgets.QGraphicsView):
             cursor.setShape(shape)
             self.setCursor(cursor)
 
+    @tracing.traced()
     def save_shot(self):
         rect = self.overlay.rect
         if not rect:
             return
+        formats = export.available_formats()
+        if SETTINGS.image_format not in formats:
+            SETTINGS.image_format = export.DEFAULT_FORMAT
         file_path, file_type = QtWidgets.QFileDialog.getSaveFileName(
             self,
             common.NAME + ' Save Screenshot',
             SETTINGS.last_save_path or common.PATH,
-            'PNG (*.png)',
+            ';;'.join(export.file_filter(name) for name in formats),
+            export.file_filter(SETTINGS.image_format),
         )
         if not file_path:
             return
 
+        # A typed suffix decides the format. Without a known one it's the filter's.
+        fmt = export.format_from_filter(file_type)
+        typed_fmt = export.format_from_path(file_path, fmt)
+        if typed_fmt is None:
+            file_path = f'{file_path}.{export.FORMATS[fmt][0]}'
+        else:
+            fmt = typed_fmt
+
         self.overlay.flash()
-        cutout = self.pixmap.copy(QtCore.QRect(rect.x(), rect.y(), rect.width(), rect.height()))
-        cutout.save(file_path)
+        SETTINGS.image_format = fmt
+        self.exporter.save(
+            region.Region(self.image, rect.toRect()),
+            file_path,
+            SETTINGS.image_format,
+            self.paint_layer.sprites(),
+            self.paint_layer.annotations.overlapping(rect),
+        )
         SETTINGS.last_save_path = os.path.dirname(file_path)
         self._save_rect()
 
+    def _save_failed(self, file_path):
+        """Tell about it. Even with the window already gone."""
+        box = QtWidgets.QMessageBox(
+            QtWidgets.QMessageBox.Warning,
+            f'{common.NAME} Save Screenshot',
+            f'Could not save the screenshot to\n"{file_path}"!',
+            QtWidgets.QMessageBox.Ok,
+        )
+        # A window of its own. So closing it can still quit with the view gone.
+        self._messages.append(box)
+        box.finished.connect(lambda: self._messages.remove(box))
+        box.show()
+
+    @tracing.traced()
     def clip(self):
         rect = self.overlay.rect
         if not rect:
             return
-        cutout = self.pixmap.copy(QtCore.QRect(rect.x(), rect.y(), rect.width(), rect.height()))
-        if SETTINGS.draw_pointer:
-            painter = QtGui.QPainter()
-            painter.begin(cutout)
-            trg_rect = QtCore.QRectF(0,0,rect.width(), rect.height())
-            self.overlay.hide_rects()
-            self.scene().render(painter, trg_rect, rect)
-            self.overlay.show_rects()
-            painter.end()
+        cutout = region.Region(self.image, rect.toRect())
+        image = cutout.composited(
+            self.paint_layer.sprites(), self.paint_layer.annotations.overlapping(rect)
+        )
+        if image is cutout.image():
+            # The clipboard outlives the region so it needs its own pixels.
+            image = image.copy()
 
         self.overlay.flash()
-        QtWidgets.QApplication.clipboard().setPixmap(cutout)
+        QtWidgets.QApplication.clipboard().setImage(image)
 
         self._save_rect()
 
@@ -232,12 +487,14 @@ class Kiekste(QtWidgets.QGraphicsView):
         if SETTINGS.last_rectangles:
             log.debug(f'last rectangle: {SETTINGS.last_rectangles[-1]}')
             rect = QtCore.QRect(*SETTINGS.last_rectangles[-1])
-            self.overlay.set_rect(rect)
+            self.overlay.set_output_rect(rect)
             if self.toolbox is None:
                 return
             self.toolbox.set_spinners(rect)
 
     def _found_video_tool(self):
+        native = self.desktop.to_native(self.desktop.scene_rect)
+        self.videoman.probe_limits(native.width(), native.height())
         if self.toolbox is None:
             return
         self.toolbox.add_mode(MODE_VID)
@@ -259,22 +516,93 @@ class Kiekste(QtWidgets.QGraphicsView):
             self.overlay.undim()
             self.video_widget = video_man.VideoWidget(self, self.videoman)
             widget_geo = self.video_widget.geometry()
-            widget_geo.setX(self.overlay.rect.x())
-            widget_geo.setY(self.overlay.rect.bottom() + 10)
+            widget_geo.setX(self.overlay.scene_rect.x())
+            widget_geo.setY(self.overlay.scene_rect.bottom() + 10)
             self.video_widget.show()
             self.video_widget.setGeometry(widget_geo)
             self.setBackgroundBrush(QtGui.QBrush())
-            self.videoman.capture(self.overlay.rect)
+            self.videoman.capture(self.desktop, self.overlay.scene_rect)
             self.videoman.capture_stopped.connect(self._on_capture_stopped)
         else:
             self.video_widget.stop()
 
+    def save_animation(self):
+        """Ask where to save the last recording as GIF, APNG or WebP."""
+        if self.videoman.capturing or self.videoman.last_capture is None:
+            log.warning('No finished recording to save as animation!')
+            return
+        filters = {
+            f'{name} (*.{suffix})': name for name, suffix in anim_export.FORMATS.items()
+        }
+        file_path, file_type = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            common.NAME + ' Save Animation',
+            SETTINGS.last_save_path or common.PATH,
+            ';;'.join(filters),
+        )
+        if not file_path:
+            return
+        fmt = anim_export.format_from_path(file_path, None)
+        if fmt is None:
+            fmt = filters.get(file_type, anim_export.GIF)
+            file_path = f'{file_path}.{anim_export.FORMATS[fmt]}'
+        self.videoman.save_animation(file_path, fmt)
+        SETTINGS.last_save_path = os.path.dirname(file_path)
+
+    def start_replay(self):
+        """Keep the last rectangle recording in the background. See `VideoMan.start_replay`."""
+        if not SETTINGS.last_rectangles:
+            log.warning('No rectangle drawn yet to replay!')
+            return
+        rect = QtCore.QRect(*SETTINGS.last_rectangles[-1])
+        self.videoman.start_replay(self.desktop, self.desktop.from_image(rect))
+
     def _on_capture_stopped(self):
         self.hide()
         self.set_screenshot()
         self.show()
 
 
+class _EdgeFinder(QtCore.QThread):
+    found = QtCore.Signal(object)
+
+    def __init__(self, parent, image):
+        # type: (Kiekste, QtGui.QImage) -> None
+        super().__init__(parent)
+        # Shares the pixels with the screenshot. Read only, so fine across threads.
+        self.image = image
+        if image.format() not in _EDGE_FORMATS:
+            self.image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+
+    @tracing.traced('edges.find')
+    def run(self):
+        image = self.image
+        edge_map = edges.find(
+            image.constBits(),
+            image.width(),
+            image.height(),
+            image.bytesPerLine(),
+            self.isInterruptionRequested,
+        )
+        if edge_map is not None:
+            self.found.emit(edge_map)
+
+
+class _WindowIndexer(QtCore.QThread):
+    built = QtCore.Signal(object)
+
+    def __init__(self, parent, index):
+        # type: (Kiekste, windows.WindowIndex) -> None
+        super().__init__(parent)
+        # Not looked at by anyone else until it's handed back.
+        self.index = index
+
+    @tracing.traced('windows.index')
+    def run(self):
+        self.index.build()
+        self.built.emit(self.index)
+
+
 class PaintLayer(QtCore.QObject):
     item_under_cursor = QtCore.Signal()
 
@@ -286,10 +614,138 @@ class PaintLayer(QtCore.QObject):
         self.items = []  # type: list[QtWidgets.QGraphicsItem]
         self.pointer = None
 
+        # Annotations in screenshot pixels & the item painting them, made on first use.
+        self.annotations = annotations.DisplayList()
+        self.annotation_item = None  # type: annotations.AnnotationItem | None
+        # Annotation tool in use. Empty when drawing the rectangle.
+        self.tool = ''
+        self._live = None  # type: annotations.Annotation | None
+        # Blurred or pixelated screenshot per mode & size, in tiles made when needed.
+        self._redacted = {}  # type: dict[tuple[str, int], annotations.Redacted]
+
     def set_cursor_pos(self, cursor_pos):
         # type: (QtCore.QPointF | QtCore.QPoint) -> None
         self._cursor_pos = cursor_pos
 
+    def sprites(self):
+        """Visible items as target rects in screenshot pixels and their images."""
+        desktop = self._parent.desktop
+        result = []
+        for item in self.items:
+            if not item.isVisible() or not isinstance(item, QtWidgets.QGraphicsPixmapItem):
+                continue
+            target = desktop.to_image(item.sceneBoundingRect())
+            result.append((target, item.pixmap().toImage()))
+        return result
+
+    @property
+    def drawing(self):
+        return self._live is not None
+
+    def reset(self):
+        """Drop all annotations & their history, as for a new screenshot."""
+        self._live = None
+        self.annotations.reset()
+        self._redacted.clear()
+        if self.annotation_item is not None:
+            desktop = self._parent.desktop
+            self.annotation_item.live = None
+            self.annotation_item.set_geometry(desktop.scene_rect, desktop.ratio)
+
+    def press(self, pos):
+        # type: (QtCore.QPointF) -> None
+        """Start an annotation with the current tool at scene point `pos`."""
+        ratio = self._parent.desktop.ratio
+        point = pos * ratio
+        width = SETTINGS.annotation_width * ratio
+        if self.tool == annotations.TEXT:
+            text, ok = QtWidgets.QInputDialog.getText(self._parent, common.NAME, 'Text:')
+            if ok and text:
+                annotation = annotations.Annotation(
+                    self.tool, [point], SETTINGS.annotation_color, width, text
+                )
+                self.annotations.add(annotation)
+                self._item().invalidate(annotation.bounds)
+            return
+        if self.tool in annotations.REDACTIONS:
+            size = max(1, round(SETTINGS.redact_size * ratio))
+            self._live = annotations.Redaction([point, point], self._redacted_for(self.tool, size))
+        else:
+            points = [point] if self.tool == annotations.PEN else [point, point]
+            self._live = annotations.Annotation(
+                self.tool, points, SETTINGS.annotation_color, width
+            )
+        item = self._item()
+        item.live = self._live
+        item.invalidate(self._live.bounds)
+
+    def move(self, pos):
+        # type: (QtCore.QPointF) -> None
+        if self._live is None:
+            return
+        self._item().invalidate(self._live.extend(pos * self._parent.desktop.ratio))
+
+    def release(self, pos):
+        # type: (QtCore.QPointF) -> None
+        """Finish the annotation being drawn. It's painted already."""
+        if self._live is None:
+            return
+        self.move(pos)
+        annotation, self._live = self._live, None
+        self._item().live = None
+        if annotation.is_empty():
+            self._item().invalidate(annotation.bounds)
+            return
+        annotation.finish()
+        self.annotations.add(annotation)
+        if isinstance(annotation, annotations.Redaction):
+            # Tiles still computing while drawing are there now.
+            self._item().invalidate(annotation.bounds)
+
+    def undo(self):
+        if not self.drawing:
+            self._invalidate(self.annotations.undo())
+
+    def redo(self):
+        if not self.drawing:
+            self._invalidate(self.annotations.redo())
+
+    def clear(self):
+        if not self.drawing:
+            cleared = tuple(self.annotations)
+            self.annotations.clear()
+            self._invalidate(cleared)
+
+    def _invalidate(self, changed):
+        # type: (tuple[annotations.Annotation, ...]) -> None
+        for annotation in changed:
+            self._item().invalidate(annotation.bounds)
+
+    def _redacted_for(self, mode, size):
+        # type: (str, int) -> annotations.Redacted
+        key = (mode, size)
+        if key not in self._redacted:
+            redacted = annotations.Redacted(self._parent.image, mode, size)
+            redacted.ready.connect(self._redaction_ready)
+            self._redacted[key] = redacted
+        return self._redacted[key]
+
+    def _redaction_ready(self, area):
+        # type: (QtCore.QRect) -> None
+        if self._live is not None:
+            self._item().invalidate(QtCore.QRectF(area))
+
+    def _item(self):
+        if self.annotation_item is None:
+            desktop = self._parent.desktop
+            self.annotation_item = annotations.AnnotationItem(
+                self.annotations, desktop.scene_rect, desktop.ratio
+            )
+            # Under the overlay, so it's dimmed outside the rectangle like the rest.
+            self.annotation_item.setZValue(50)
+            self._parent.scene().addItem(self.annotation_item)
+        return self.annotation_item
+
     def has_item_under_mouse(self):
         for item in self.items:
             if item.isUnderMouse():
@@ -318,6 +774,7 @@ class ToolBox(QtWidgets.QWidget):
     clip = QtCore.Signal()
     coords_changed = QtCore.Signal(QtCore.QRect)
     pointer_toggled = QtCore.Signal(bool)
+    tool_switched = QtCore.Signal(str)
 
     def __init__(self, parent: Kiekste):
         super().__init__(parent)
@@ -336,6 +793,7 @@ class ToolBox(QtWidgets.QWidget):
             self.pointer_btn = widgets._TbBtn(self, IMG.pointer, self.toggle_pointer)
         else:
             self.pointer_btn = widgets._TbBtn(self, IMG.pointer_off, self.toggle_pointer)
+        self.tool_button = widgets._TbBtn(self, IMG.crop, self.toggle_tool)
         self.mode_button = widgets._TbBtn(self, IMG.camera, self.toggle_mode)
         self.settings_btn = widgets._TbBtn(self, IMG.settings)
         widgets._TbBtn(self, IMG.x, self.x)
@@ -344,6 +802,16 @@ class ToolBox(QtWidgets.QWidget):
         self._mode = MODE_CAM
         self._modes = [self._mode]
         self._modes_db = {MODE_CAM: IMG.camera, MODE_VID: IMG.video}
+        self._tool = ''
+        self._tools_db = {
+            '': IMG.crop,
+            annotations.PEN: IMG.pen,
+            annotations.ARROW: IMG.arrow,
+            annotations.RECT: IMG.square,
+            annotations.TEXT: IMG.type,
+            annotations.BLUR: IMG.eye_off,
+            annotations.PIXELATE: IMG.grid,
+        }
         self.show()
         self.setWindowOpacity(0.4)
 
@@ -387,6 +855,15 @@ class ToolBox(QtWidgets.QWidget):
         self.mode_button.setIcon(self._modes_db[self._mode])
         self.mode_switched.emit(self._mode)
 
+    def toggle_tool(self):
+        i = (TOOLS.index(self._tool) + 1) % len(TOOLS)
+        self.tool_switched.emit(TOOLS[i])
+
+    def show_tool(self, tool):
+        # type: (str) -> None
+        self._tool = tool
+        self.tool_button.setIcon(self._tools_db[tool])
+
     def x(self):
         self.close_requested.emit()
         self.hide()
@@ -422,6 +899,12 @@ class ToolBox(QtWidgets.QWidget):
         return super().leaveEvent(event)
 
 
+def _time_left(t0, timeout):
+    # type: (float, int) -> int
+    """Milliseconds left of `timeout` since `t0`."""
+    return max(timeout - int((time.perf_counter() - t0) * 1000), 0)
+
+
 def show():
     app = QtWidgets.QApplication([])
     win = Kiekste()
@@ -429,10 +912,37 @@ def show():
     app.exec()
 
 
+def serve(replay=False):
+    """
+    Run resident: keep everything built but hidden & wait for capture requests.
+    With `replay` the last rectangle is kept recording for instant replays.
+    """
+    import daemon
+
+    app = QtWidgets.QApplication([])
+    app.setQuitOnLastWindowClosed(False)
+    server = daemon.Daemon(app)
+    if not server.listen():
+        return
+    win = Kiekste(resident=True)
+    server.capture_requested.connect(win.capture)
+    server.replay_requested.connect(lambda _t: win.videoman.save_replay())
+    server.animation_requested.connect(lambda _t: win.videoman.save_animation())
+    server.quit_requested.connect(app.quit)
+    if replay:
+        win.videoman.video_found.connect(win.start_replay)
+    app.aboutToQuit.connect(server.close)
+    app.aboutToQuit.connect(lambda: win.videoman.shutdown(TEARDOWN_TIMEOUT))
+    app.exec()
+
+
 if __name__ == '__main__':
     try:
         common.setup_logger()
-        show()
+        if '--daemon' in sys.argv[1:]:
+            serve('--replay' in sys.argv[1:])
+        else:
+            show()
     except BaseException:
         error_msg = traceback.format_exc().strip()
         print(error_msg)
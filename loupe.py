@@ -0,0 +1,169 @@
+"""
+Magnify the screenshot pixels around the cursor, for pixel precise rectangles.
+
+The loupe samples from square tiles of the screenshot, made into pixmaps on
+first use. So every frame only scales the few pixels it shows and not the
+whole screenshot. Pixels are drawn as hard edged cells with a grid between.
+Moving it or changing what it shows only repaints its own area.
+"""
+from collections import OrderedDict
+
+from pyside import QtCore, QtGui, QtWidgets
+
+# Screenshot pixels per side of a cached tile.
+TILE_SIZE = 128
+# Most tiles kept. Least recently used go first.
+MAX_TILES = 64
+# Screenshot pixels shown across. Odd, so the one under the cursor is in the middle.
+LOUPE_PIXELS = 15
+# Scene units per magnified pixel.
+CELL_SIZE = 10
+# Distance of the loupe from the cursor in scene units.
+CURSOR_OFFSET = 24
+# Height of the coordinates label below the pixels.
+LABEL_HEIGHT = 16
+
+
+class TileCache:
+    """A screenshot cut into square pixmaps, made when first asked for."""
+
+    def __init__(self, size=TILE_SIZE, limit=MAX_TILES):
+        # type: (int, int) -> None
+        self.size = size
+        self.limit = limit
+        self._image = QtGui.QImage()
+        self._key = None  # type: int | None
+        self._tiles = OrderedDict()  # type: OrderedDict[tuple[int, int], QtGui.QPixmap]
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def set_image(self, image):
+        # type: (QtGui.QImage) -> None
+        """Start over if it's another image than before."""
+        if image.cacheKey() == self._key:
+            return
+        self.clear()
+        self._image = image
+        self._key = image.cacheKey()
+
+    def clear(self):
+        self._tiles.clear()
+        self._image = QtGui.QImage()
+        self._key = None
+
+    def pieces(self, rect):
+        # type: (QtCore.QRect) -> list[tuple[QtCore.QRect, QtGui.QPixmap]]
+        """The parts of `rect` each tile covers, in image pixels, with the tile pixmap."""
+        rect = rect.intersected(self._image.rect())
+        if rect.isEmpty():
+            return []
+        size = self.size
+        found = []
+        for row in range(rect.top() // size, rect.bottom() // size + 1):
+            for column in range(rect.left() // size, rect.right() // size + 1):
+                tile = QtCore.QRect(column * size, row * size, size, size)
+                found.append((rect.intersected(tile), self._tile(column, row)))
+        return found
+
+    def _tile(self, column, row):
+        key = (column, row)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            return pixmap
+        size = self.size
+        pixmap = QtGui.QPixmap.fromImage(self._image.copy(column * size, row * size, size, size))
+        self._tiles[key] = pixmap
+        if len(self._tiles) > self.limit:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+
+class LoupeItem(QtWidgets.QGraphicsItem):
+    """Zoomed pixel grid around a point on the screenshot, placed next to the cursor."""
+
+    def __init__(self):
+        super().__init__()
+        self.setAcceptedMouseButtons(QtCore.Qt.NoButton)
+        self.tiles = TileCache()
+        # Screenshot pixel in the middle.
+        self._pixel = QtCore.QPoint(-1, -1)
+        side = LOUPE_PIXELS * CELL_SIZE
+        self._cells = QtCore.QRectF(0, 0, side, side)
+        self._bounds = self._cells.adjusted(-1, -1, 1, LABEL_HEIGHT + 1)
+        self._grid = []
+        for i in range(1, LOUPE_PIXELS):
+            self._grid.append(QtCore.QLineF(i * CELL_SIZE, 0, i * CELL_SIZE, side))
+            self._grid.append(QtCore.QLineF(0, i * CELL_SIZE, side, i * CELL_SIZE))
+        middle = LOUPE_PIXELS // 2 * CELL_SIZE
+        self._middle = QtCore.QRectF(middle, middle, CELL_SIZE, CELL_SIZE)
+
+        self._grid_pen = QtGui.QPen(QtGui.QColor(128, 128, 128, 90), 0)
+        self._frame_pen = QtGui.QPen(QtCore.Qt.white, 1)
+        self._middle_pen = QtGui.QPen(QtCore.Qt.red, 1)
+        self._label_color = QtGui.QColor(0, 0, 0, 180)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget=None):
+        # Hard edged pixels. Smoothing would blur them into each other.
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        painter.fillRect(self._cells, QtCore.Qt.black)
+        half = LOUPE_PIXELS // 2
+        source = QtCore.QRect(
+            self._pixel.x() - half, self._pixel.y() - half, LOUPE_PIXELS, LOUPE_PIXELS
+        )
+        for part, pixmap in self.tiles.pieces(source):
+            target = QtCore.QRectF(
+                (part.x() - source.x()) * CELL_SIZE,
+                (part.y() - source.y()) * CELL_SIZE,
+                part.width() * CELL_SIZE,
+                part.height() * CELL_SIZE,
+            )
+            size = self.tiles.size
+            part.translate(-(part.x() // size) * size, -(part.y() // size) * size)
+            painter.drawPixmap(target, pixmap, QtCore.QRectF(part))
+
+        painter.setPen(self._grid_pen)
+        painter.drawLines(self._grid)
+        painter.setBrush(QtCore.Qt.NoBrush)
+        painter.setPen(self._middle_pen)
+        painter.drawRect(self._middle)
+        painter.setPen(self._frame_pen)
+        painter.drawRect(self._cells)
+
+        label = QtCore.QRectF(0, self._cells.bottom() + 1, self._cells.width(), LABEL_HEIGHT)
+        painter.fillRect(label, self._label_color)
+        painter.drawText(label, QtCore.Qt.AlignCenter, f'{self._pixel.x()}, {self._pixel.y()}')
+
+    def show_at(self, pos, image, ratio, bounds):
+        # type: (QtCore.QPointF, QtGui.QImage, float, QtCore.QRectF) -> None
+        """Magnify `image` at scene point `pos`, placed next to it within `bounds`."""
+        self.tiles.set_image(image)
+        pixel = QtCore.QPoint(int(pos.x() * ratio), int(pos.y() * ratio))
+        place = self._place(pos, bounds)
+        if place != self.pos():
+            self.setPos(place)
+        if pixel != self._pixel:
+            self._pixel = pixel
+            self.update()
+        if not self.isVisible():
+            self.show()
+
+    def _place(self, pos, bounds):
+        # type: (QtCore.QPointF, QtCore.QRectF) -> QtCore.QPointF
+        """Below right of the cursor. Flipped to the other side where that leaves the screen."""
+        width, height = self._bounds.width(), self._bounds.height()
+        x = pos.x() + CURSOR_OFFSET
+        if x + width > bounds.right():
+            x = pos.x() - CURSOR_OFFSET - width
+        y = pos.y() + CURSOR_OFFSET
+        if y + height > bounds.bottom():
+            y = pos.y() - CURSOR_OFFSET - height
+        # Neither side fits on a tiny screen. Better over the cursor than cut off then.
+        x = max(bounds.left(), min(x, bounds.right() - width))
+        y = max(bounds.top(), min(y, bounds.bottom() - height))
+        return QtCore.QPointF(x, y)
@@ -1,11 +1,24 @@
 from collections import namedtuple
 from pyside import QtCore, QtGui, QtWidgets
 
+import animation
+import common
+import loupe
+import tracing
+import zones
+from zones import ZONE_X, ZONE_TL, ZONE_T, ZONE_TR, ZONE_L, ZONE_R, ZONE_BL, ZONE_B, ZONE_BR
+
 
 DIM_OPACITY = 170
 DIM_DURATION = 200
-DIM_INTERVAL = 20
+FLASH_OPACITY = 100
 RESIZE_HANDLE_WIDTH = 50
+ANIM_DIM = 'dim'
+ANIM_FLASH = 'flash'
+# How far outlines may reach beyond their rectangle. To invalidate them properly.
+OUTLINE_MARGIN = 2
+# Scene pixels within which dragged sides snap to edges on the screenshot.
+EDGE_SNAP_DISTANCE = 6
 
 
 class Overlay(QtCore.QObject):
@@ -17,104 +30,124 @@ class Overlay(QtCore.QObject):
         super().__init__(parent)
         self._lmouse = False
         self._space = False
+        self._snap = False
+        # The rectangle as dragged, before its sides snapped to edges.
+        self._free_rect = None  # type: QtCore.QRectF | None
         self._drawing = None
         self._panning = False
         self._resize = False
         self._rect_set = False
         self._pos = QtCore.QPointF()
+        self._pending_pos = None  # type: QtCore.QPointF | None
         self._under_mouse = None
-
-        self.geo = parent.geometry()
-        self.scale_factor = parent.scale_factor
-        # have some rectangles around the center one. tlrb being: top left right bottom
-        self.rtl = QtWidgets.QGraphicsRectItem()
-        self.rt = QtWidgets.QGraphicsRectItem()
-        self.rtr = QtWidgets.QGraphicsRectItem()
-        self.rl = QtWidgets.QGraphicsRectItem()
-        self.rr = QtWidgets.QGraphicsRectItem()
-        self.rbl = QtWidgets.QGraphicsRectItem()
-        self.rb = QtWidgets.QGraphicsRectItem()
-        self.rbr = QtWidgets.QGraphicsRectItem()
-
-        scene = parent.scene()
-
-        # have a central rectangle
-        self.rx = QtWidgets.QGraphicsRectItem()
-        scene.addItem(self.rx)
-        self.rx.setBrush(QtCore.Qt.transparent)
-        self.rx.setPen(QtGui.QPen(QtCore.Qt.white, 0.5))
-
+        # Mouse moves are handled at most once per display frame.
+        self._frame_timer = QtCore.QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._frame_timer.timeout.connect(self._on_frame)
+
+        self._parent = parent
+        # One item paints dimming, inner rectangle, highlight and resize handle.
+        self.item = _OverlayItem(self.geo)
+        self.item.setZValue(100)
+        parent.scene().addItem(self.item)
+        # Magnified pixels next to the cursor while drawing or resizing.
+        self.loupe = loupe.LoupeItem()
+        self.loupe.setZValue(110)
+        self.loupe.hide()
+        parent.scene().addItem(self.loupe)
+
+        # Zones around the inner rectangle. tlrb being: top left right bottom
         rctpl = namedtuple('rect', ['cursor', 'resize_func'])
         self.rects = {
-            self.rl: rctpl(QtCore.Qt.SizeHorCursor, self._rsz_l),
-            self.rr: rctpl(QtCore.Qt.SizeHorCursor, self._rsz_r),
-            self.rt: rctpl(QtCore.Qt.SizeVerCursor, self._rsz_t),
-            self.rb: rctpl(QtCore.Qt.SizeVerCursor, self._rsz_b),
-            self.rtl: rctpl(QtCore.Qt.SizeFDiagCursor, self._rsz_tl),
-            self.rbr: rctpl(QtCore.Qt.SizeFDiagCursor, self._rsz_br),
-            self.rtr: rctpl(QtCore.Qt.SizeBDiagCursor, self._rsz_tr),
-            self.rbl: rctpl(QtCore.Qt.SizeBDiagCursor, self._rsz_bl),
+            ZONE_L: rctpl(QtCore.Qt.SizeHorCursor, self._rsz_l),
+            ZONE_R: rctpl(QtCore.Qt.SizeHorCursor, self._rsz_r),
+            ZONE_T: rctpl(QtCore.Qt.SizeVerCursor, self._rsz_t),
+            ZONE_B: rctpl(QtCore.Qt.SizeVerCursor, self._rsz_b),
+            ZONE_TL: rctpl(QtCore.Qt.SizeFDiagCursor, self._rsz_tl),
+            ZONE_BR: rctpl(QtCore.Qt.SizeFDiagCursor, self._rsz_br),
+            ZONE_TR: rctpl(QtCore.Qt.SizeBDiagCursor, self._rsz_tr),
+            ZONE_BL: rctpl(QtCore.Qt.SizeBDiagCursor, self._rsz_bl),
         }
+        cursors = {zone: r.cursor for zone, r in self.rects.items()}
+        cursors[zones.CURSOR_MOVE] = QtCore.Qt.SizeAllCursor
+        cursors[zones.CURSOR_NONE] = QtCore.Qt.CrossCursor
+        self._zones = zones.ZoneResolver(cursors, RESIZE_HANDLE_WIDTH)
 
-        self.dim_color = QtGui.QColor(QtCore.Qt.black)
-        self.dim_color.setAlpha(0)
-        for r in self.rects:
-            scene.addItem(r)
-            r.setZValue(100)
-            r.setBrush(self.dim_color)
-            r.setPen(QtGui.QPen(QtCore.Qt.transparent, 0))
-
-        self._fader = _ColorFader(self)
-        self._side_highlight_pen = QtGui.QPen(QtCore.Qt.white, 0.3)
-        self._side_no_highlight_pen = QtGui.QPen(QtCore.Qt.transparent)
-
-        self.rrz = QtWidgets.QGraphicsRectItem()
-        self.handle_color = QtGui.QColor(QtCore.Qt.white)
-        self.handle_color.setAlpha(30)
-        self.handle_color_hover = QtGui.QColor(QtCore.Qt.white)
-        self.handle_color_hover.setAlpha(60)
-        self.rrz.setBrush(self.handle_color)
-        self.rrz.setZValue(200)
-        self.rrz.setPen(self._side_no_highlight_pen)
-        scene.addItem(self.rrz)
+        # Dimming and flashing run independently, repainted together per frame.
+        self._animator = animation.Animator(self, parent)
+        self._animator.frame.connect(self.item.flush)
 
     def hide_rects(self):
-        for rect in self.rects:
-            rect.hide()
-        self.rx.hide()
+        self.item.hide()
 
     def show_rects(self):
-        for rect in self.rects:
-            rect.show()
-        self.rx.show()
+        self.item.show()
+
+    @property
+    def geo(self):
+        return self._parent.sceneRect()
 
     @property
     def rect(self):
-        # return self._output_rect(self.rx.rect().toAlignedRect())
-        return self._output_rect(self.rx.rect())
+        """The inner rectangle in screenshot pixels."""
+        return self._output_rect(self.item.rect)
+
+    @property
+    def scene_rect(self):
+        """The inner rectangle in scene coordinates."""
+        return QtCore.QRectF(self.item.rect)
 
     def shift_rect(self, vector: QtCore.QPointF, rect: QtCore.QRectF = None):
         if rect is None:
-            rect = self.rx.rect()
+            rect = self.scene_rect
         center = rect.center()
         rect.moveCenter(center + vector)
         self._set_rect(rect)
 
     def cursor_move(self, pos: QtCore.QPointF):
+        """
+        Take a new cursor position. Handled right away if there was none this
+        frame yet. Otherwise only the latest is handled when the frame is over.
+        """
+        if self._frame_timer.isActive():
+            self._pending_pos = QtCore.QPointF(pos)
+            return
+        self._apply_move(pos)
+        self._frame_timer.start(self._frame_interval())
+
+    def flush(self):
+        """Handle a pending cursor position now. Before any state changes."""
+        if self._pending_pos is None:
+            return
+        pos, self._pending_pos = self._pending_pos, None
+        self._apply_move(pos)
+
+    def _on_frame(self):
+        if self._pending_pos is None:
+            return
+        self.flush()
+        self._frame_timer.start(self._frame_interval())
+
+    def _frame_interval(self):
+        return animation.frame_interval(self._parent)
+
+    def _apply_move(self, pos: QtCore.QPointF):
+        # Diff to the last handled position. So when coalescing moves
+        # this is the sum of all the deltas in between.
         diff = QtCore.QPointF(pos) - self._pos
-        x = pos.x()
-        y = pos.y()
-        print('xy: %s,%s' % (x, y))
         self._pos.setX(pos.x())
         self._pos.setY(pos.y())
 
+        if self._snap and not self._lmouse:
+            self._preview_window()
         self._check_rect_change()
         self._set_cursor()
 
         if not self._lmouse:
             return
 
-        if self._drawing is None and self._under_mouse is self.rx:
+        if self._drawing is None and self._under_mouse == ZONE_X:
             if not self._panning:
                 self._panning = True
             self.shift_rect(diff)
@@ -126,138 +159,223 @@ class Overlay(QtCore.QObject):
                 if self._drawing is None:
                     self._drawing = QtCore.QRectF(pos, QtCore.QPointF(0, 0))
 
-                self.rrz.hide()
-                self.rrz.setRect(-100, -100, 0, 0)
+                self.item.set_handle(QtCore.QRectF())
 
                 if self._space:
                     self.shift_rect(diff, self._drawing)
                 else:
                     self._drawing.setBottomRight(pos)
-                    self._set_rect(self._drawing)
+                    self._set_rect(self._drawing, ZONE_TL + ZONE_BR)
+            self._show_loupe()
+
+    def _show_loupe(self):
+        if not common.SETTINGS.show_loupe:
+            return
+        if not self._resize and self._drawing is None:
+            return
+        parent = self._parent
+        self.loupe.show_at(self._pos, parent.image, parent.desktop.ratio, self.geo)
 
     def _check_rect_change(self):
         if self._lmouse:
             return
 
-        if self.rx.isUnderMouse():
-            under_mouse = self.rx
+        hit = self._zones.resolve(self._pos.x(), self._pos.y())
+        if hit.zone == self._under_mouse:
+            return
+        self._under_mouse = hit.zone
+        self._update_zone_items()
+
+    def _update_zone_items(self):
+        """Highlight the side zone under the mouse and show its resize handle."""
+        if self._under_mouse in self.rects:
+            self.item.set_highlight(_qrect(self._zones.zone_rect(self._under_mouse)))
+            if self._drawing is None:
+                self.item.set_handle(_qrect(self._zones.handle_rect(self._under_mouse)))
         else:
-            for rect in self.rects:
-                if rect.isUnderMouse():
-                    under_mouse = rect
-                    break
-            else:
-                under_mouse = self.rx
+            self.item.set_highlight(QtCore.QRectF())
+            self.item.set_handle(QtCore.QRectF())
 
-        if under_mouse is self._under_mouse:
+    def _set_cursor(self):
+        x, y = self._pos.x(), self._pos.y()
+        if not self._lmouse:
+            hit = self._zones.resolve(x, y)
+            self._resize = False
+            self.item.set_handle_hover(hit.handle)
+            self.cursor_change.emit(hit.cursor)
             return
-        self._under_mouse = under_mouse
 
-        # highlight side rectangles
-        for side_rect in self.rects:
-            if side_rect is under_mouse and not self._lmouse:
-                side_rect.setPen(self._side_highlight_pen)
-            else:
-                side_rect.setPen(self._side_no_highlight_pen)
-        # show resize handle
-        if under_mouse in self.rects:
-            center_rect = self.get_resized_center(RESIZE_HANDLE_WIDTH)
-            handle_rect = center_rect.intersected(under_mouse.rect())
-            self.rrz.setRect(handle_rect)
-            self.rrz.show()
-        else:
-            self.rrz.hide()
+        if self._under_mouse == ZONE_X:
+            self.cursor_change.emit(QtCore.Qt.ClosedHandCursor)
+            return
 
-    def _set_cursor(self):
-        if self._under_mouse is self.rx:
-            if self._lmouse:
-                self.cursor_change.emit(QtCore.Qt.ClosedHandCursor)
-            else:
-                self.cursor_change.emit(QtCore.Qt.SizeAllCursor)
+        on_handle = (
+            self._drawing is None
+            and self._under_mouse is not None
+            and self._zones.handle_hit(self._under_mouse, x, y)
+        )
+        self.item.set_handle_hover(on_handle)
+        if on_handle:
+            self._resize = True
+            self.cursor_change.emit(QtCore.Qt.ClosedHandCursor)
         else:
-            if self.rrz.isUnderMouse():
-                self.rrz.setBrush(self.handle_color_hover)
-                if self._lmouse:
-                    self._resize = True
-                    self.cursor_change.emit(QtCore.Qt.ClosedHandCursor)
-                else:
-                    self._resize = False
-                    if self._under_mouse is not None:
-                        self.cursor_change.emit(self.rects[self._under_mouse].cursor)
-            else:
-                self.rrz.setBrush(self.handle_color)
-                self.cursor_change.emit(QtCore.Qt.CrossCursor)
+            self.cursor_change.emit(QtCore.Qt.CrossCursor)
 
     def mouse_press(self, state):
+        self.flush()
+        if state and self._snap and self._snap_to_window():
+            return
         self._lmouse = state
         self._set_cursor()
         if not state:
             self._panning = False
             self._drawing = None
             self._resize = False
+            self._free_rect = None
+            self.loupe.hide()
 
     def space_press(self, state):
+        self.flush()
         self._space = state
 
+    def snap_press(self, state):
+        """
+        While held the window under the cursor is outlined. Clicking makes it
+        the inner rectangle. Only previews, so Ctrl+C or Ctrl+S keep the rectangle.
+        """
+        self.flush()
+        self._snap = state
+        if state and not self._lmouse:
+            self._preview_window()
+        else:
+            self.item.set_preview(QtCore.QRectF())
+
+    def _preview_window(self):
+        window = self._parent.windows.at(self._pos.x(), self._pos.y())
+        rect = QtCore.QRectF()
+        if window is not None:
+            left, top, right, bottom = window.rect
+            rect = QtCore.QRectF(left, top, right - left, bottom - top).intersected(self.geo)
+        self.item.set_preview(rect)
+
+    def _snap_to_window(self):
+        """Take the outlined window as inner rectangle. False if there is none."""
+        rect = self.item.preview
+        if rect.isEmpty():
+            return False
+        self.item.set_preview(QtCore.QRectF())
+        if rect != self.item.rect:
+            self._set_rect(rect)
+        return True
+
     def wheel_scroll(self, delta):
+        self.flush()
         if self._under_mouse is None:
             return
-        if self._under_mouse is self.rx:
+        if self._under_mouse == ZONE_X:
             self._rsz_x(delta / 10.0)
         else:
             resize_func = self.rects[self._under_mouse].resize_func
             resize_func(delta / 10.0)
 
+    @tracing.traced()
     def set_rect(self, rect):
         # type: (QtCore.QRectF | QtCore.QRect) -> QtCore.QRectF | QtCore.QRect
         """Set the inner rectangle."""
         self._rect_set = True
         if not rect.isValid():
             rect = rect.normalized()
-        recw, rech = rect.width(), rect.height()
-        wr = self.geo.right() - rect.right()
-        hb = self.geo.bottom() - rect.bottom()
-
-        self.rtl.setRect(0, 0, rect.x(), rect.y())
-        self.rt.setRect(rect.x(), 0, recw, rect.y())
-        self.rtr.setRect(rect.right(), 0, wr, rect.y())
-        self.rl.setRect(0, rect.y(), rect.x(), rech)
-        self.rr.setRect(rect.right(), rect.y(), wr, rech)
-        self.rbl.setRect(0, rect.bottom(), rect.x(), hb)
-        self.rb.setRect(rect.x(), rect.bottom(), recw, hb)
-        self.rbr.setRect(rect.right(), rect.bottom(), wr, hb)
-
-        self.rx.setRect(rect)
+        geo = self.geo
+        self.item.set_bounds(geo)
+        self.item.set_rect(QtCore.QRectF(rect))
+        self._zones.set_rect(
+            (rect.left(), rect.top(), rect.right(), rect.bottom()),
+            (geo.left(), geo.top(), geo.right(), geo.bottom()),
+        )
+        self._update_zone_items()
         return rect
 
-    def _set_rect(self, rect: QtCore.QRectF):
-        """Set the inner rectangle and signal the change."""
+    def _set_rect(self, rect: QtCore.QRectF, sides=''):
+        """
+        Set the inner rectangle and signal the change. While dragging the given
+        `sides` (any of 'tlbr') snap to edges on the screenshot.
+        """
+        self._free_rect = None
+        if sides and self._lmouse:
+            self._free_rect = QtCore.QRectF(rect)
+            rect = self._snap_to_edges(rect, sides)
         self.rect_change.emit(self._output_rect(rect))
         self.set_rect(rect)
         return rect
 
+    def _drag_rect(self):
+        """What resizing goes on from. Sides that snapped mustn't stick."""
+        if self._free_rect is not None:
+            return QtCore.QRectF(self._free_rect)
+        return self.scene_rect
+
+    def _snap_to_edges(self, rect, sides):
+        # type: (QtCore.QRectF, str) -> QtCore.QRectF
+        """Move the sides to the nearest edge crossing their middle, if close enough."""
+        edge_map = self._parent.edges
+        if edge_map is None:
+            return rect
+        rect = rect.normalized()
+        ratio = self._parent.desktop.ratio
+        distance = EDGE_SNAP_DISTANCE * ratio
+        center = rect.center() * ratio
+        snapped = QtCore.QRectF(rect)
+        for side, setter, value in (
+            (ZONE_L, snapped.setLeft, rect.left()),
+            (ZONE_R, snapped.setRight, rect.right()),
+        ):
+            if side in sides:
+                edge = edge_map.snap_x(value * ratio, center.y(), distance)
+                if edge is not None:
+                    setter(edge / ratio)
+        for side, setter, value in (
+            (ZONE_T, snapped.setTop, rect.top()),
+            (ZONE_B, snapped.setBottom, rect.bottom()),
+        ):
+            if side in sides:
+                edge = edge_map.snap_y(value * ratio, center.x(), distance)
+                if edge is not None:
+                    setter(edge / ratio)
+        return snapped if snapped.isValid() else rect
+
+    def set_output_rect(self, rect):
+        # type: (QtCore.QRectF | QtCore.QRect) -> QtCore.QRectF
+        """Set the inner rectangle from screenshot pixels."""
+        return self.set_rect(self._parent.desktop.from_image(rect))
+
     def _output_rect(self, rect: QtCore.QRectF) -> QtCore.QRectF:
-        return QtCore.QRectF(
-            rect.x() / self.scale_factor,
-            rect.y() / self.scale_factor,
-            rect.width() / self.scale_factor,
-            rect.height() / self.scale_factor,
-        )
+        return self._parent.desktop.to_image(rect)
 
     def dim(self):
-        self._fader.fade(self.rects, self.dim_color, DIM_OPACITY)
+        self._animator.animate(
+            ANIM_DIM, self.item.dim_alpha, DIM_OPACITY, DIM_DURATION, self.item.set_dim_alpha
+        )
 
     def undim(self):
-        self._fader.finished.connect(self.finished.emit)
-        self._fader.fade(self.rects, self.dim_color, 0)
+        self._animator.animate(
+            ANIM_DIM,
+            self.item.dim_alpha,
+            0,
+            DIM_DURATION,
+            self.item.set_dim_alpha,
+            self.finished.emit,
+        )
 
     def flash(self):
-        self.color = QtGui.QColor(QtCore.Qt.white)
-        self.color.setAlpha(100)
-        self._fader.fade([self.rx], self.color, 0)
+        self._animator.animate(
+            ANIM_FLASH, FLASH_OPACITY, 0, DIM_DURATION, self.item.set_flash_alpha
+        )
+
+    def stop_animations(self):
+        self._animator.stop()
 
     def get_resized_center(self, value):
-        center_rect = self.rx.rect()
+        center_rect = self.scene_rect
         tl, br = center_rect.topLeft(), center_rect.bottomRight()
         tl.setX(tl.x() - value)
         tl.setY(tl.y() - value)
@@ -272,120 +390,218 @@ class Overlay(QtCore.QObject):
             x = delta.x()
         else:
             x = delta
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setX(rect.x() + x)
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveLeft(rect.x() + x)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_L)
 
     def _rsz_t(self, delta):
         if isinstance(delta, (QtCore.QPointF)):
             x = delta.y()
         else:
             x = delta
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setY(rect.y() + x)
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveTop(rect.y() + x)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_T)
 
     def _rsz_r(self, delta):
         if isinstance(delta, (QtCore.QPointF)):
             x = delta.x()
         else:
             x = delta
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setRight(rect.right() + x)
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveLeft(rect.x() + x)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_R)
 
     def _rsz_b(self, delta):
         if isinstance(delta, (QtCore.QPointF)):
             x = delta.y()
         else:
             x = delta
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setBottom(rect.bottom() + x)
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveTop(rect.y() + x)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_B)
 
     def _rsz_tl(self, delta):
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setY(rect.y() + delta.y())
         rect.setX(rect.x() + delta.x())
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveTopLeft(rect.topLeft() + delta)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_TL)
 
     def _rsz_tr(self, delta):
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setY(rect.y() + delta.y())
         rect.setRight(rect.right() + delta.x())
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveTopLeft(rect.topLeft() + delta)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_TR)
 
     def _rsz_bl(self, delta):
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setBottom(rect.bottom() + delta.y())
         rect.setX(rect.x() + delta.x())
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveTopLeft(rect.topLeft() + delta)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_BL)
 
     def _rsz_br(self, delta):
-        rect = self.rx.rect()
+        rect = self._drag_rect()
         rect.setBottom(rect.bottom() + delta.y())
         rect.setRight(rect.right() + delta.x())
-        self._set_rect(rect)
-        rect = self.rrz.rect()
-        rect.moveTopLeft(rect.topLeft() + delta)
-        self.rrz.setRect(rect)
+        self._set_rect(rect, ZONE_BR)
 
     def _rsz_x(self, delta):
         self._set_rect(self.get_resized_center(delta))
 
 
-class _ColorFader(QtCore.QObject):
-    finished = QtCore.Signal()
+def _qrect(rect):
+    # type: (tuple[float, float, float, float] | None) -> QtCore.QRectF
+    if rect is None:
+        return QtCore.QRectF()
+    return QtCore.QRectF(QtCore.QPointF(rect[0], rect[1]), QtCore.QPointF(rect[2], rect[3]))
 
-    def __init__(self, parent):
+
+class _OverlayItem(QtWidgets.QGraphicsItem):
+    """
+    Dimming, inner rectangle, side highlight & resize handle in one item.
+
+    Changes only invalidate what actually differs: For a moved inner rectangle
+    that's the area between old and new one plus both outlines.
+    """
+
+    def __init__(self, bounds):
         super().__init__()
-        self._ticks = 0
-        self._delta = 0
-        self._timer = QtCore.QTimer(parent)
-        self._timer.timeout.connect(self._update)
-        self._timer.setInterval(DIM_INTERVAL)
-        self._color = None  # type: QtGui.QColor | None
-        self._objs = []
-
-    def fade(self, objs, color, target_opacity):
-        self._color = color
-        self._objs[:] = objs
-        self._ticks = DIM_DURATION / DIM_INTERVAL
-        self._delta = (target_opacity - color.alpha()) / self._ticks
-        self._timer.start()
-
-    def _update(self):
-        if self._color is None:
+        self.setAcceptedMouseButtons(QtCore.Qt.NoButton)
+        self._bounds = QtCore.QRectF(bounds)
+        self.rect = QtCore.QRectF()
+        self._highlight = QtCore.QRectF()
+        self._handle = QtCore.QRectF()
+        self._handle_hover = False
+        # Outline of the window a click would snap to.
+        self.preview = QtCore.QRectF()
+        self._dirty = QtGui.QRegion()
+
+        self.dim_color = QtGui.QColor(QtCore.Qt.black)
+        self.dim_color.setAlpha(0)
+        self.flash_color = QtGui.QColor(QtCore.Qt.white)
+        self.flash_color.setAlpha(0)
+        self.handle_color = QtGui.QColor(QtCore.Qt.white)
+        self.handle_color.setAlpha(30)
+        self.handle_color_hover = QtGui.QColor(QtCore.Qt.white)
+        self.handle_color_hover.setAlpha(60)
+        self._rect_pen = QtGui.QPen(QtCore.Qt.white, 0.5)
+        self._highlight_pen = QtGui.QPen(QtCore.Qt.white, 0.3)
+        self._preview_pen = QtGui.QPen(QtCore.Qt.white, 1, QtCore.Qt.DashLine)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget=None):
+        if self.dim_color.alpha():
+            path = QtGui.QPainterPath()
+            path.setFillRule(QtCore.Qt.OddEvenFill)
+            path.addRect(self._bounds)
+            path.addRect(self.rect)
+            painter.fillPath(path, self.dim_color)
+        if self.flash_color.alpha():
+            painter.fillRect(self.rect, self.flash_color)
+
+        painter.setBrush(QtCore.Qt.NoBrush)
+        if not self.rect.isNull():
+            painter.setPen(self._rect_pen)
+            painter.drawRect(self.rect)
+        if not self._highlight.isEmpty():
+            painter.setPen(self._highlight_pen)
+            painter.drawRect(self._highlight)
+        if not self._handle.isEmpty():
+            color = self.handle_color_hover if self._handle_hover else self.handle_color
+            painter.fillRect(self._handle, color)
+        if not self.preview.isEmpty():
+            painter.setPen(self._preview_pen)
+            painter.drawRect(self.preview)
+
+    def set_bounds(self, bounds: QtCore.QRectF):
+        if bounds == self._bounds:
+            return
+        self.prepareGeometryChange()
+        self._bounds = QtCore.QRectF(bounds)
+
+    def set_rect(self, rect: QtCore.QRectF):
+        if rect == self.rect:
+            return
+        old_rect, self.rect = self.rect, QtCore.QRectF(rect)
+        dirty = QtGui.QRegion(old_rect.toAlignedRect()).xored(
+            QtGui.QRegion(self.rect.toAlignedRect())
+        )
+        self._invalidate(dirty + _outline(old_rect) + _outline(self.rect))
+
+    def set_highlight(self, rect: QtCore.QRectF):
+        if rect == self._highlight:
+            return
+        old_rect, self._highlight = self._highlight, QtCore.QRectF(rect)
+        self._invalidate(_outline(old_rect) + _outline(self._highlight))
+
+    def set_preview(self, rect: QtCore.QRectF):
+        if rect == self.preview:
             return
+        old_rect, self.preview = self.preview, QtCore.QRectF(rect)
+        self._invalidate(_outline(old_rect) + _outline(self.preview))
 
-        self._ticks -= 1
-        if self._ticks < 0:
-            self._timer.stop()
-            self.finished.emit()
+    def set_handle(self, rect: QtCore.QRectF):
+        if rect == self._handle:
             return
+        old_rect, self._handle = self._handle, QtCore.QRectF(rect)
+        self._invalidate(_area(old_rect) + _area(self._handle))
 
-        new_value = self._color.alpha() + self._delta
-        self._color.setAlpha(max(new_value, 0))
-        for obj in self._objs:
-            obj.setBrush(self._color)
+    def set_handle_hover(self, state: bool):
+        if state == self._handle_hover:
+            return
+        self._handle_hover = state
+        self._invalidate(_area(self._handle))
+
+    @property
+    def dim_alpha(self):
+        return self.dim_color.alpha()
+
+    def set_dim_alpha(self, alpha: float):
+        """Set dimming opacity. Repainted on next `flush`."""
+        alpha = max(0, min(int(alpha), 255))
+        if alpha == self.dim_color.alpha():
+            return
+        self.dim_color.setAlpha(alpha)
+        self._dirty += QtGui.QRegion(self._bounds.toAlignedRect())
+
+    def set_flash_alpha(self, alpha: float):
+        """Set flash opacity. Repainted on next `flush`."""
+        alpha = max(0, min(int(alpha), 255))
+        if alpha == self.flash_color.alpha():
+            return
+        self.flash_color.setAlpha(alpha)
+        self._dirty += _area(self.rect)
+
+    def flush(self):
+        """Invalidate everything collected by animated changes at once."""
+        if self._dirty.isEmpty():
+            return
+        if self._dirty.boundingRect() == self._bounds.toAlignedRect():
+            self.update()
+        else:
+            self._invalidate(self._dirty)
+        self._dirty = QtGui.QRegion()
+
+    def _invalidate(self, region: QtGui.QRegion):
+        for rect in region:
+            self.update(QtCore.QRectF(rect))
+
+
+def _area(rect: QtCore.QRectF) -> QtGui.QRegion:
+    if rect.isEmpty():
+        return QtGui.QRegion()
+    return QtGui.QRegion(rect.toAlignedRect())
+
+
+def _outline(rect: QtCore.QRectF) -> QtGui.QRegion:
+    """Thin frame region along the edges of a rectangle."""
+    if rect.isNull():
+        return QtGui.QRegion()
+    m = OUTLINE_MARGIN
+    outer = QtGui.QRegion(rect.adjusted(-m, -m, m, m).toAlignedRect())
+    inner = rect.adjusted(m, m, -m, -m)
+    if inner.isEmpty():
+        return outer
+    return outer.subtracted(QtGui.QRegion(inner.toAlignedRect()))
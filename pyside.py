@@ -1,5 +1,5 @@
 import sys
-from PySide6 import QtCore, QtGui, QtWidgets
+from PySide6 import QtCore, QtGui, QtWidgets, QtNetwork
 
 import common
 
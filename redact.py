@@ -0,0 +1,118 @@
+"""
+Pixelate or blur parts of a screenshot to hide what's in there.
+
+Works on a NumPy view of the screenshot buffer, nothing is copied up front.
+Pixelating averages blocks on a grid fixed to the image, blurring is a few
+box filter passes done with running sums. Either way the result for a pixel
+doesn't depend on which rectangle it was computed for. So parts can be done
+one at a time and still fit together seamlessly.
+
+Needs NumPy. Without it there's no redacting. No Qt in here, rectangles are
+`(left, top, right, bottom)` tuples in image pixels with right & bottom
+exclusive.
+"""
+import common
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = common.get_logger(f'{common.NAME}.redact')
+PIXELATE = 'pixelate'
+BLUR = 'blur'
+MODES = (PIXELATE, BLUR)
+# Box filter passes for blurring. Three come close to a gaussian.
+BLUR_PASSES = 3
+
+
+def available():
+    return numpy is not None
+
+
+def view(buffer, width, height, stride):
+    # type: (memoryview | bytes, int, int, int) -> numpy.ndarray
+    """Look at 32 bit pixels as a read-only (height, width, 4) array."""
+    lines = numpy.frombuffer(buffer, numpy.uint8, count=stride * height).reshape(height, stride)
+    return lines[:, : width * 4].reshape(height, width, 4)
+
+
+def redact(pixels, rect, mode, size):
+    # type: (numpy.ndarray, tuple[int, int, int, int], str, int) -> numpy.ndarray
+    """
+    New (height, width, 4) array with `rect` of `pixels` pixelated to blocks of
+    `size` or blurred with a radius of `size`. Alpha is kept as it was.
+    """
+    if mode == PIXELATE:
+        return pixelate(pixels, rect, size)
+    return blur(pixels, rect, size)
+
+
+def pixelate(pixels, rect, block):
+    # type: (numpy.ndarray, tuple[int, int, int, int], int) -> numpy.ndarray
+    left, top, right, bottom = rect
+    height, width = pixels.shape[:2]
+    block = max(1, int(block))
+    # Whole blocks around the rectangle. Cut off at the image edge.
+    grid_left, grid_top = left // block * block, top // block * block
+    grid_right = min(-(-right // block) * block, width)
+    grid_bottom = min(-(-bottom // block) * block, height)
+    area = pixels[grid_top:grid_bottom, grid_left:grid_right].astype(numpy.uint32)
+
+    rows = numpy.arange(0, grid_bottom - grid_top, block)
+    columns = numpy.arange(0, grid_right - grid_left, block)
+    sums = numpy.add.reduceat(numpy.add.reduceat(area, rows, axis=0), columns, axis=1)
+    row_sizes = numpy.diff(numpy.append(rows, grid_bottom - grid_top))
+    column_sizes = numpy.diff(numpy.append(columns, grid_right - grid_left))
+    counts = row_sizes[:, None, None] * column_sizes[None, :, None]
+    means = (sums // counts).astype(numpy.uint8)
+
+    blocks = numpy.repeat(numpy.repeat(means, row_sizes, axis=0), column_sizes, axis=1)
+    result = blocks[top - grid_top : bottom - grid_top, left - grid_left : right - grid_left]
+    result[:, :, 3] = pixels[top:bottom, left:right, 3]
+    return result
+
+
+def blur(pixels, rect, radius):
+    # type: (numpy.ndarray, tuple[int, int, int, int], int) -> numpy.ndarray
+    left, top, right, bottom = rect
+    height, width = pixels.shape[:2]
+    radius = max(1, int(radius))
+    # Every pass reaches `radius` further out. What's past the image edge is left out.
+    reach = radius * BLUR_PASSES
+    outer_left, outer_top = max(left - reach, 0), max(top - reach, 0)
+    outer_right, outer_bottom = min(right + reach, width), min(bottom + reach, height)
+    area = pixels[outer_top:outer_bottom, outer_left:outer_right, :3].astype(numpy.uint32)
+    # Margins around the rectangle still in the area: left, top, right, bottom.
+    margins = [left - outer_left, top - outer_top, outer_right - right, outer_bottom - bottom]
+    for done in range(1, BLUR_PASSES + 1):
+        area = _box(_box(area, radius).swapaxes(0, 1), radius).swapaxes(0, 1)
+        # Within `radius` of a cut that isn't the image edge the mean was short of
+        # pixels. Cut that off, it's only needed for fewer passes than are left.
+        needed = radius * (BLUR_PASSES - done)
+        cut = [max(margin - needed, 0) for margin in margins]
+        area = area[cut[1] : area.shape[0] - cut[3], cut[0] : area.shape[1] - cut[2]]
+        margins = [margin - c for margin, c in zip(margins, cut)]
+
+    result = numpy.empty((bottom - top, right - left, 4), numpy.uint8)
+    result[:, :, :3] = area
+    result[:, :, 3] = pixels[top:bottom, left:right, 3]
+    return result
+
+
+def _box(area, radius):
+    """
+    Mean of the `radius` neighbours to each side down the first axis, fewer at
+    the edges. Sums come from running totals, rounding is to whole values.
+    """
+    count = area.shape[0]
+    total = numpy.zeros((count + 1,) + area.shape[1:], numpy.uint32)
+    numpy.cumsum(area, axis=0, dtype=numpy.uint32, out=total[1:])
+    index = numpy.arange(count)
+    high = numpy.minimum(index + radius + 1, count)
+    low = numpy.maximum(index - radius, 0)
+    sums = total[high] - total[low]
+    counts = (high - low).astype(numpy.uint32).reshape((count,) + (1,) * (area.ndim - 1))
+    sums += counts // 2
+    sums //= counts
+    return sums
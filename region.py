@@ -0,0 +1,79 @@
+"""
+Look at a rectangle of the screenshot without copying pixels.
+
+`Region` points into the grabbed `QImage` buffer with an offset and the
+source stride (bytesPerLine). Encoders can read straight from it.
+Only when something has to be painted on top a detached copy is made.
+"""
+from pyside import QtCore, QtGui
+
+
+class Region:
+    def __init__(self, image, rect):
+        # type: (QtGui.QImage, QtCore.QRect) -> None
+        self.source = image
+        self.rect = QtCore.QRect(rect).intersected(image.rect())
+        self.bytes_per_pixel = image.depth() // 8
+        self.bytes_per_line = image.bytesPerLine()
+        self.offset = self.rect.y() * self.bytes_per_line + self.rect.x() * self.bytes_per_pixel
+        self._buffer = None  # type: memoryview | None
+        self._image = None  # type: QtGui.QImage | None
+
+    @property
+    def width(self):
+        return self.rect.width()
+
+    @property
+    def height(self):
+        return self.rect.height()
+
+    @property
+    def size(self):
+        """Number of bytes spanned from first to last pixel, strides included."""
+        if self.rect.isEmpty():
+            return 0
+        return (self.height - 1) * self.bytes_per_line + self.width * self.bytes_per_pixel
+
+    def buffer(self):
+        """Read-only memoryview starting at the top left pixel of the region."""
+        if self._buffer is None:
+            bits = self.source.constBits()
+            self._buffer = bits[self.offset : self.offset + self.size]
+        return self._buffer
+
+    def image(self):
+        """
+        QImage sharing the source pixels. Valid as long as this region is around.
+        """
+        if self._image is None:
+            self._image = QtGui.QImage(
+                self.buffer(), self.width, self.height, self.bytes_per_line, self.source.format()
+            )
+        return self._image
+
+    def composited(self, sprites, annotations=()):
+        # type: (list[tuple[QtCore.QRectF, QtGui.QImage]], list) -> QtGui.QImage
+        """
+        Get the region image with some small images and annotations painted on top.
+
+        `sprites` are target rects in source pixels and their images. `annotations`
+        are in source pixels as well. Without any overlapping the shared image is
+        returned, else a copy with only the overlapping ones painted over.
+        Safe to call off the GUI thread.
+        """
+        area = QtCore.QRectF(self.rect)
+        overlapping = [(target, sprite) for target, sprite in sprites if target.intersects(area)]
+        drawn = [annotation for annotation in annotations if annotation.bounds.intersects(area)]
+        if not overlapping and not drawn:
+            return self.image()
+
+        image = self.image().copy()
+        painter = QtGui.QPainter(image)
+        painter.translate(-self.rect.x(), -self.rect.y())
+        for target, sprite in overlapping:
+            painter.drawImage(target, sprite, QtCore.QRectF(sprite.rect()))
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
+        for annotation in drawn:
+            annotation.paint(painter)
+        painter.end()
+        return image
@@ -0,0 +1,203 @@
+"""
+Grab the whole virtual desktop.
+
+Every `QScreen` is grabbed right after the other and the results are
+composited into one image. Grabbing goes through `QPixmap`, so it has to
+happen on the GUI thread. Only the `QImage` work may be done elsewhere.
+
+Scene coordinates are logical desktop coordinates relative to the top left
+corner of the virtual desktop. The composite is scaled by the highest
+device pixel ratio among the screens so no screen loses any resolution.
+"""
+import time
+from collections import namedtuple
+
+import common
+import tracing
+from pyside import QtCore, QtGui
+
+log = common.get_logger(f'{common.NAME}.screens')
+ScreenGrab = namedtuple('ScreenGrab', ['name', 'geometry', 'ratio', 'image'])
+
+
+class Desktop:
+    """All screens grabbed at one moment and stitched together."""
+
+    def __init__(self, grabs):
+        # type: (list[ScreenGrab]) -> None
+        self.grabs = grabs
+        geometry = QtCore.QRect()
+        for grab in grabs:
+            geometry = geometry.united(grab.geometry)
+        # Virtual desktop in logical coordinates. May well start in the negatives.
+        self.geometry = geometry
+        self.origin = geometry.topLeft()
+        self.ratio = max(grab.ratio for grab in grabs)
+        self.image = self._composite()
+
+    @classmethod
+    def synthetic(cls, image, ratio=1.0):
+        # type: (QtGui.QImage, float) -> Desktop
+        """Make a single screen desktop from a given image. For tests & benchmarks."""
+        size = image.size() / ratio
+        geometry = QtCore.QRect(QtCore.QPoint(0, 0), size)
+        return cls([ScreenGrab('synthetic', geometry, ratio, image)])
+
+    @property
+    def scene_rect(self):
+        return QtCore.QRectF(0, 0, self.geometry.width(), self.geometry.height())
+
+    def release(self):
+        """Let go of all pixels. Geometry & mapping keep working."""
+        self.grabs = [grab._replace(image=QtGui.QImage()) for grab in self.grabs]
+        self.image = QtGui.QImage()
+
+    def _composite(self):
+        if len(self.grabs) == 1 and self.grabs[0].geometry == self.geometry:
+            return self.grabs[0].image
+
+        image = QtGui.QImage(
+            self.geometry.size() * self.ratio, QtGui.QImage.Format_ARGB32_Premultiplied
+        )
+        image.fill(QtCore.Qt.black)
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        for grab in self.grabs:
+            target = self.to_image(QtCore.QRectF(grab.geometry.translated(-self.origin)))
+            painter.drawImage(target, grab.image)
+        painter.end()
+        return image
+
+    def to_image(self, rect):
+        # type: (QtCore.QRectF | QtCore.QRect) -> QtCore.QRectF
+        """Map a scene rectangle to pixels on the composite image."""
+        return QtCore.QRectF(
+            rect.x() * self.ratio,
+            rect.y() * self.ratio,
+            rect.width() * self.ratio,
+            rect.height() * self.ratio,
+        )
+
+    def from_image(self, rect):
+        # type: (QtCore.QRectF | QtCore.QRect) -> QtCore.QRectF
+        """Map composite image pixels back to a scene rectangle."""
+        return QtCore.QRectF(
+            rect.x() / self.ratio,
+            rect.y() / self.ratio,
+            rect.width() / self.ratio,
+            rect.height() / self.ratio,
+        )
+
+    def screen_at(self, point):
+        # type: (QtCore.QPointF) -> ScreenGrab
+        """Find the screen under a scene point. Falls back to the first one."""
+        desktop_point = QtCore.QPointF(point) + QtCore.QPointF(self.origin)
+        for grab in self.grabs:
+            if QtCore.QRectF(grab.geometry).contains(desktop_point):
+                return grab
+        return self.grabs[0]
+
+    def to_native(self, rect):
+        # type: (QtCore.QRectF | QtCore.QRect) -> QtCore.QRect
+        """
+        Map a scene rectangle to native desktop pixels as used by external grabbers.
+
+        The scaling is taken from the screen under the center of the rectangle.
+        """
+        rect = QtCore.QRectF(rect)
+        grab = self.screen_at(rect.center())
+        screen_tl = QtCore.QPointF(grab.geometry.topLeft())
+        local_tl = rect.topLeft() + QtCore.QPointF(self.origin) - screen_tl
+        return QtCore.QRectF(
+            screen_tl.x() + local_tl.x() * grab.ratio,
+            screen_tl.y() + local_tl.y() * grab.ratio,
+            rect.width() * grab.ratio,
+            rect.height() * grab.ratio,
+        ).toRect()
+
+    def from_native(self, rect):
+        # type: (QtCore.QRectF | QtCore.QRect) -> QtCore.QRectF
+        """
+        Map native desktop pixels, as from other programs, back to a scene rectangle.
+        Undoes `to_native` with the screen that has the center of the rectangle.
+        """
+        rect = QtCore.QRectF(rect)
+        grab = self.grabs[0]
+        for each in self.grabs:
+            screen_tl = QtCore.QPointF(each.geometry.topLeft())
+            native = QtCore.QRectF(screen_tl, QtCore.QSizeF(each.geometry.size()) * each.ratio)
+            if native.contains(rect.center()):
+                grab = each
+                break
+        screen_tl = QtCore.QPointF(grab.geometry.topLeft())
+        local_tl = (rect.topLeft() - screen_tl) / grab.ratio
+        return QtCore.QRectF(
+            screen_tl + local_tl - QtCore.QPointF(self.origin), rect.size() / grab.ratio
+        )
+
+
+class FrameSource:
+    """
+    Grab the same rectangle over and over, as for video frames.
+
+    The screen & its local rectangle are looked up once. Frames come in native
+    pixels as `QImage.Format_RGB32` of exactly `size`. Grabs on the GUI thread
+    only, just like `grab_desktop`. The images can go anywhere from there.
+    """
+
+    def __init__(self, desktop, rect, size=None):
+        # type: (Desktop, QtCore.QRectF, QtCore.QSize | None) -> None
+        rect = QtCore.QRectF(rect)
+        grab = desktop.screen_at(rect.center())
+        self.screen = _find_screen(grab.name)
+        local = rect.translated(QtCore.QPointF(desktop.origin - grab.geometry.topLeft()))
+        bounds = QtCore.QRect(QtCore.QPoint(), grab.geometry.size())
+        self.rect = local.toAlignedRect().intersected(bounds)
+        self.size = size or desktop.to_native(rect).size()
+
+    def grab(self):
+        # type: () -> QtGui.QImage
+        x, y, w, h = self.rect.getRect()
+        image = self.screen.grabWindow(0, x, y, w, h).toImage()
+        if image.format() != QtGui.QImage.Format_RGB32:
+            image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+        if image.size() != self.size:
+            # Off by a pixel from rounding the device pixel ratio or a screen edge.
+            image = image.copy(QtCore.QRect(QtCore.QPoint(), self.size))
+        return image
+
+
+def _find_screen(name):
+    # type: (str) -> QtGui.QScreen
+    screens = QtGui.QGuiApplication.screens()
+    for screen in screens:
+        if screen.name() == name:
+            return screen
+    return QtGui.QGuiApplication.primaryScreen()
+
+
+def _to_grab(screen, pixmap):
+    # type: (QtGui.QScreen, QtGui.QPixmap) -> ScreenGrab
+    image = pixmap.toImage()
+    image.setDevicePixelRatio(1.0)
+    return ScreenGrab(screen.name(), screen.geometry(), screen.devicePixelRatio(), image)
+
+
+@tracing.traced()
+def grab_desktop():
+    """Grab all screens and return them as `Desktop`. GUI thread only."""
+    t0 = time.perf_counter()
+    screens = QtGui.QGuiApplication.screens()
+    # All pixmaps first, so the screens are taken as close together as possible.
+    pixmaps = [screen.grabWindow(0) for screen in screens]
+    grabs = [_to_grab(screen, pixmap) for screen, pixmap in zip(screens, pixmaps)]
+
+    desktop = Desktop(grabs)
+    log.debug(
+        'grabbed %i screen(s) %ix%i in %.1f ms',
+        len(grabs),
+        desktop.image.width(),
+        desktop.image.height(),
+        (time.perf_counter() - t0) * 1000,
+    )
+    return desktop
@@ -0,0 +1,166 @@
+"""Round trips of the hand-written GIF & APNG writers through QImageReader."""
+import io
+import os
+import sys
+import zlib
+import struct
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import anim_export  # noqa: E402
+from pyside import QtCore, QtGui  # noqa: E402
+
+numpy = anim_export.numpy
+# Random pixels over this many colors never repeat long enough for the LZW
+# table to hold them. 128x128 of them fill its 4096 codes a few times over.
+NOISE_COLORS = 200
+NOISE_SIZE = 128
+
+
+def _palette(count, seed=0):
+    rng = random.Random(seed)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(count)]
+    return numpy.array(colors, numpy.uint8)
+
+
+def _noise(width, height, colors, seed=0):
+    rng = random.Random(seed)
+    return bytes(rng.randrange(colors) for _ in range(width * height))
+
+
+def _write(writer_class, fmt, size, palette, frames):
+    """File bytes for frames of (x, y, width, height, indexed data)."""
+    transparent = len(palette)
+    file_obj = io.BytesIO()
+    writer = writer_class(file_obj, size[0], size[1], palette, transparent)
+    crops = [(data, width, height) for _, _, width, height, data in frames]
+    for (x, y, width, height, _), encoded in zip(frames, anim_export._encode_chunk(fmt, crops)):
+        writer.add_frame(x, y, width, height, 0.1, encoded)
+    writer.close()
+    return file_obj.getvalue()
+
+
+def _read_frames(data, fmt):
+    buffer = QtCore.QBuffer()
+    buffer.setData(QtCore.QByteArray(data))
+    buffer.open(QtCore.QIODevice.ReadOnly)
+    reader = QtGui.QImageReader(buffer, fmt)
+    frames = []
+    while reader.canRead():
+        image = reader.read()
+        if image.isNull():
+            break
+        frames.append(image)
+    return frames
+
+
+def _rgb(image):
+    # type: (QtGui.QImage) -> numpy.ndarray
+    image = image.convertToFormat(QtGui.QImage.Format_RGB888)
+    lines = numpy.frombuffer(image.constBits(), numpy.uint8, count=image.sizeInBytes())
+    lines = lines.reshape(image.height(), image.bytesPerLine())
+    # A copy, the converted image is gone after this.
+    return lines[:, : image.width() * 3].reshape(image.height(), image.width(), 3).copy()
+
+
+def _expected(palette, width, height, data):
+    return palette[numpy.frombuffer(data, numpy.uint8)].reshape(height, width, 3)
+
+
+@unittest.skipIf(numpy is None, 'needs NumPy')
+class TestGif(unittest.TestCase):
+    def test_code_table_reset(self):
+        palette = _palette(NOISE_COLORS)
+        data = _noise(NOISE_SIZE, NOISE_SIZE, NOISE_COLORS)
+        size = (NOISE_SIZE, NOISE_SIZE)
+        frames = [(0, 0) + size + (data,)]
+        gif = _write(anim_export._GifWriter, anim_export.GIF, size, palette, frames)
+        frames = _read_frames(gif, b'gif')
+        self.assertEqual(len(frames), 1)
+        numpy.testing.assert_array_equal(_rgb(frames[0]), _expected(palette, *size, data))
+
+    def test_delta_frame(self):
+        palette = _palette(NOISE_COLORS)
+        transparent = len(palette)
+        first = _noise(64, 48, NOISE_COLORS, seed=1)
+        # A changed 20x10 patch at 30, 5. Its left half is unchanged & transparent.
+        patch = bytearray(_noise(20, 10, NOISE_COLORS, seed=2))
+        for row in range(10):
+            patch[row * 20 : row * 20 + 10] = bytes((transparent,)) * 10
+        frames = [(0, 0, 64, 48, first), (30, 5, 20, 10, bytes(patch))]
+        gif = _write(anim_export._GifWriter, anim_export.GIF, (64, 48), palette, frames)
+        decoded = _read_frames(gif, b'gif')
+        self.assertEqual(len(decoded), 2)
+
+        expected = _expected(palette, 64, 48, first)
+        numpy.testing.assert_array_equal(_rgb(decoded[0]), expected)
+        patch_rgb = _expected(numpy.vstack([palette, [[0, 0, 0]]]), 20, 10, bytes(patch))
+        expected = expected.copy()
+        expected[5:15, 40:50] = patch_rgb[:, 10:]
+        numpy.testing.assert_array_equal(_rgb(decoded[1]), expected)
+
+    def test_one_color(self):
+        palette = numpy.array([[12, 34, 56]], numpy.uint8)
+        data = bytes(40 * 30)
+        frames = [(0, 0, 40, 30, data)]
+        gif = _write(anim_export._GifWriter, anim_export.GIF, (40, 30), palette, frames)
+        frames = _read_frames(gif, b'gif')
+        self.assertEqual(len(frames), 1)
+        numpy.testing.assert_array_equal(_rgb(frames[0]), _expected(palette, 40, 30, data))
+
+
+@unittest.skipIf(numpy is None, 'needs NumPy')
+class TestApng(unittest.TestCase):
+    def _chunks(self, data):
+        """(name, body) of every chunk. Checks the signature & CRCs on the way."""
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        pos, chunks = 8, []
+        while pos < len(data):
+            (length,) = struct.unpack('>I', data[pos : pos + 4])
+            name, body = data[pos + 4 : pos + 8], data[pos + 8 : pos + 8 + length]
+            (crc,) = struct.unpack('>I', data[pos + 8 + length : pos + 12 + length])
+            self.assertEqual(crc, zlib.crc32(name + body), name)
+            chunks.append((name, body))
+            pos += 12 + length
+        return chunks
+
+    def test_frames(self):
+        palette = _palette(NOISE_COLORS)
+        first = _noise(NOISE_SIZE, NOISE_SIZE, NOISE_COLORS)
+        second = _noise(16, 8, NOISE_COLORS, seed=3)
+        size = (NOISE_SIZE, NOISE_SIZE)
+        frames = [(0, 0) + size + (first,), (3, 4, 16, 8, second)]
+        apng = _write(anim_export._ApngWriter, anim_export.APNG, size, palette, frames)
+
+        # Without APNG support the first frame is a plain PNG.
+        decoded = _read_frames(apng, b'png')
+        numpy.testing.assert_array_equal(_rgb(decoded[0]), _expected(palette, *size, first))
+
+        chunks = self._chunks(apng)
+        names = [name for name, _ in chunks]
+        self.assertEqual(names[:4], [b'IHDR', b'acTL', b'PLTE', b'tRNS'])
+        self.assertEqual(names[-1], b'IEND')
+        actl = dict(chunks)[b'acTL']
+        self.assertEqual(struct.unpack('>II', actl), (2, 0))
+        # fcTL & fdAT share one running sequence.
+        sequence = [
+            struct.unpack('>I', body[:4])[0] for name, body in chunks if name in (b'fcTL', b'fdAT')
+        ]
+        self.assertEqual(sequence, list(range(3)))
+
+        fdat = dict(chunks)[b'fdAT']
+        rows = zlib.decompress(fdat[4:])
+        self.assertEqual(rows, b''.join(b'\x00' + second[i : i + 16] for i in range(0, 128, 16)))
+
+    def test_one_color(self):
+        palette = numpy.array([[200, 100, 0]], numpy.uint8)
+        data = bytes(10 * 10)
+        frames = [(0, 0, 10, 10, data)]
+        apng = _write(anim_export._ApngWriter, anim_export.APNG, (10, 10), palette, frames)
+        decoded = _read_frames(apng, b'png')
+        numpy.testing.assert_array_equal(_rgb(decoded[0]), _expected(palette, 10, 10, data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""Headless checks of the window index against a brute-force search. No Qt needed."""
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import windows  # noqa: E402
+
+WIDTH, HEIGHT = 1920, 1080
+POINTS = 20000
+
+
+def _brute_force(window_list, x, y):
+    for window in window_list:
+        left, top, right, bottom = window.rect
+        if left <= x < right and top <= y < bottom:
+            return window
+    return None
+
+
+def _random_windows(count, seed):
+    rng = random.Random(seed)
+    found = []
+    for i in range(count):
+        left, top = rng.randrange(-200, WIDTH), rng.randrange(-200, HEIGHT)
+        width, height = rng.randrange(0, WIDTH // 2), rng.randrange(0, HEIGHT // 2)
+        found.append(windows.Window(f'window {i}', (left, top, left + width, top + height)))
+    return found
+
+
+def _runs(*spans):
+    """Claim the spans topmost first, owners numbered in order."""
+    runs = ([], [], [])
+    for owner, (top, bottom) in enumerate(spans):
+        windows._claim(runs, top, bottom, owner)
+    return list(zip(*runs))
+
+
+class TestWindowIndex(unittest.TestCase):
+    def assert_matches(self, window_list, seed=0):
+        index = windows.WindowIndex(window_list)
+        index.build()
+        rng = random.Random(seed)
+        for _ in range(POINTS):
+            x, y = rng.randrange(-300, WIDTH + 300), rng.randrange(-300, HEIGHT + 300)
+            self.assertIs(index.at(x, y), _brute_force(window_list, x, y), (x, y))
+
+    def test_random(self):
+        for seed in range(3):
+            self.assert_matches(_random_windows(60, seed), seed)
+
+    def test_cascade(self):
+        provider = windows.FakeProvider.cascade(40, WIDTH, HEIGHT)
+        self.assert_matches(provider.windows())
+
+    def test_edges(self):
+        window_list = [
+            windows.Window('top', (100, 100, 300, 200)),
+            windows.Window('below', (0, 0, 400, 400)),
+        ]
+        index = windows.WindowIndex(window_list)
+        for (x, y), title in (
+            ((100, 100), 'top'),
+            ((299, 199), 'top'),
+            ((300, 199), 'below'),
+            ((299, 200), 'below'),
+            ((0, 0), 'below'),
+        ):
+            self.assertEqual(index.at(x, y).title, title, (x, y))
+        # Right & bottom are exclusive.
+        self.assertIsNone(index.at(400, 10))
+        self.assertIsNone(index.at(10, 400))
+        self.assertIsNone(index.at(-1, 10))
+
+    def test_builds_on_first_lookup(self):
+        index = windows.WindowIndex([windows.Window('only', (0, 0, 10, 10))])
+        self.assertEqual(index.at(5, 5).title, 'only')
+
+    def test_empty(self):
+        index = windows.WindowIndex([])
+        index.build()
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.at(0, 0))
+
+    def test_zero_size(self):
+        window_list = [
+            windows.Window('flat', (10, 10, 100, 10)),
+            windows.Window('thin', (10, 10, 10, 100)),
+            windows.Window('real', (0, 0, 50, 50)),
+        ]
+        index = windows.WindowIndex(window_list)
+        self.assertEqual(index.at(10, 10).title, 'real')
+        self.assert_matches(window_list)
+
+
+class TestClaim(unittest.TestCase):
+    def test_disjoint(self):
+        self.assertEqual(_runs((50, 60), (10, 20)), [(10, 20, 1), (50, 60, 0)])
+
+    def test_nested_below(self):
+        # Fully covered by what's on top. Nothing left to claim.
+        self.assertEqual(_runs((10, 100), (20, 30)), [(10, 100, 0)])
+
+    def test_nested_above(self):
+        # Below one on top of it, the outer one keeps both sides.
+        self.assertEqual(_runs((40, 60), (10, 100)), [(10, 40, 1), (40, 60, 0), (60, 100, 1)])
+
+    def test_overlapping(self):
+        self.assertEqual(_runs((10, 50), (30, 80)), [(10, 50, 0), (50, 80, 1)])
+        self.assertEqual(_runs((30, 80), (10, 50)), [(10, 30, 1), (30, 80, 0)])
+
+    def test_gaps_between_several(self):
+        self.assertEqual(
+            _runs((10, 20), (30, 40), (50, 60), (0, 70)),
+            [
+                (0, 10, 3),
+                (10, 20, 0),
+                (20, 30, 3),
+                (30, 40, 1),
+                (40, 50, 3),
+                (50, 60, 2),
+                (60, 70, 3),
+            ],
+        )
+
+    def test_touching(self):
+        # Bottom is exclusive, so these just meet.
+        self.assertEqual(_runs((10, 20), (20, 30)), [(10, 20, 0), (20, 30, 1)])
+        self.assertEqual(_runs((10, 20), (0, 10)), [(0, 10, 1), (10, 20, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Headless checks of the overlay zone lookup. No Qt needed."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import zones  # noqa: E402
+
+BOUNDS = (0, 0, 1000, 800)
+RECT = (200, 100, 600, 500)
+CURSORS = {zone: f'cursor_{zone}' for row in zones.ZONE_GRID for zone in row}
+CURSORS[zones.CURSOR_MOVE] = 'move'
+CURSORS[zones.CURSOR_NONE] = 'none'
+
+
+def _resolver(rect=RECT, bounds=BOUNDS, handle_width=50):
+    resolver = zones.ZoneResolver(CURSORS, handle_width)
+    resolver.set_rect(rect, bounds)
+    return resolver
+
+
+class TestZones(unittest.TestCase):
+    def test_inside(self):
+        resolver = _resolver()
+        for x, y in ((400, 300), (200, 100), (600, 500)):
+            hit = resolver.resolve(x, y)
+            self.assertEqual(hit, zones.Hit(zones.ZONE_X, 'move', False), (x, y))
+
+    def test_corners(self):
+        resolver = _resolver()
+        for (x, y), zone in (
+            ((180, 80), zones.ZONE_TL),
+            ((620, 80), zones.ZONE_TR),
+            ((180, 520), zones.ZONE_BL),
+            ((620, 520), zones.ZONE_BR),
+        ):
+            self.assertEqual(resolver.resolve(x, y), zones.Hit(zone, f'cursor_{zone}', True))
+        self.assertEqual(resolver.zone_rect(zones.ZONE_TL), (0, 0, 200, 100))
+        self.assertEqual(resolver.handle_rect(zones.ZONE_BR), (600, 500, 650, 550))
+
+    def test_edges(self):
+        resolver = _resolver()
+        for (x, y), zone in (
+            ((400, 90), zones.ZONE_T),
+            ((400, 510), zones.ZONE_B),
+            ((190, 300), zones.ZONE_L),
+            ((610, 300), zones.ZONE_R),
+        ):
+            self.assertEqual(resolver.resolve(x, y), zones.Hit(zone, f'cursor_{zone}', True))
+        self.assertEqual(resolver.zone_rect(zones.ZONE_R), (600, 100, 1000, 500))
+
+    def test_outside_handle(self):
+        resolver = _resolver()
+        self.assertEqual(resolver.resolve(400, 10), zones.Hit(zones.ZONE_T, 'none', False))
+        self.assertEqual(resolver.resolve(10, 10), zones.Hit(zones.ZONE_TL, 'none', False))
+        self.assertIsNone(resolver.handle_rect(zones.ZONE_X))
+
+    def test_rect_change_drops_cache(self):
+        resolver = _resolver()
+        self.assertEqual(resolver.resolve(400, 300).zone, zones.ZONE_X)
+        resolver.set_rect((500, 400, 700, 600))
+        self.assertEqual(resolver.resolve(400, 300).zone, zones.ZONE_TL)
+        self.assertEqual(resolver.zone_rect(zones.ZONE_TL), (0, 0, 500, 400))
+
+    def test_zero_size_rect(self):
+        resolver = _resolver(rect=(300, 300, 300, 300))
+        self.assertEqual(resolver.resolve(300, 300).zone, zones.ZONE_X)
+        self.assertEqual(resolver.zone_at(299, 300), zones.ZONE_L)
+        self.assertEqual(resolver.zone_at(301, 301), zones.ZONE_BR)
+        # Sides have no width to grab, the corners still do.
+        self.assertIsNone(resolver.handle_rect(zones.ZONE_T))
+        self.assertFalse(resolver.resolve(300, 280).handle)
+        self.assertEqual(resolver.resolve(280, 280), zones.Hit(zones.ZONE_TL, 'cursor_tl', True))
+
+    def test_zero_size_bounds(self):
+        resolver = _resolver(rect=(0, 0, 0, 0), bounds=(0, 0, 0, 0))
+        self.assertEqual(resolver.resolve(0, 0).zone, zones.ZONE_X)
+        self.assertIsNone(resolver.handle_rect(zones.ZONE_BR))
+        self.assertEqual(resolver.resolve(5, 5), zones.Hit(zones.ZONE_BR, 'none', False))
+
+    def test_unknown_zone(self):
+        with self.assertRaises(ValueError):
+            _resolver().zone_rect('nope')
+
+
+if __name__ == '__main__':
+    unittest.main()
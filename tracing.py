@@ -0,0 +1,148 @@
+"""
+Opt-in timing spans & counters written as Chrome trace-event JSON.
+
+Set the environment variable `KIEKSTE_TRACE=1` to enable. At exit the session
+is written to `common.TMP_PATH` and can be opened in chrome://tracing or
+https://ui.perfetto.dev. A resident daemon writes one file per capture
+instead. When disabled `traced` hands back the undecorated function and
+`span`/`counter` return right away.
+"""
+import os
+import json
+import time
+import atexit
+import itertools
+import functools
+import threading
+
+import common
+
+log = common.get_logger(f'{common.NAME}.tracing')
+ENV_VAR = f'{common.NAME.upper()}_TRACE'
+ENABLED = os.getenv(ENV_VAR, '') not in ('', '0')
+_EVENTS = []
+_PID = os.getpid()
+_T0 = time.perf_counter()
+# Numbers the files written by this process. Sessions can be less than a second apart.
+_WRITES = itertools.count(1)
+
+
+def _now_us():
+    return (time.perf_counter() - _T0) * 1e6
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc_info):
+        event = {
+            'name': self.name,
+            'ph': 'X',
+            'ts': self.start,
+            'dur': _now_us() - self.start,
+            'pid': _PID,
+            'tid': threading.get_ident(),
+        }
+        if self.args:
+            event['args'] = self.args
+        # list.append is atomic, no lock needed across threads.
+        _EVENTS.append(event)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **args):
+    """Time a `with` block."""
+    if not ENABLED:
+        return _NO_SPAN
+    return _Span(name, args)
+
+
+def traced(name=None):
+    """Decorator to time each call of a function or method."""
+
+    def decorator(func):
+        if not ENABLED:
+            return func
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(span_name, None):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def counter(name, **values):
+    """Record the current value(s) of a counter track."""
+    if not ENABLED:
+        return
+    _EVENTS.append(
+        {
+            'name': name,
+            'ph': 'C',
+            'ts': _now_us(),
+            'pid': _PID,
+            'tid': threading.get_ident(),
+            'args': values,
+        }
+    )
+
+
+def write(path=None):
+    """
+    Dump the events recorded since the last write and forget them.
+    Returns the path written or '' if there was nothing to write.
+    """
+    # Other threads only ever append. So the first ones are exactly what was copied.
+    events = _EVENTS[:]
+    del _EVENTS[: len(events)]
+    if not events:
+        return ''
+    if path is None:
+        os.makedirs(common.TMP_PATH, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        name = f'{common.NAME}_trace_{stamp}_{_PID}_{next(_WRITES)}.json'
+        path = os.path.join(common.TMP_PATH, name)
+
+    thread_names = [
+        {
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': _PID,
+            'tid': thread.ident,
+            'args': {'name': thread.name},
+        }
+        for thread in threading.enumerate()
+    ]
+    with open(path, 'w', encoding=common.ENCODING) as file_obj:
+        json.dump({'traceEvents': thread_names + events, 'displayTimeUnit': 'ms'}, file_obj)
+    log.info('Wrote %i trace events to "%s"', len(events), path)
+    return path
+
+
+if ENABLED:
+    atexit.register(write)
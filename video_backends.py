@@ -0,0 +1,368 @@
+"""
+Where ffmpeg takes the video from, per platform.
+
+A backend turns the capture settings into the ffmpeg input arguments
+(and any filters that have to go with them). `pick` finds the first one
+that works on this system. `probe_limits` tells what a backend can keep up
+with here by letting ffmpeg grab for a moment without encoding anything.
+"""
+import os
+import re
+import sys
+import time
+import subprocess
+from collections import namedtuple
+
+import common
+
+log = common.get_logger(f'{common.NAME}.video_backends')
+# Frame rates to try when probing, highest first.
+PROBE_FPS = (60, 30, 24, 15, 10, 5)
+PROBE_SECONDS = 2
+# Share of the asked for frames that have to arrive to count as sustained.
+SUSTAIN_RATIO = 0.95
+KMS_DEVICE = '/dev/dri/card0'
+# Highest frame rate sustained for a grab size.
+Limit = namedtuple('Limit', ['width', 'height', 'fps'])
+# x264 presets from best compression to fastest.
+PRESETS = ('medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast')
+# Test pattern size & length each preset encodes when calibrating.
+CALIBRATION_SIZE = (1280, 720)
+CALIBRATION_FRAMES = 60
+# Seconds a preset gets to encode them before it counts as failed.
+CALIBRATION_TIMEOUT = 60
+# Encoding has to be this much faster than the frame rate. Grabbing needs CPU too.
+ENCODER_HEADROOM = 1.5
+# How fast an x264 preset encodes on this machine.
+EncoderSpeed = namedtuple('EncoderSpeed', ['preset', 'pixels_per_second'])
+# Seconds between asking whether to give up while probing or calibrating.
+CANCEL_POLL_INTERVAL = 0.1
+# Seconds `ffmpeg -version` gets to answer.
+VERSION_TIMEOUT = 10
+# Makes ffmpeg write machine readable blocks of key=value lines to stdout.
+PROGRESS_ARGS = ['-nostats', '-progress', 'pipe:1']
+# `-progress` keys worth keeping and their unit suffix to strip.
+PROGRESS_KEYS = {
+    'frame': (int, ''),
+    'fps': (float, ''),
+    'bitrate': (float, 'kbits/s'),
+    'total_size': (int, ''),
+    'out_time_us': (int, ''),
+    'dup_frames': (int, ''),
+    'drop_frames': (int, ''),
+    'speed': (float, 'x'),
+}
+
+
+class Cancelled(Exception):
+    """Probing or calibrating was given up from outside."""
+
+
+class Backend:
+    name = ''
+    # `sys.platform` prefixes this backend can work on.
+    platforms = ()
+    # Whether the backend can draw the mouse pointer by itself.
+    draws_pointer = False
+    # Whether `pick` may take it when none is asked for by name.
+    automatic = True
+
+    def available(self):
+        return sys.platform.startswith(self.platforms)
+
+    def input_args(self, settings):
+        # type: (dict) -> list[str]
+        """ffmpeg arguments up to and including `-i`."""
+        raise NotImplementedError
+
+    def filters(self, settings):
+        # type: (dict) -> list[str]
+        """Video filters the input depends on. Like cropping."""
+        return []
+
+    def args(self, settings, filters=()):
+        # type: (dict, tuple[str, ...] | list[str]) -> list[str]
+        """Input arguments plus the `-vf` chain with any extra `filters` appended."""
+        chain = self.filters(settings) + list(filters)
+        if not chain:
+            return self.input_args(settings)
+        return self.input_args(settings) + ['-vf', ','.join(chain)]
+
+
+class GdiGrab(Backend):
+    name = 'gdigrab'
+    platforms = ('win32',)
+    draws_pointer = True
+
+    def input_args(self, settings):
+        return (
+            '-f gdigrab -draw_mouse {pointer} -framerate {fps} -offset_x {x} -offset_y {y} '
+            '-video_size {w}x{h} -show_region 0 -i desktop'
+        ).format_map(settings).split()
+
+
+class X11Grab(Backend):
+    name = 'x11grab'
+    platforms = ('linux', 'freebsd')
+    draws_pointer = True
+
+    def available(self):
+        return super().available() and bool(os.getenv('DISPLAY'))
+
+    def input_args(self, settings):
+        display = os.getenv('DISPLAY', ':0')
+        return (
+            '-f x11grab -draw_mouse {pointer} -framerate {fps} -video_size {w}x{h} '
+            '-i {display}+{x},{y}'
+        ).format(display=display, **settings).split()
+
+
+class KmsGrab(Backend):
+    """Straight from the DRM framebuffer. Works without X but needs CAP_SYS_ADMIN."""
+
+    name = 'kmsgrab'
+    platforms = ('linux',)
+
+    def available(self):
+        return super().available() and os.access(KMS_DEVICE, os.R_OK)
+
+    def input_args(self, settings):
+        fps = str(settings['fps'])
+        return ['-device', KMS_DEVICE, '-f', 'kmsgrab', '-framerate', fps, '-i', '-']
+
+    def filters(self, settings):
+        # Frames stay on the GPU until downloaded. Grabbing is always full screen.
+        return ['hwdownload', 'format=bgr0', 'crop={w}:{h}:{x}:{y}'.format_map(settings)]
+
+
+class TestSource(Backend):
+    """
+    Synthetic frames from lavfi. For headless testing, works everywhere.
+    Only when asked for by name. A real recording mustn't end up as test pattern.
+    """
+
+    name = 'testsrc'
+    automatic = False
+
+    def available(self):
+        return True
+
+    def input_args(self, settings):
+        # `-re` or lavfi renders as fast as it can instead of in real time.
+        return ['-re', '-f', 'lavfi', '-i', 'testsrc=size={w}x{h}:rate={fps}'.format_map(settings)]
+
+
+# In order of preference.
+BACKENDS = {
+    backend.name: backend for backend in (GdiGrab(), X11Grab(), KmsGrab(), TestSource())
+}
+
+
+def pick(name=''):
+    # type: (str) -> Backend | None
+    """Get the backend by name or the first available one. None if there is none."""
+    if name:
+        if name in BACKENDS:
+            return BACKENDS[name]
+        log.warning('No video backend "%s"! Picking one.', name)
+    for backend in BACKENDS.values():
+        if backend.automatic and backend.available():
+            return backend
+    log.warning('No video backend available to capture the screen with!')
+    return None
+
+
+def tool_name():
+    return 'ffmpeg.exe' if sys.platform == 'win32' else 'ffmpeg'
+
+
+def version(ffmpeg):
+    # type: (str) -> tuple[int, int] | None
+    """(major, minor) of the ffmpeg. None if it doesn't tell, as for git builds."""
+    try:
+        output = _run([ffmpeg, '-version'], VERSION_TIMEOUT).decode(errors='replace')
+    except (OSError, subprocess.TimeoutExpired) as error:
+        log.warning('Asking %s for its version failed: %s', ffmpeg, error)
+        return None
+    match = re.search(r'version\s+n?(\d+)\.(\d+)', output)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def probe(ffmpeg, backend, width, height, fps, seconds=PROBE_SECONDS, cancelled=None):
+    # type: (str, Backend, int, int, int, float, Callable[[], bool] | None) -> float
+    """
+    Grab for some seconds without encoding. Returns the frame rate ffmpeg kept up.
+    Raises `Cancelled` as soon as `cancelled` is True.
+    """
+    settings = {'x': 0, 'y': 0, 'w': width, 'h': height, 'fps': fps, 'pointer': 0}
+    args = [ffmpeg, '-hide_banner', '-loglevel', 'error'] + PROGRESS_ARGS
+    args += backend.args(settings)
+    args += ['-t', str(seconds), '-f', 'null', '-']
+    try:
+        output = _run(args, seconds * 5 + 5, cancelled).decode(errors='replace')
+    except (OSError, subprocess.TimeoutExpired) as error:
+        log.warning('Probing %s failed: %s', backend.name, error)
+        return 0.0
+
+    # The last block counts.
+    progress = {}
+    for progress in parse_progress(output.splitlines()):
+        pass
+    frames = progress.get('frame') or 0
+    speed = progress.get('speed') or 0.0
+    # Live grabbers drop frames when behind, lavfi falls behind real time instead.
+    return frames / seconds * min(speed, 1.0)
+
+
+def parse_progress(lines):
+    # type: (Iterable[str | bytes]) -> Iterator[dict]
+    """
+    Turn ffmpeg `-progress` output into a dict per block, as soon as a block is complete.
+    Values are converted by `PROGRESS_KEYS`, 'N/A' becomes None. `ended` is True for the last.
+    """
+    block = {}
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(errors='replace')
+        key, _, value = line.strip().partition('=')
+        if key == 'progress':
+            block['ended'] = value == 'end'
+            yield block
+            block = {}
+        elif key in PROGRESS_KEYS:
+            block[key] = _progress_value(value, *PROGRESS_KEYS[key])
+
+
+def _progress_value(value, convert, suffix):
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return convert(value)
+    except ValueError:
+        return None
+
+
+def probe_limits(ffmpeg, backend, width, height, cancelled=None):
+    # type: (str, Backend, int, int, Callable[[], bool] | None) -> list[Limit]
+    """
+    Find the highest frame rate sustained at the full and at half the given size.
+    A `fps` of 0 means not even the slowest rate in `PROBE_FPS` worked.
+    Raises `Cancelled` as soon as `cancelled` is True.
+    """
+    limits = []
+    for w, h in ((width, height), (width // 2, height // 2)):
+        # Most encoders want even sizes.
+        w, h = w - w % 2, h - h % 2
+        best = 0
+        for fps in PROBE_FPS:
+            if probe(ffmpeg, backend, w, h, fps, cancelled=cancelled) >= fps * SUSTAIN_RATIO:
+                best = fps
+                break
+        log.info('%s sustains %i fps at %ix%i', backend.name, best, w, h)
+        limits.append(Limit(w, h, best))
+    return limits
+
+
+def calibrate_encoder(ffmpeg, quality, cancelled=None):
+    # type: (str, int, Callable[[], bool] | None) -> list[EncoderSpeed]
+    """
+    Time x264 encoding a moving test pattern as fast as it can, once per preset.
+    Empty if there's no libx264. Raises `Cancelled` as soon as `cancelled` is True.
+    """
+    width, height = CALIBRATION_SIZE
+    speeds = []
+    for preset in PRESETS:
+        args = [ffmpeg, '-hide_banner', '-loglevel', 'error']
+        args += ['-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=30']
+        args += ['-frames:v', str(CALIBRATION_FRAMES), '-c:v', 'libx264', '-preset', preset]
+        args += ['-pix_fmt', 'yuv420p', '-b:v', f'{quality}k', '-f', 'null', '-']
+        t0 = time.perf_counter()
+        try:
+            _run(args, CALIBRATION_TIMEOUT, cancelled, check=True)
+        except (OSError, subprocess.SubprocessError) as error:
+            log.warning('Calibrating x264 preset %s failed: %s', preset, error)
+            return []
+        # Including ffmpeg starting up. Rather too slow than too fast.
+        fps = CALIBRATION_FRAMES / (time.perf_counter() - t0)
+        log.info('x264 preset %s encodes %.1f fps at %ix%i', preset, fps, width, height)
+        speeds.append(EncoderSpeed(preset, int(fps * width * height)))
+    return speeds
+
+
+def pick_preset(speeds, width, height, fps):
+    # type: (list[EncoderSpeed], int, int, int) -> tuple[str, float]
+    """
+    The best compressing preset that encodes the region `ENCODER_HEADROOM` times
+    faster than `fps` and its headroom. The fastest one if none does.
+    ('', 0.0) if not calibrated or there's nothing to encode.
+    """
+    needed = width * height * fps
+    if not speeds or needed <= 0:
+        return '', 0.0
+    for speed in speeds:
+        headroom = speed.pixels_per_second / needed
+        if headroom >= ENCODER_HEADROOM:
+            return speed.preset, headroom
+    fastest = max(speeds, key=lambda speed: speed.pixels_per_second)
+    return fastest.preset, fastest.pixels_per_second / needed
+
+
+def max_fps(limits, width, height):
+    # type: (list[Limit], int, int) -> int
+    """Highest sustained frame rate for a region. 0 if unknown."""
+    if not limits:
+        return 0
+    fitting = [limit for limit in limits if limit.width >= width and limit.height >= height]
+    if not fitting:
+        # Bigger than anything probed. Best guess is the biggest one.
+        return max(limits, key=_area).fps
+    return min(fitting, key=_area).fps
+
+
+def _area(limit):
+    return limit.width * limit.height
+
+
+def _run(args, timeout, cancelled=None, check=False):
+    # type: (list[str], float, Callable[[], bool] | None, bool) -> bytes
+    """
+    Run ffmpeg to the end and return its stdout. Killed after `timeout` seconds
+    or as soon as `cancelled` is True, raising `TimeoutExpired` or `Cancelled`.
+    """
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        **hidden_window(),
+    )
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            output, _ = process.communicate(timeout=CANCEL_POLL_INTERVAL)
+            break
+        except subprocess.TimeoutExpired:
+            stop = cancelled is not None and cancelled()
+            if not stop and time.perf_counter() < deadline:
+                continue
+            process.kill()
+            process.communicate()
+            if stop:
+                raise Cancelled(args[0])
+            raise subprocess.TimeoutExpired(args, timeout)
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+    return output
+
+
+def hidden_window():
+    """Popen keyword arguments to not flash a console window on Windows."""
+    if sys.platform != 'win32':
+        return {}
+    nfo = subprocess.STARTUPINFO()
+    nfo.wShowWindow = subprocess.SW_HIDE
+    nfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {'startupinfo': nfo}
@@ -1,31 +1,98 @@
 import os
+import sys
+import math
 import time
 import ctypes
+import shutil
+import queue
+import collections
+import signal
+import threading
 import traceback
+import subprocess
 from pyside import QtCore, QtWidgets
 
+import anim_export
 import common
 import image_stub
+import screens
+import tracing
+import video_backends
 import widgets
 
+log = common.get_logger(f'{common.NAME}.video_man')
 IMG = image_stub.IMG
-ARGS = '-f gdigrab -draw_mouse {pointer} -framerate {fps} -offset_x {x} -offset_y {y} -video_size {w}x{h} -show_region 0 -i desktop -b:v {quality}k'
-WMIC_TMP = 'wmic.exe process where {} get Name,ProcessID'
-WMIC_PID = 'ProcessID={}'
-WMIC_NAME = 'Name="{}"'
-TOOL_NAME = 'ffmpeg.exe'
+# yuv420p so any player can show it. Needs even sizes.
+OUTPUT_ARGS = '-pix_fmt yuv420p -b:v {quality}k'
+TOOL_NAME = video_backends.tool_name()
+# Milliseconds ffmpeg gets to finish the file after being asked to stop.
+STOP_TIMEOUT = 5000
+# Let ffmpeg grab the screen itself or grab frames here and pipe them over.
+ENGINE_FFMPEG = 'ffmpeg'
+ENGINE_FRAMES = 'frames'
+# Frames waiting for the encoder before grabbing waits and then drops.
+FRAME_QUEUE_SIZE = 8
+# Grabbed frames waiting for the pipe thread. More are dropped right on the GUI thread.
+GRAB_QUEUE_SIZE = 2
+# Seconds between checking the frame writer is still there while waiting for room.
+WRITER_POLL_INTERVAL = 0.1
+# Seconds between the frame engine updating its counters.
+PROGRESS_INTERVAL = 1.0
+# Seconds between logging the live telemetry.
+TELEMETRY_LOG_INTERVAL = 5.0
+# Seconds to measure the current pace over. ffmpeg only gives averages since
+# the start, thrown off by the encoder holding back the first frames.
+PACE_WINDOW = 3.0
+# Encode every frame at the set rate or only when something changed.
+VIDEO_FIXED = 'fixed'
+VIDEO_VFR = 'vfr'
+# With ffmpeg grabbing it has to drop the duplicates itself.
+VFR_FILTER = 'mpdecimate'
+VFR_OUTPUT_ARGS = ['-fps_mode', 'vfr']
+# -fps_mode came with ffmpeg 5.1. Before that it's only the older name.
+FPS_MODE_VERSION = (5, 1)
+VFR_OUTPUT_ARGS_LEGACY = ['-vsync', 'vfr']
+# Seconds after which an unchanged frame is sent anyway. Keeps seeking sane.
+VFR_KEEPALIVE = 2.0
+# Instant replay keeps recording into a ring of short segments.
+REPLAY_SEGMENT_SECONDS = 2
+# x264 preset for the replay when the encoder isn't calibrated.
+REPLAY_PRESET = 'veryfast'
+REPLAY_ARGS = (
+    '-c:v libx264 -preset {preset} -pix_fmt yuv420p -b:v {quality}k '
+    '-force_key_frames expr:gte(t,n_forced*{segment}) -f segment -segment_format matroska '
+    '-segment_time {segment} -segment_wrap {wrap} -reset_timestamps 1'
+)
+REPLAY_PATTERN = 'replay%03d.mkv'
+# Seconds between replay buffer reports.
+REPLAY_REPORT_INTERVAL = 10.0
 SETTINGS = common.SETTINGS
 
 
 class VideoMan(QtCore.QObject):
     video_found = QtCore.Signal()
     capture_stopped = QtCore.Signal()
+    limits_found = QtCore.Signal(list)
+    animation_saved = QtCore.Signal(str)
+    replay_saved = QtCore.Signal(str)
+    # Live telemetry of the running capture. See `_CaptureThread.telemetry`.
+    progress = QtCore.Signal(dict)
 
     def __init__(self, parent):
         super().__init__(parent)
         self.path = ''
+        # (major, minor) of the ffmpeg at `path`. None if unknown.
+        self.version = None  # type: tuple[int, int] | None
         self.capturing = False
         self.thread = None  # type: _CaptureThread | None
+        self.backend = video_backends.pick(SETTINGS.video_backend)
+        self.limits = []  # type: list[video_backends.Limit]
+        # Settings of the latest capture. Its file can be turned into an animation.
+        self.last_capture = None  # type: dict | None
+        self.replay = None  # type: _ReplayThread | None
+        # Probing & calibrating in the background, stopped on shutdown.
+        self.prober = None  # type: _LimitsProber | None
+        self.calibrator = None  # type: _EncoderCalibrator | None
         QtCore.QTimer(self).singleShot(500, self._find_ffmpeg)
 
     def _find_ffmpeg(self):
@@ -34,17 +101,142 @@ class VideoMan(QtCore.QObject):
         thread.finished.connect(thread.deleteLater)
         thread.start()
 
-    def _ffmpeg_found(self, path: str):
+    def _ffmpeg_found(self, path, version):
+        # type: (str, tuple[int, int] | None) -> None
         if '\n' in path:
             path = path.split('\n')[0].strip()
 
         if not os.path.isfile(path):
             return
         self.path = path
+        self.version = version
+        if SETTINGS.video_engine == ENGINE_FRAMES:
+            log.debug('found %s, piping frames into it', path)
+        elif self.backend is None:
+            log.warning('Found %s but nothing for it to capture the screen with!', path)
+            return
+        else:
+            log.debug('found %s, capturing via %s', path, self.backend.name)
         self.video_found.emit()
 
-    def capture(self, rect):
-        # type: (QtCore.QRectF | QtCore.QRect) -> None
+    def probe_limits(self, width, height):
+        """
+        Find what the backend sustains at the given desktop size.
+        Taken from the settings if probed before, else probed in the background.
+        """
+        if self.backend is None:
+            # Only piping frames. Nothing to probe.
+            self._set_limits([])
+            return
+        cached = [
+            video_backends.Limit(*limit[1:])
+            for limit in SETTINGS.video_limits
+            if limit[0] == self.backend.name
+        ]
+        if cached and cached[0][:2] == (width - width % 2, height - height % 2):
+            self._set_limits(cached)
+            return
+        if not self.path or self.prober is not None:
+            return
+        self.prober = _LimitsProber(self, self.path, self.backend, width, height)
+        self.prober.found.connect(self._limits_probed)
+        self.prober.finished.connect(self._prober_finished)
+        self.prober.start()
+
+    def _prober_finished(self):
+        self.prober.deleteLater()
+        self.prober = None
+
+    def _limits_probed(self, limits):
+        others = [limit for limit in SETTINGS.video_limits if limit[0] != self.backend.name]
+        SETTINGS.video_limits = others + [[self.backend.name, *limit] for limit in limits]
+        SETTINGS._save()
+        self._set_limits([video_backends.Limit(*limit) for limit in limits])
+
+    def _set_limits(self, limits):
+        self.limits = limits
+        self.limits_found.emit(limits)
+        # After probing so they don't compete for the CPU.
+        self.calibrate_encoder()
+
+    def calibrate_encoder(self):
+        """
+        Find how fast x264 encodes here at the current quality.
+        Nothing to do if that was done before.
+        """
+        if self.encoder_speeds(SETTINGS.video_quality):
+            return
+        if not self.path or self.calibrator is not None:
+            return
+        self.calibrator = _EncoderCalibrator(self, self.path, SETTINGS.video_quality)
+        self.calibrator.found.connect(self._encoder_calibrated)
+        self.calibrator.finished.connect(self._calibrator_finished)
+        self.calibrator.start()
+
+    def _calibrator_finished(self):
+        self.calibrator.deleteLater()
+        self.calibrator = None
+
+    def _encoder_calibrated(self, speeds):
+        if not speeds:
+            return
+        quality = speeds[0][0]
+        # Rows without quality are from before it was kept. Dropped.
+        others = [
+            speed for speed in SETTINGS.encoder_speeds if len(speed) == 3 and speed[0] != quality
+        ]
+        SETTINGS.encoder_speeds = others + speeds
+        SETTINGS._save()
+
+    def encoder_speeds(self, quality):
+        # type: (int) -> list[video_backends.EncoderSpeed]
+        """How fast the x264 presets encode at `quality`. Empty if not calibrated."""
+        return [
+            video_backends.EncoderSpeed(*speed[1:])
+            for speed in SETTINGS.encoder_speeds
+            if speed[0] == quality
+        ]
+
+    def _pick_preset(self, width, height, fps):
+        """x264 preset to sustain `fps` for the region. Empty if not calibrated."""
+        speeds = self.encoder_speeds(SETTINGS.video_quality)
+        preset, headroom = video_backends.pick_preset(speeds, width, height, fps)
+        if not preset:
+            return ''
+        if headroom < video_backends.ENCODER_HEADROOM:
+            log.warning(
+                'Even x264 preset %s only has %.1fx headroom for %ix%i at %i fps!',
+                preset,
+                headroom,
+                width,
+                height,
+                fps,
+            )
+        else:
+            log.info(
+                'encoding %ix%i at %i fps with x264 preset %s, %.1fx headroom',
+                width,
+                height,
+                fps,
+                preset,
+                headroom,
+            )
+        return preset
+
+    def _vfr_output_args(self):
+        # Unknown versions are git builds, new enough.
+        if self.version is not None and self.version < FPS_MODE_VERSION:
+            return VFR_OUTPUT_ARGS_LEGACY
+        return VFR_OUTPUT_ARGS
+
+    def max_fps(self, width, height):
+        """Highest frame rate the backend sustains for a region. 0 if unknown."""
+        return video_backends.max_fps(self.limits, width, height)
+
+    @tracing.traced()
+    def capture(self, desktop, scene_rect):
+        # type: (screens.Desktop, QtCore.QRectF) -> None
+        """Start recording a scene rectangle of the desktop."""
         import uuid
 
         os.makedirs(common.TMP_PATH, exist_ok=True)
@@ -52,28 +244,194 @@ class VideoMan(QtCore.QObject):
         if os.path.isfile(out_file):
             os.unlink(out_file)
 
-        capture_settings = {
+        engine = SETTINGS.video_engine
+        if engine != ENGINE_FRAMES and self.backend is None:
+            log.error('No video backend to capture the screen with!')
+            return
+        capture_settings = self._grab_settings(desktop, scene_rect, engine != ENGINE_FRAMES)
+        if not capture_settings['w'] or not capture_settings['h']:
+            log.warning('Nothing to capture in a %(w)ix%(h)i region!', capture_settings)
+            return
+        capture_settings['vfr'] = SETTINGS.video_mode == VIDEO_VFR
+        capture_settings['out_path'] = out_file
+        width, height, fps = capture_settings['w'], capture_settings['h'], capture_settings['fps']
+        vfr = capture_settings['vfr']
+        capture_settings['preset'] = self._pick_preset(width, height, fps)
+        arglist = [self.path] + video_backends.PROGRESS_ARGS
+        if engine == ENGINE_FRAMES:
+            arglist.extend(_rawvideo_args(width, height, fps, vfr))
+        else:
+            arglist.extend(self.backend.args(capture_settings, [VFR_FILTER] if vfr else []))
+        if capture_settings['preset']:
+            arglist.extend(['-c:v', 'libx264', '-preset', capture_settings['preset']])
+        arglist.extend(OUTPUT_ARGS.format_map(capture_settings).split())
+        if vfr:
+            arglist.extend(self._vfr_output_args())
+        arglist.append(out_file)
+
+        self.capturing = True
+        self.last_capture = capture_settings
+        if engine == ENGINE_FRAMES:
+            source = screens.FrameSource(desktop, scene_rect, QtCore.QSize(width, height))
+            self.thread = _FramePipeThread(self, arglist, capture_settings, source)
+        else:
+            self.thread = _CaptureThread(self, arglist, capture_settings)
+        self.thread.stopped.connect(self.on_stopped)
+        self.thread.progress.connect(self.progress.emit)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.start()
+
+    def _grab_settings(self, desktop, scene_rect, limited=True):
+        """Native rectangle, frame rate & quality to grab with."""
+        rect = desktop.to_native(scene_rect)
+        # Most encoders only take even sizes.
+        width, height = rect.width() - rect.width() % 2, rect.height() - rect.height() % 2
+        fps = SETTINGS.video_fps
+        sustained = self.max_fps(width, height) if limited else 0
+        if sustained and fps > sustained:
+            log.warning(
+                '%s only keeps up with %i fps at %ix%i! Capturing with that instead of %i.',
+                self.backend.name,
+                sustained,
+                width,
+                height,
+                fps,
+            )
+            fps = sustained
+
+        return {
             'x': rect.x(),
             'y': rect.y(),
-            'w': rect.width(),
-            'h': rect.height(),
-            'fps': SETTINGS.video_fps,
+            'w': width,
+            'h': height,
+            'fps': fps,
             'quality': SETTINGS.video_quality,
             'pointer': int(SETTINGS.draw_pointer),
-            'out_path': out_file,
         }
 
-        self.capturing = True
-        self.thread = _CaptureThread(self, self.path, capture_settings)
-        self.thread.stopped.connect(self.on_stopped)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.thread.start()
+    def start_replay(self, desktop, scene_rect):
+        # type: (screens.Desktop, QtCore.QRectF) -> None
+        """
+        Keep recording a rectangle into a ring of segments to `save_replay` from.
+        Holds about `SETTINGS.replay_seconds` but never more than the quota.
+        """
+        if self.replay is not None or not self.path or self.backend is None:
+            return
+        segment_dir = _replay_dir()
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        os.makedirs(segment_dir, exist_ok=True)
+
+        settings = self._grab_settings(desktop, scene_rect)
+        if not settings['w'] or not settings['h']:
+            log.warning('Nothing to replay in a %(w)ix%(h)i region!', settings)
+            return
+        settings['preset'] = (
+            self._pick_preset(settings['w'], settings['h'], settings['fps']) or REPLAY_PRESET
+        )
+        settings['segment'] = REPLAY_SEGMENT_SECONDS
+        # One extra for the segment being written and one being read on save.
+        settings['wrap'] = math.ceil(SETTINGS.replay_seconds / REPLAY_SEGMENT_SECONDS) + 2
+        settings['out_path'] = os.path.join(segment_dir, REPLAY_PATTERN)
+        arglist = [self.path] + video_backends.PROGRESS_ARGS
+        arglist.extend(self.backend.args(settings))
+        arglist.extend(REPLAY_ARGS.format_map(settings).split())
+        arglist.append(settings['out_path'])
+
+        self.replay = _ReplayThread(self, arglist, settings, segment_dir)
+        self.replay.finished.connect(self._replay_finished)
+        self.replay.start()
+        log.info(
+            'replaying %ix%i at %i fps into "%s"',
+            settings['w'],
+            settings['h'],
+            settings['fps'],
+            segment_dir,
+        )
+
+    def stop_replay(self):
+        if self.replay is not None:
+            self.replay.requestInterruption()
+
+    def _replay_finished(self):
+        self.replay.deleteLater()
+        self.replay = None
+
+    def save_replay(self, file_path='', seconds=0):
+        """
+        Write the last `seconds` (default `SETTINGS.replay_seconds`) of the replay
+        buffer to a file. Finished segments are just concatenated, not encoded again.
+        So it ends up to one segment before now.
+        """
+        if self.replay is None:
+            log.warning('No replay running to save from!')
+            return
+        if not file_path:
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            folder = SETTINGS.last_save_path or common.TMP_PATH
+            file_path = os.path.join(folder, f'{common.NAME}_replay_{stamp}.mp4')
+        count = math.ceil((seconds or SETTINGS.replay_seconds) / REPLAY_SEGMENT_SECONDS)
+        # The newest one is still being written.
+        segments = self.replay.segments()[:-1][-count:]
+        if not segments:
+            log.warning('Nothing in the replay buffer yet!')
+            return
+        thread = _ReplaySaver(
+            self, self.path, [path for path, _ in segments], file_path, self.replay.pins
+        )
+        thread.saved.connect(self.replay_saved.emit)
+        thread.finished.connect(thread.deleteLater)
+        thread.start()
+
+    def save_animation(self, file_path='', fmt=None):
+        """
+        Write the latest capture as GIF, APNG or WebP in the background.
+        Format by file suffix if not given. Emits `animation_saved` when done.
+        Without a path it's a GIF named by time next to the last saved screenshot.
+        """
+        if self.capturing or self.last_capture is None or not self.path:
+            log.warning('No finished recording to save as animation!')
+            return
+        if not file_path:
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            folder = SETTINGS.last_save_path or common.TMP_PATH
+            suffix = anim_export.FORMATS[fmt or anim_export.GIF]
+            file_path = os.path.join(folder, f'{common.NAME}_anim_{stamp}.{suffix}')
+        thread = _AnimExporter(self, self.path, self.last_capture, file_path, fmt)
+        thread.saved.connect(self.animation_saved.emit)
+        thread.finished.connect(thread.deleteLater)
+        thread.start()
 
     def stop(self):
         if self.thread is None:
             return
         self.thread.requestInterruption()
 
+    def shutdown(self, timeout):
+        """
+        Stop capturing, replay, probing & calibrating. Wait at most `timeout`
+        milliseconds for all of it.
+        """
+        t0 = time.perf_counter()
+        done = True
+        if self.replay is not None:
+            self.stop_replay()
+            done = self.replay.wait(timeout)
+        for thread in self.prober, self.calibrator:
+            if thread is None:
+                continue
+            thread.requestInterruption()
+            left = max(0, timeout - int((time.perf_counter() - t0) * 1000))
+            done = thread.wait(left) and done
+        timeout = max(0, timeout - int((time.perf_counter() - t0) * 1000))
+        if not self.capturing or self.thread is None:
+            return done
+        self.stop()
+        try:
+            return self.thread.wait(timeout) and done
+        except RuntimeError:
+            # thread object already deleted
+            return done
+
     def on_stopped(self):
         try:
             print('self.thread stopped: %s\n' % self.thread)
@@ -82,113 +440,433 @@ class VideoMan(QtCore.QObject):
             print('KeyboardInterrupt catched!')
             pass
         QtCore.QTimer(self).singleShot(250, self.capture_stopped.emit)
+        # The quality might have changed. Calibrating for it while idle.
+        self.calibrate_encoder()
 
 
 class _CaptureThread(QtCore.QThread):
+    """
+    Run ffmpeg until interrupted. Its `-progress` output is read as it comes
+    into `telemetry` and emitted with `progress`.
+    """
+
     progress = QtCore.Signal(dict)
     stopped = QtCore.Signal()
+    stdin = subprocess.DEVNULL
 
-    def __init__(self, parent, path, settings):
+    def __init__(self, parent, arglist, settings):
         super().__init__(parent)
 
-        self.path = path
+        self.arglist = arglist
         self.settings = settings
-
-        # how to deal with output? Do we need it?
-        # subprocess needs file like objs to pipe to. These also need `.fileno`
-        # so StringIO doesn't do! :/ We could open real files to pipe to:
-        self._strout_file = os.path.join(common.TMP_PATH, '_tmpout.log')
+        # Latest fps, speed, bitrate, sizes & frame counts from ffmpeg. Plus the
+        # `current_fps` & `current_speed`, `behind` if the encoder doesn't keep up
+        # and whatever else the thread counts.
+        self.telemetry = {}  # type: dict
+        # stderr just goes to a file. subprocess needs something with a `.fileno`.
         self._strerr_file = os.path.join(common.TMP_PATH, '_tmperr.log')
 
+    @tracing.traced()
     def run(self):
         # I'd love to use `QProcess` right away but had massive problems so far.
         # process = QtCore.QProcess()
         # process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
-        import subprocess, signal
-
-        arglist = [self.path]
-        arglist.extend(ARGS.format_map(self.settings).split())
-        arglist.append(self.settings['out_path'])
-
-        tmp_stdout_fob = open(self._strout_file, 'w')
         tmp_stderr_fob = open(self._strerr_file, 'w')
 
-        nfo = _hidden_proc_nfo()
-
-        pids_b4 = get_pids(TOOL_NAME)
-        print('pids_b4: %s' % pids_b4)
-
-        devnull = open(os.devnull, 'wb')
         process = subprocess.Popen(
-            arglist,
-            shell=True,
-            # stdin=subprocess.DEVNULL,
-            # stdin=subprocess.PIPE,
-            stdin=devnull,
-            stdout=tmp_stdout_fob,
+            self.arglist,
+            stdin=self.stdin,
+            stdout=subprocess.PIPE,
             stderr=tmp_stderr_fob,
-            startupinfo=nfo,
+            **video_backends.hidden_window(),
         )
-        print(f'running process {process.pid}:{process} ...')
-
-        new_pids = pids_b4 - get_pids(TOOL_NAME)
-        slept = 0
-        while not new_pids:
-            if slept > 1000:
-                raise RuntimeError(f'No new {TOOL_NAME} spawned!')
-            self.msleep(10)
-            pids_now = get_pids(TOOL_NAME)
-            print('pids_now: %s' % pids_now)
-            new_pids = pids_now - pids_b4
-            slept += 10
-
-        print('new_pids: %s' % new_pids)
-        if new_pids:
-            ffmpid = new_pids.pop()
-            print('ffmpid: %s' % ffmpid)
-        else:
-            raise RuntimeError(f'No new {TOOL_NAME} spawned!')
+        log.debug('running %s process %i ...', TOOL_NAME, process.pid)
+        # Has to keep reading or ffmpeg blocks on a full pipe.
+        reader = threading.Thread(
+            target=self._read_progress,
+            args=(process.stdout,),
+            name=f'{common.NAME}_progress_reader',
+        )
+        reader.start()
+        interrupted = self._run(process)
+
+        # sticking around as long as process would be running ...
+        try:
+            process.wait(STOP_TIMEOUT / 1000)
+        except subprocess.TimeoutExpired:
+            log.error('%s did not stop in time! Killing it.', TOOL_NAME)
+            process.kill()
+            process.wait()
+        # ffmpeg exits with 255 when interrupted, even if all went well.
+        if process.returncode and not interrupted:
+            log.warning(
+                '%s exited with %i. See "%s"', TOOL_NAME, process.returncode, self._strerr_file
+            )
+        log.debug('process is gone!')
+
+        reader.join()
+        process.stdout.close()
+        tmp_stderr_fob.close()
+        if self.telemetry:
+            log.info('%s finished: %s', TOOL_NAME, _format_telemetry(self.telemetry))
+        self.stopped.emit()
+
+    def _read_progress(self, stream):
+        fps = self.settings['fps']
+        next_log = time.perf_counter() + TELEMETRY_LOG_INTERVAL
+        samples = collections.deque()
+        for values in video_backends.parse_progress(stream):
+            self.telemetry.update(values)
+            if values['ended']:
+                # Flushing the encoder isn't a pace. The averages sum it up now.
+                self.telemetry.pop('current_fps', None)
+                self.telemetry.pop('current_speed', None)
+            else:
+                self._measure_pace(samples)
+                self._check_pace(fps)
+            self.progress.emit(dict(self.telemetry))
+            now = time.perf_counter()
+            if now >= next_log:
+                next_log = now + TELEMETRY_LOG_INTERVAL
+                log.info('%s: %s', TOOL_NAME, _format_telemetry(self.telemetry))
+
+    def _measure_pace(self, samples):
+        """Frames & video seconds per second over the last `PACE_WINDOW`."""
+        frame = self.telemetry.get('frame')
+        out_time = self.telemetry.get('out_time_us')
+        if not frame or out_time is None:
+            # Nothing out of the encoder yet.
+            return
+        now = time.perf_counter()
+        samples.append((now, frame, out_time))
+        while len(samples) > 2 and now - samples[1][0] >= PACE_WINDOW:
+            samples.popleft()
+        then, then_frame, then_time = samples[0]
+        if now - then < PACE_WINDOW:
+            return
+        self.telemetry['current_fps'] = (frame - then_frame) / (now - then)
+        self.telemetry['current_speed'] = (out_time - then_time) / 1000000 / (now - then)
 
-        while True:
+    def _check_pace(self, fps):
+        """Warn once when the encoder falls behind the frame rate or real time."""
+        speed = self.telemetry.get('current_speed')
+        if speed is None:
+            return
+        behind = speed < video_backends.SUSTAIN_RATIO
+        # With variable frame rate fewer frames are the point.
+        encoded_fps = self.telemetry['current_fps']
+        if not self.settings.get('vfr'):
+            behind = behind or encoded_fps < fps * video_backends.SUSTAIN_RATIO
+        if behind and not self.telemetry.get('behind'):
+            log.warning(
+                '%s falls behind! Encoding %.1f fps at %.2fx speed instead of %i fps.',
+                TOOL_NAME,
+                encoded_fps,
+                speed,
+                fps,
+            )
+        elif not behind and self.telemetry.get('behind'):
+            log.info('%s caught up again.', TOOL_NAME)
+        self.telemetry['behind'] = behind
+
+    def _run(self, process):
+        """Wait for stopping. Return True if ffmpeg was interrupted."""
+        while process.poll() is None:
             if self.isInterruptionRequested():
+                _interrupt(process)
+                return True
+            self.msleep(100)
+        return False
+
+
+class _FramePipeThread(_CaptureThread):
+    """
+    Grab frames on a steady clock and pipe them raw into ffmpeg.
+
+    Grabbing goes through `QPixmap`, so it's done on the GUI thread by a
+    precise timer. The frames are handed over here through a short queue.
+    A writer thread feeds ffmpeg from another bounded queue. When the encoder
+    falls behind a frame waits up to one frame for room, then it's dropped.
+    Ticks the grabbing itself missed count as late. Closing stdin ends the video.
+
+    In variable frame rate mode frames equal to the last one sent are skipped
+    and ffmpeg stamps each frame with the time it arrives.
+    """
+
+    stdin = subprocess.PIPE
+    # ffmpeg is running and frames may come.
+    ready = QtCore.Signal()
+
+    def __init__(self, parent, arglist, settings, source):
+        super().__init__(parent, arglist, settings)
+        self.source = source  # type: screens.FrameSource
+        self.counters = {'grabbed': 0, 'written': 0, 'late': 0, 'dropped': 0, 'static': 0}
+        self._grabbed = queue.Queue(GRAB_QUEUE_SIZE)
+        self._interval = 1.0 / settings['fps']
+        self._next_tick = 0.0
+        # Lives with this object on the GUI thread, not in the one it runs.
+        self._grab_timer = QtCore.QTimer(self)
+        self._grab_timer.setSingleShot(True)
+        self._grab_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._grab_timer.timeout.connect(self._grab_frame)
+        self.ready.connect(self._start_grabbing)
+        self.finished.connect(self._grab_timer.stop)
+
+    def _start_grabbing(self):
+        self._next_tick = time.perf_counter()
+        self._grab_frame()
+
+    def _grab_frame(self):
+        """Grab on the GUI thread and schedule the next one."""
+        if self.isInterruptionRequested() or self.isFinished():
+            return
+        now = time.perf_counter()
+        missed = int((now - self._next_tick) / self._interval)
+        if missed > 0:
+            self.counters['late'] += missed
+            self._next_tick += missed * self._interval
+        self._next_tick += self._interval
+
+        image = self.source.grab()
+        self.counters['grabbed'] += 1
+        try:
+            self._grabbed.put_nowait((now, image))
+        except queue.Full:
+            self.counters['dropped'] += 1
+        wait = self._next_tick - time.perf_counter()
+        self._grab_timer.start(max(0, int(wait * 1000)))
+
+    def _run(self, process):
+        frames = queue.Queue(FRAME_QUEUE_SIZE)
+        writer = threading.Thread(
+            target=self._write, args=(process.stdin, frames), name=f'{common.NAME}_frame_writer'
+        )
+        writer.start()
+        self.ready.emit()
+
+        interval = self._interval
+        vfr = self.settings['vfr']
+        last_image, last_sent, skipped = None, 0.0, False
+        next_report = time.perf_counter() + PROGRESS_INTERVAL
+        while not self.isInterruptionRequested() and writer.is_alive():
+            try:
+                now, image = self._grabbed.get(timeout=WRITER_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if vfr and now - last_sent < VFR_KEEPALIVE and image == last_image:
+                self.counters['static'] += 1
+                skipped = True
+            else:
+                last_image, last_sent, skipped = image, now, False
                 try:
-                    # os.kill(ffmpid, signal.CTRL_C_EVENT)
-                    # thanks https://stackoverflow.com/a/64357453/469322
-                    kernel = ctypes.windll.kernel32
-                    kernel.FreeConsole()
-                    kernel.AttachConsole(ffmpid)
-                    kernel.SetConsoleCtrlHandler(None, 1)
-                    kernel.GenerateConsoleCtrlEvent(0, 0)
-
-                    # process.send_signal(signal.CTRL_C_EVENT)
-                except (OSError, SystemError) as error:
-                    print(
-                        'ERROR sending signal "%s" to process %i:\n%s'
-                        % (signal.CTRL_C_EVENT, ffmpid, error)
-                    )
-                    print(traceback.format_exc().strip())
-
-                self.msleep(100)
-                self.stopped.emit()
-                break
+                    frames.put(image, timeout=interval)
+                except queue.Full:
+                    self.counters['dropped'] += 1
 
-            self.msleep(100)
+            if now >= next_report:
+                next_report = now + PROGRESS_INTERVAL
+                self.telemetry.update(self.counters, queued=frames.qsize())
 
-        # sticking around as long as process would be running ...
-        ffmpids = get_pids(TOOL_NAME) - pids_b4
-        while ffmpids:
-            print('Still running: %s' % ffmpids)
-            self.msleep(200)
-            ffmpids = get_pids(TOOL_NAME) - pids_b4
-        print('process is gone!')
-
-        devnull.close()
-        tmp_stdout_fob.close()
-        tmp_stderr_fob.close()
+        if skipped:
+            # Without this the video would end at the last change.
+            _put_while_alive(frames, last_image, writer)
+        # Let the writer finish what's queued, then EOF makes ffmpeg close the file.
+        _put_while_alive(frames, None, writer)
+        writer.join()
+        log.info(
+            'frames grabbed: %i, written: %i, late: %i, dropped: %i, static: %i',
+            self.counters['grabbed'],
+            self.counters['written'],
+            self.counters['late'],
+            self.counters['dropped'],
+            self.counters['static'],
+        )
+        return False
+
+    def _write(self, stdin, frames):
+        try:
+            while True:
+                image = frames.get()
+                if image is None:
+                    break
+                stdin.write(image.constBits())
+                self.counters['written'] += 1
+        except (BrokenPipeError, OSError) as error:
+            log.error('%s stopped taking frames: %s', TOOL_NAME, error)
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+
+class _ReplayThread(_CaptureThread):
+    """
+    Run the segmenting ffmpeg, keep the ring within quota and report on it.
+    The segments are removed when stopped.
+    """
+
+    def __init__(self, parent, arglist, settings, segment_dir):
+        super().__init__(parent, arglist, settings)
+        self.segment_dir = segment_dir
+        self._strerr_file = os.path.join(common.TMP_PATH, '_replay_err.log')
+        self.evicted = 0
+        self.pins = _SegmentPins()
+
+    def segments(self):
+        """(path, size) of the segments on disk, oldest first."""
+        found = []
+        for entry in os.scandir(self.segment_dir):
+            try:
+                stat = entry.stat()
+            except OSError:
+                # Just wrapped around.
+                continue
+            found.append((stat.st_mtime, entry.path, stat.st_size))
+        return [(path, size) for _, path, size in sorted(found)]
+
+    def _run(self, process):
+        quota = SETTINGS.replay_quota_mb * 1024 * 1024
+        last_cpu, last_time = _cpu_seconds(process.pid), time.perf_counter()
+        next_report = last_time + REPLAY_REPORT_INTERVAL
+        while process.poll() is None:
+            if self.isInterruptionRequested():
+                _interrupt(process)
+                return True
+            self.msleep(500)
+            self._enforce_quota(quota)
+
+            now = time.perf_counter()
+            if now < next_report:
+                continue
+            next_report = now + REPLAY_REPORT_INTERVAL
+            cpu = _cpu_seconds(process.pid)
+            status = self.status()
+            status['cpu'] = None
+            if cpu is not None and last_cpu is not None:
+                status['cpu'] = round(100 * (cpu - last_cpu) / (now - last_time), 1)
+            last_cpu, last_time = cpu, now
+            self.progress.emit(dict(self.telemetry, **status))
+            log.info(
+                'replay buffer: %i segments, %.1f MB, ~%i s, cpu %s%%, %s frames dropped',
+                status['segments'],
+                status['bytes'] / 1024 / 1024,
+                status['seconds'],
+                status['cpu'],
+                self.telemetry.get('drop_frames'),
+            )
+        return False
+
+    def _enforce_quota(self, quota):
+        segments = self.segments()
+        total = sum(size for _, size in segments)
+        # Never the one being written or ones a save still reads.
+        pinned = self.pins.paths()
+        evictable = [(path, size) for path, size in segments[:-1] if path not in pinned]
+        while total > quota and evictable:
+            path, size = evictable.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evicted += 1
+            log.warning('replay buffer over quota! Dropped "%s"', os.path.basename(path))
+
+    def status(self):
+        segments = self.segments()
+        return {
+            'segments': len(segments),
+            'bytes': sum(size for _, size in segments),
+            'seconds': max(0, len(segments) - 1) * REPLAY_SEGMENT_SECONDS,
+            'evicted': self.evicted,
+        }
+
+    def run(self):
+        super().run()
+        # Let a save finish reading first.
+        if not self.pins.wait_empty(STOP_TIMEOUT / 1000):
+            log.warning('Removing replay segments a save still reads!')
+        shutil.rmtree(self.segment_dir, ignore_errors=True)
+
+
+class _SegmentPins:
+    """Replay segments saves are reading. They're kept until unpinned."""
+
+    def __init__(self):
+        self._counts = collections.Counter()
+        self._changed = threading.Condition()
+
+    def pin(self, paths):
+        with self._changed:
+            self._counts.update(paths)
+
+    def unpin(self, paths):
+        with self._changed:
+            self._counts.subtract(paths)
+            self._counts = +self._counts
+            self._changed.notify_all()
+
+    def paths(self):
+        # type: () -> set[str]
+        with self._changed:
+            return set(self._counts)
+
+    def wait_empty(self, timeout):
+        # type: (float) -> bool
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._counts, timeout)
+
+
+class _ReplaySaver(QtCore.QThread):
+    saved = QtCore.Signal(str)
+
+    def __init__(self, parent, path, segments, file_path, pins):
+        # type: (QtCore.QObject, str, list[str], str, _SegmentPins) -> None
+        super().__init__(parent)
+        self.path = path
+        self.segments = segments
+        self.file_path = file_path
+        # Pinned right away. The ring must not drop them before reading starts.
+        self.pins = pins
+        pins.pin(segments)
+
+    @tracing.traced()
+    def run(self):
+        try:
+            self._save()
+        finally:
+            self.pins.unpin(self.segments)
+
+    def _save(self):
+        t0 = time.perf_counter()
+        list_path = os.path.join(common.TMP_PATH, '_replay_concat.txt')
+        with open(list_path, 'w', encoding=common.ENCODING) as file_obj:
+            for path in self.segments:
+                escaped = path.replace("'", "'\\''")
+                file_obj.write(f"file '{escaped}'\n")
+        args = [self.path, '-hide_banner', '-loglevel', 'error', '-y']
+        args += ['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy']
+        args += ['-movflags', '+faststart', self.file_path]
+        try:
+            subprocess.run(
+                args, stdin=subprocess.DEVNULL, check=True, **video_backends.hidden_window()
+            )
+        except (OSError, subprocess.CalledProcessError) as error:
+            log.error('Could not save replay "%s": %s', self.file_path, error)
+            return
+        log.info(
+            'saved replay "%s" from %i segments in %.1f ms',
+            self.file_path,
+            len(self.segments),
+            (time.perf_counter() - t0) * 1000,
+        )
+        self.saved.emit(self.file_path)
 
 
 class _FFMPegFinder(QtCore.QThread):
-    found = QtCore.Signal(str)
+    found = QtCore.Signal(str, object)
 
     def __init__(self, parent):
         super().__init__(parent)
@@ -196,7 +874,77 @@ class _FFMPegFinder(QtCore.QThread):
     def run(self):
         found = _find_ffmpeg()
         if found:
-            self.found.emit(found)
+            self.found.emit(found, video_backends.version(found))
+
+
+class _AnimExporter(QtCore.QThread):
+    saved = QtCore.Signal(str)
+
+    def __init__(self, parent, path, capture, file_path, fmt):
+        super().__init__(parent)
+        self.path = path
+        self.capture = capture
+        self.file_path = file_path
+        self.fmt = fmt
+
+    @tracing.traced()
+    def run(self):
+        # In a process of its own. Its pool workers would import Qt from here.
+        args = anim_export.command(
+            self.path,
+            self.capture['out_path'],
+            self.file_path,
+            (self.capture['w'], self.capture['h']),
+            self.fmt,
+            SETTINGS.anim_quality,
+            self.capture['fps'],
+        )
+        try:
+            subprocess.run(
+                args, stdin=subprocess.DEVNULL, check=True, **video_backends.hidden_window()
+            )
+        except (OSError, subprocess.CalledProcessError) as error:
+            log.error('Could not write "%s": %s', self.file_path, error)
+            return
+        self.saved.emit(self.file_path)
+
+
+class _LimitsProber(QtCore.QThread):
+    found = QtCore.Signal(list)
+
+    def __init__(self, parent, path, backend, width, height):
+        super().__init__(parent)
+        self.path = path
+        self.backend = backend
+        self.width = width
+        self.height = height
+
+    def run(self):
+        try:
+            limits = video_backends.probe_limits(
+                self.path, self.backend, self.width, self.height, self.isInterruptionRequested
+            )
+        except video_backends.Cancelled:
+            return
+        self.found.emit([list(limit) for limit in limits])
+
+
+class _EncoderCalibrator(QtCore.QThread):
+    found = QtCore.Signal(list)
+
+    def __init__(self, parent, path, quality):
+        super().__init__(parent)
+        self.path = path
+        self.quality = quality
+
+    def run(self):
+        try:
+            speeds = video_backends.calibrate_encoder(
+                self.path, self.quality, self.isInterruptionRequested
+            )
+        except video_backends.Cancelled:
+            return
+        self.found.emit([[self.quality, *speed] for speed in speeds])
 
 
 class VideoWidget(QtWidgets.QWidget):
@@ -213,6 +961,9 @@ class VideoWidget(QtWidgets.QWidget):
         self._timer.setInterval(100)
         self.label = QtWidgets.QLabel()
         self.hlayout.addWidget(self.label)
+        self.telemetry_label = QtWidgets.QLabel()
+        self.hlayout.addWidget(self.telemetry_label)
+        videoman.progress.connect(self._set_telemetry)
         widgets._TbBtn(self, IMG.x, self.stop)
         self.setWindowFlags(QtCore.Qt.Window | QtCore.Qt.FramelessWindowHint)
         self._timer.start()
@@ -223,43 +974,101 @@ class VideoWidget(QtWidgets.QWidget):
         self.deleteLater()
 
     def _set_label(self):
-        self.label.setText(str(time.time() - self._t0))
+        minutes, seconds = divmod(time.time() - self._t0, 60)
+        self.label.setText(f'{int(minutes):02}:{seconds:04.1f}')
 
+    def _set_telemetry(self, values):
+        text = _format_telemetry(values)
+        if values.get('behind'):
+            text = f'{text}  falling behind!'
+        self.telemetry_label.setText(text)
 
-def _find_ffmpeg():
-    import subprocess
 
-    nfo = subprocess.STARTUPINFO()
-    nfo.wShowWindow = subprocess.SW_HIDE
-    nfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+def _rawvideo_args(width, height, fps, vfr=False):
+    # QImage.Format_RGB32 is 0xffRRGGBB per pixel in native byte order.
+    pix_fmt = 'bgr0' if sys.byteorder == 'little' else '0rgb'
+    size = f'{width}x{height}'
+    args = f'-f rawvideo -pix_fmt {pix_fmt} -video_size {size} -framerate {fps} -i -'.split()
+    if vfr:
+        # Raw frames carry no time. Skipped ones would just shorten the video.
+        args = ['-use_wallclock_as_timestamps', '1'] + args
+    return args
 
+
+def _put_while_alive(frames, item, writer):
+    # type: (queue.Queue, object, threading.Thread) -> bool
+    """Queue `item` once there's room. False if the writer is gone, nobody would take it."""
+    while writer.is_alive():
+        try:
+            frames.put(item, timeout=WRITER_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _replay_dir():
+    """RAM backed if wanted and there is a tmpfs for it. Else next to the other temp files."""
+    if SETTINGS.replay_in_ram and os.path.isdir('/dev/shm'):
+        return os.path.join('/dev/shm', f'{common.NAME}_replay')
+    return os.path.join(common.TMP_PATH, 'replay')
+
+
+def _cpu_seconds(pid):
+    """CPU time used by a process so far. Only where there's a /proc to ask."""
     try:
-        found = subprocess.check_output(['where', TOOL_NAME], startupinfo=nfo)
-        return found.decode().strip()
-    except subprocess.CalledProcessError:
-        return ''
+        with open(f'/proc/{pid}/stat', encoding=common.ENCODING) as file_obj:
+            fields = file_obj.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # utime & stime, fields 14 & 15 counting the pid as 1.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
 
 
-def _hidden_proc_nfo():
-    import subprocess
+def _format_telemetry(values):
+    # type: (dict) -> str
+    """One line of the interesting `_CaptureThread.telemetry` values."""
+    parts = []
+    # The current pace once there is one, else ffmpeg's averages.
+    fps = values.get('current_fps', values.get('fps'))
+    speed = values.get('current_speed', values.get('speed'))
+    if fps is not None:
+        parts.append(f'{fps:.1f} fps')
+    if speed is not None:
+        parts.append(f'{speed:.2f}x')
+    if values.get('total_size') is not None:
+        parts.append(f'{values["total_size"] / 1024 / 1024:.1f} MB')
+    if values.get('bitrate') is not None:
+        parts.append(f'{values["bitrate"]:.0f} kbit/s')
+    parts.append(f'drop {values.get("drop_frames") or 0}')
+    parts.append(f'dup {values.get("dup_frames") or 0}')
+    if values.get('dropped'):
+        # Frames the frame engine dropped before ffmpeg even saw them.
+        parts.append(f'dropped before encoding {values["dropped"]}')
+    return '  '.join(parts)
 
-    nfo = subprocess.STARTUPINFO()
-    nfo.wShowWindow = subprocess.SW_HIDE
-    nfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    return nfo
 
+def _find_ffmpeg():
+    return shutil.which(TOOL_NAME) or ''
 
-def get_pids(name):
-    import subprocess
 
-    nfo = _hidden_proc_nfo()
-    cmd = WMIC_TMP.format(WMIC_NAME.format(name))
-    pids = set()
-    for line in subprocess.check_output(cmd, startupinfo=nfo).strip().decode().split('\n')[1:]:
-        this_name, pid = line.rstrip().rsplit(' ', 1)
-        if this_name.rstrip() == name and pid.isdigit():
-            pids.add(int(pid))
-    return pids
+def _interrupt(process):
+    """Ask ffmpeg to stop like Ctrl+C would, so it finishes the file properly."""
+    if sys.platform != 'win32':
+        process.send_signal(signal.SIGINT)
+        return
+
+    try:
+        # os.kill(ffmpid, signal.CTRL_C_EVENT)
+        # thanks https://stackoverflow.com/a/64357453/469322
+        kernel = ctypes.windll.kernel32
+        kernel.FreeConsole()
+        kernel.AttachConsole(process.pid)
+        kernel.SetConsoleCtrlHandler(None, 1)
+        kernel.GenerateConsoleCtrlEvent(0, 0)
+    except (OSError, SystemError) as error:
+        log.error('Could not interrupt process %i:\n%s', process.pid, error)
+        log.error(traceback.format_exc().strip())
 
 
 if __name__ == '__main__':
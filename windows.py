@@ -0,0 +1,291 @@
+"""
+Find the top-level window under a point, to snap the rectangle to it.
+
+A provider lists the window rectangles on the desktop, topmost first, in
+native desktop pixels. `pick` finds the first one that works on this system.
+`WindowIndex` answers which window is on top at a point with two bisections.
+No Qt needed, rectangles are `(left, top, right, bottom)` tuples with right &
+bottom exclusive.
+"""
+import sys
+import time
+import bisect
+import ctypes
+from collections import namedtuple
+
+import common
+
+try:
+    from Xlib import X
+    from Xlib import display as xdisplay
+    from Xlib import error as xerror
+except ImportError:
+    xdisplay = None
+
+log = common.get_logger(f'{common.NAME}.windows')
+Window = namedtuple('Window', ['title', 'rect'])
+# Windows API bits for `Win32Provider`.
+DWMWA_EXTENDED_FRAME_BOUNDS = 9
+DWMWA_CLOAKED = 14
+
+
+class Provider:
+    name = ''
+    # `sys.platform` prefixes this provider can work on.
+    platforms = ()
+
+    def available(self):
+        return sys.platform.startswith(self.platforms)
+
+    def windows(self):
+        # type: () -> list[Window]
+        """Visible top-level windows, topmost first."""
+        raise NotImplementedError
+
+
+class X11Provider(Provider):
+    """Asks the window manager for `_NET_CLIENT_LIST_STACKING`. Needs python-xlib."""
+
+    name = 'x11'
+    platforms = ('linux', 'freebsd')
+
+    def available(self):
+        return super().available() and xdisplay is not None
+
+    def windows(self):
+        try:
+            display = xdisplay.Display()
+        except (xerror.DisplayError, OSError) as error:
+            log.warning('No X display to list windows from: %s', error)
+            return []
+        try:
+            return self._list(display)
+        except xerror.XError as error:
+            log.warning('Listing X11 windows failed: %s', error)
+            return []
+        finally:
+            display.close()
+
+    def _list(self, display):
+        root = display.screen().root
+        stacking = _x11_property(display, root, '_NET_CLIENT_LIST_STACKING')
+        if not stacking:
+            return []
+        current = _x11_property(display, root, '_NET_CURRENT_DESKTOP')
+        hidden = display.intern_atom('_NET_WM_STATE_HIDDEN')
+        found = []
+        # Stacking goes bottom to top.
+        for window_id in reversed(stacking):
+            window = display.create_resource_object('window', window_id)
+            try:
+                desktop = _x11_property(display, window, '_NET_WM_DESKTOP')
+                # 0xFFFFFFFF is on all of them.
+                if current and desktop and desktop[0] not in (current[0], 0xFFFFFFFF):
+                    continue
+                if hidden in (_x11_property(display, window, '_NET_WM_STATE') or ()):
+                    continue
+                geometry = window.get_geometry()
+                origin = window.translate_coords(root, 0, 0)
+            except xerror.XError:
+                # Gone in the meantime.
+                continue
+            # Translating gives where root is seen from the window.
+            left, top = -origin.x, -origin.y
+            extents = _x11_property(display, window, '_NET_FRAME_EXTENTS') or (0, 0, 0, 0)
+            rect = (
+                left - extents[0],
+                top - extents[2],
+                left + geometry.width + extents[1],
+                top + geometry.height + extents[3],
+            )
+            found.append(Window(_x11_title(display, window), rect))
+        return found
+
+
+class Win32Provider(Provider):
+    """`EnumWindows` already goes topmost first."""
+
+    name = 'win32'
+    platforms = ('win32',)
+
+    def windows(self):
+        from ctypes import wintypes
+
+        user32 = ctypes.windll.user32
+        dwmapi = ctypes.windll.dwmapi
+        found = []
+
+        def collect(hwnd, _):
+            if not user32.IsWindowVisible(hwnd) or user32.IsIconic(hwnd):
+                return True
+            # Hidden store apps & windows on other virtual desktops are cloaked.
+            cloaked = ctypes.c_int(0)
+            dwmapi.DwmGetWindowAttribute(
+                hwnd, DWMWA_CLOAKED, ctypes.byref(cloaked), ctypes.sizeof(cloaked)
+            )
+            if cloaked.value:
+                return True
+            # Without the invisible resize borders GetWindowRect includes.
+            rect = wintypes.RECT()
+            if dwmapi.DwmGetWindowAttribute(
+                hwnd, DWMWA_EXTENDED_FRAME_BOUNDS, ctypes.byref(rect), ctypes.sizeof(rect)
+            ):
+                user32.GetWindowRect(hwnd, ctypes.byref(rect))
+            if rect.right <= rect.left or rect.bottom <= rect.top:
+                return True
+            length = user32.GetWindowTextLengthW(hwnd)
+            title = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(hwnd, title, length + 1)
+            found.append(Window(title.value, (rect.left, rect.top, rect.right, rect.bottom)))
+            return True
+
+        callback = ctypes.WINFUNCTYPE(ctypes.c_bool, wintypes.HWND, wintypes.LPARAM)(collect)
+        user32.EnumWindows(callback, 0)
+        return found
+
+
+class FakeProvider(Provider):
+    """Hands out given windows. For headless tests & benchmarks, works everywhere."""
+
+    name = 'fake'
+
+    def __init__(self, windows=()):
+        # type: (list[Window] | tuple[Window, ...]) -> None
+        self._windows = list(windows)
+
+    def available(self):
+        return True
+
+    def windows(self):
+        return list(self._windows)
+
+    @classmethod
+    def cascade(cls, count, width, height):
+        # type: (int, int, int) -> FakeProvider
+        """Lots of overlapping windows in a few staggered stacks. Same every time."""
+        windows = []
+        for i in range(count):
+            w, h = width // 3 + (i * 37) % (width // 4), height // 3 + (i * 53) % (height // 4)
+            left = (i * 97) % max(1, width - w)
+            top = (i * 61) % max(1, height - h)
+            windows.append(Window(f'window {i}', (left, top, left + w, top + h)))
+        return cls(windows)
+
+
+# In order of preference.
+PROVIDERS = {
+    provider.name: provider for provider in (Win32Provider(), X11Provider(), FakeProvider())
+}
+
+
+def pick(name=''):
+    # type: (str) -> Provider
+    """Get the provider by name or the first available one."""
+    if name:
+        if name in PROVIDERS:
+            return PROVIDERS[name]
+        log.warning('No window provider "%s"! Picking one.', name)
+    for provider in PROVIDERS.values():
+        if provider.available():
+            return provider
+    return PROVIDERS[FakeProvider.name]
+
+
+class WindowIndex:
+    """
+    Tell the topmost window at a point in O(log n).
+
+    The plane is cut into vertical slabs at every window edge. Within a slab
+    each window covers one span of y. Going topmost first every window claims
+    what's left uncovered of its span. So a slab ends up as sorted, disjoint
+    runs with their owner. A lookup bisects for the slab, then for the run.
+    Neighbouring slabs with the same runs are merged. `build` it ahead of
+    lookups, best off the GUI thread. Otherwise it's built on first lookup.
+    """
+
+    def __init__(self, windows):
+        # type: (list[Window]) -> None
+        self.windows = list(windows)
+        self._xs = None  # type: list[float] | None
+        self._slabs = []  # type: list[tuple[list[float], list[float], list[int]]]
+        self._right = 0.0
+
+    def __len__(self):
+        return len(self.windows)
+
+    def at(self, x, y):
+        # type: (float, float) -> Window | None
+        if self._xs is None:
+            self.build()
+        i = bisect.bisect_right(self._xs, x) - 1
+        if i < 0 or x >= self._right:
+            return None
+        starts, ends, owners = self._slabs[i]
+        j = bisect.bisect_right(starts, y) - 1
+        if j < 0 or y >= ends[j]:
+            return None
+        return self.windows[owners[j]]
+
+    def build(self):
+        t0 = time.perf_counter()
+        # Sweep left to right. Windows start & end being active at their edges.
+        starting, ending = {}, {}
+        for owner, window in enumerate(self.windows):
+            if window.rect[0] >= window.rect[2] or window.rect[1] >= window.rect[3]:
+                continue
+            starting.setdefault(window.rect[0], []).append(owner)
+            ending.setdefault(window.rect[2], []).append(owner)
+        edges = sorted(set(starting) | set(ending))
+        # Owners spanning the current slab. Sorted, so topmost first.
+        active = []
+        self._xs, self._slabs = [], []
+        for left, right in zip(edges, edges[1:]):
+            for owner in ending.get(left, ()):
+                del active[bisect.bisect_left(active, owner)]
+            for owner in starting.get(left, ()):
+                bisect.insort(active, owner)
+            runs = ([], [], [])
+            for owner in active:
+                _claim(runs, self.windows[owner].rect[1], self.windows[owner].rect[3], owner)
+            if self._slabs and self._slabs[-1] == runs:
+                continue
+            self._xs.append(left)
+            self._slabs.append(runs)
+        self._right = edges[-1] if edges else 0.0
+        log.debug(
+            'indexed %i windows in %i slabs in %.1f ms',
+            len(self.windows),
+            len(self._slabs),
+            (time.perf_counter() - t0) * 1000,
+        )
+
+
+def _claim(runs, top, bottom, owner):
+    """Add runs for the parts of top to bottom that aren't taken yet."""
+    starts, ends, owners = runs
+    # First run ending below top. Runs are disjoint so ends are sorted too.
+    i = bisect.bisect_right(ends, top)
+    pos = top
+    while pos < bottom:
+        if i < len(starts) and starts[i] <= pos:
+            pos = max(pos, ends[i])
+            i += 1
+            continue
+        gap_end = min(bottom, starts[i]) if i < len(starts) else bottom
+        starts.insert(i, pos)
+        ends.insert(i, gap_end)
+        owners.insert(i, owner)
+        i += 1
+        pos = gap_end
+
+
+def _x11_property(display, window, name):
+    prop = window.get_full_property(display.intern_atom(name), X.AnyPropertyType)
+    return None if prop is None else prop.value
+
+
+def _x11_title(display, window):
+    title = _x11_property(display, window, '_NET_WM_NAME') or window.get_wm_name() or ''
+    if isinstance(title, bytes):
+        return title.decode(common.ENCODING, errors='replace')
+    return str(title)
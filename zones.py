@@ -0,0 +1,129 @@
+"""
+Resolve overlay hover zones by plain geometry.
+
+The inner rectangle cuts the screen into a 3x3 grid. Which cell a point
+is in just takes two comparisons per axis. Zone and handle rectangles are
+cached until the inner rectangle changes. No Qt needed, rectangles are
+`(left, top, right, bottom)` tuples.
+"""
+from collections import namedtuple
+
+ZONE_X = 'x'
+ZONE_TL, ZONE_T, ZONE_TR = 'tl', 't', 'tr'
+ZONE_L, ZONE_R = 'l', 'r'
+ZONE_BL, ZONE_B, ZONE_BR = 'bl', 'b', 'br'
+ZONE_GRID = (
+    (ZONE_TL, ZONE_T, ZONE_TR),
+    (ZONE_L, ZONE_X, ZONE_R),
+    (ZONE_BL, ZONE_B, ZONE_BR),
+)
+# Cursor keys next to the zone names.
+CURSOR_MOVE = 'move'
+CURSOR_NONE = 'none'
+DEFAULT_HANDLE_WIDTH = 50
+Hit = namedtuple('Hit', ['zone', 'cursor', 'handle'])
+
+
+class ZoneResolver:
+    """
+    Find the zone under a point, the cursor shape to show and whether
+    the point is on the resize handle of that zone.
+
+    :param cursors: Maps zone names and `CURSOR_MOVE`/`CURSOR_NONE`
+        to whatever cursor objects the caller wants back.
+    """
+
+    def __init__(self, cursors=None, handle_width=DEFAULT_HANDLE_WIDTH):
+        self.cursors = cursors or {}
+        self.handle_width = handle_width
+        self._bounds = (0.0, 0.0, 0.0, 0.0)
+        self._rect = (0.0, 0.0, 0.0, 0.0)
+        self._zones = {}
+        self._handles = {}
+        self._last = None  # type: tuple[float, float, Hit] | None
+
+    def set_rect(self, rect, bounds=None):
+        # type: (tuple[float, ...], tuple[float, ...] | None) -> None
+        """
+        Set inner rectangle and optionally screen bounds, both (l, t, r, b).
+        Drops caches if changed.
+        """
+        rect = tuple(rect)
+        bounds = self._bounds if bounds is None else tuple(bounds)
+        if rect == self._rect and bounds == self._bounds:
+            return
+        self._rect = rect
+        self._bounds = bounds
+        self._zones.clear()
+        self._handles.clear()
+        self._last = None
+
+    def zone_at(self, x, y):
+        left, top, right, bottom = self._rect
+        col = 0 if x < left else 2 if x > right else 1
+        row = 0 if y < top else 2 if y > bottom else 1
+        return ZONE_GRID[row][col]
+
+    def zone_rect(self, zone):
+        """Rectangle of a zone cell."""
+        rect = self._zones.get(zone)
+        if rect is None:
+            for row, zone_row in enumerate(ZONE_GRID):
+                if zone in zone_row:
+                    col = zone_row.index(zone)
+                    break
+            else:
+                raise ValueError(f'No zone "{zone}"!')
+            xs = (self._bounds[0], self._rect[0], self._rect[2], self._bounds[2])
+            ys = (self._bounds[1], self._rect[1], self._rect[3], self._bounds[3])
+            rect = (xs[col], ys[row], xs[col + 1], ys[row + 1])
+            self._zones[zone] = rect
+        return rect
+
+    def handle_rect(self, zone):
+        """
+        Resize handle of a side zone: Where the zone meets a band of
+        `handle_width` around the inner rectangle. None for the inner zone.
+        """
+        if zone == ZONE_X:
+            return None
+        if zone not in self._handles:
+            w = self.handle_width
+            left, top, right, bottom = self._rect
+            self._handles[zone] = _intersected(
+                (left - w, top - w, right + w, bottom + w), self.zone_rect(zone)
+            )
+        return self._handles[zone]
+
+    def handle_hit(self, zone, x, y):
+        """Tell if a point is on the resize handle of the given zone."""
+        return _contains(self.handle_rect(zone), x, y)
+
+    def resolve(self, x, y):
+        # type: (float, float) -> Hit
+        if self._last is not None and self._last[0] == x and self._last[1] == y:
+            return self._last[2]
+
+        zone = self.zone_at(x, y)
+        if zone == ZONE_X:
+            hit = Hit(zone, self.cursors.get(CURSOR_MOVE), False)
+        else:
+            on_handle = self.handle_hit(zone, x, y)
+            cursor = self.cursors.get(zone if on_handle else CURSOR_NONE)
+            hit = Hit(zone, cursor, on_handle)
+        self._last = (x, y, hit)
+        return hit
+
+
+def _intersected(a, b):
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    if left >= right or top >= bottom:
+        return None
+    return (left, top, right, bottom)
+
+
+def _contains(rect, x, y):
+    if rect is None:
+        return False
+    return rect[0] <= x <= rect[2] and rect[1] <= y <= rect[3]